@@ -0,0 +1,74 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from spagbol.embedding import AllMiniLMEmbedder
+
+# you can run this benchmark using the following command line call
+# python -m benchmarks.embedding_throughput --rows 2000
+
+
+def _synthetic_sentences(rows: int, seed: int = 0) -> list:
+    """
+    Builds sentences with an Alpaca-like spread of lengths, from a few words to a few hundred.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = ["data", "model", "write", "explain", "the", "a", "summary", "of", "list", "three",
+                  "reasons", "why", "instruction", "answer", "question", "python", "function", "poem"]
+    lengths = np.clip(rng.lognormal(mean=3.0, sigma=0.8, size=rows).astype(int), 3, 300)
+    return [" ".join(rng.choice(vocabulary, size=length)) for length in lengths]
+
+
+def _per_sentence_loop(embedder: AllMiniLMEmbedder, sentences: list) -> np.ndarray:
+    """
+    The previous embed_batch implementation: one tokenizer call and one forward pass per sentence.
+    """
+    embeddings_list = []
+    for sentence in sentences:
+        inputs = embedder._tokenizer([sentence], return_tensors='pt', truncation=True, padding=True)
+        with torch.inference_mode():
+            model_output = embedder._model(**inputs.to(embedder._device)).last_hidden_state
+            embeddings = embedder._mean_pooling(model_output, inputs['attention_mask'])
+            embeddings_list.append(F.normalize(embeddings, p=2, dim=1).cpu().numpy())
+    return np.concatenate(embeddings_list, axis=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares batched and per-sentence embedding throughput")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--max-batch-tokens", type=int, default=8192)
+    args = parser.parse_args()
+
+    sentences = _synthetic_sentences(args.rows)
+    embedder = AllMiniLMEmbedder(max_batch_tokens=args.max_batch_tokens)
+
+    start = time.perf_counter()
+    baseline = _per_sentence_loop(embedder, sentences)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = embedder.embed_batch(sentences)
+    batched_time = time.perf_counter() - start
+
+    print(f"rows: {args.rows}, max_batch_tokens: {args.max_batch_tokens}")
+    print(f"per-sentence loop: {loop_time:.2f}s ({args.rows / loop_time:.1f} sentences/s)")
+    print(f"bucketed batches:  {batched_time:.2f}s ({args.rows / batched_time:.1f} sentences/s)")
+    print(f"speedup: {loop_time / batched_time:.2f}x")
+    print(f"max abs difference: {np.abs(baseline - batched).max():.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+# you can run this benchmark using the following command line call
+# python -m benchmarks.import_time --repeat 5
+
+# Statements whose cost is tracked, every one runs in a fresh interpreter
+STATEMENTS = [
+    "import spagbol",
+    "import spagbol.embedding",
+    "from spagbol.embedding import AllMiniLMEmbedder",
+    "from spagbol.embedding import AllMiniLMEmbedder; AllMiniLMEmbedder()",
+    "from spagbol.reduction import PcaReduction",
+    "from spagbol.clustering import GaussianMixtureClustering",
+    "import spagbol.api.spagbol_api",
+]
+
+# Heavy dependencies that should only be imported when they are needed
+HEAVY_MODULES = ["torch", "transformers", "umap", "sklearn", "datasets", "weaviate"]
+
+
+def _run(statement: str):
+    """
+    Runs the statement in a fresh interpreter, returns its wall time in seconds and loaded heavy modules
+    """
+    probe = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"{statement}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(elapsed, ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules), sep='|')\n"
+    )
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    elapsed, heavy = output.strip().splitlines()[-1].split("|")
+    return float(elapsed), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures import cost of the spagbol packages")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for statement in STATEMENTS:
+        timings, heavy = [], ""
+        for _ in range(args.repeat):
+            elapsed, heavy = _run(statement)
+            timings.append(elapsed)
+        print(f"{statistics.median(timings) * 1000:9.1f} ms  {statement}  [{heavy or 'no heavy modules'}]")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from spagbol.embedding import Embedder, AllMiniLMEmbedder, OnnxMiniLMEmbedder
+from benchmarks.embedding_throughput import _synthetic_sentences
+
+# you can run this benchmark using the following command line call
+# python -m benchmarks.onnx_backend --rows 2000
+
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """
+    Row-wise cosine similarity between embeddings of the same texts produced by two backends
+    """
+    return np.sum(reference * candidate, axis=1) / (np.linalg.norm(reference, axis=1) *
+                                                    np.linalg.norm(candidate, axis=1))
+
+
+def _timed_embed(embedder: Embedder, sentences: list):
+    start = time.perf_counter()
+    embeddings = embedder.embed_batch(sentences)
+    return embeddings, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares quality and speed of the MiniLM embedding backends")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    sentences = _synthetic_sentences(args.rows)
+    reference, reference_time = _timed_embed(AllMiniLMEmbedder(), sentences)
+    print(f"torch fp32:  {reference_time:.2f}s ({args.rows / reference_time:.1f} sentences/s)")
+
+    for name, embedder in [("onnx fp32", OnnxMiniLMEmbedder(threads=args.threads)),
+                           ("onnx int8", OnnxMiniLMEmbedder(quantize=True, threads=args.threads))]:
+        embeddings, elapsed = _timed_embed(embedder, sentences)
+        agreement = cosine_agreement(reference, embeddings)
+        print(f"{name}:   {elapsed:.2f}s ({args.rows / elapsed:.1f} sentences/s, "
+              f"{reference_time / elapsed:.2f}x), cosine agreement min {agreement.min():.4f} "
+              f"mean {agreement.mean():.4f} p01 {np.percentile(agreement, 1):.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.datasets import make_blobs
+from sklearn.manifold import trustworthiness
+
+from spagbol.reduction import UmapReduction
+
+# you can run this benchmark using the following command line call
+# python -m benchmarks.umap_landmarks --rows 50000 --sample-sizes 5000 10000
+
+
+def layout_quality(data: np.ndarray, reduced_data: np.ndarray, rows: int = 2000, seed: int = 0) -> float:
+    """
+    Trustworthiness of the layout on a random subsample, 1.0 means local neighbourhoods are fully preserved
+    """
+    subsample = np.random.default_rng(seed).choice(len(data), min(rows, len(data)), replace=False)
+    return trustworthiness(data[subsample], reduced_data[subsample], n_neighbors=10)
+
+
+def _timed_fit(reducer: UmapReduction, data: np.ndarray):
+    start = time.perf_counter()
+    reduced_data = reducer.fit_transform(data)
+    return reduced_data, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares full and landmark UMAP fits on synthetic embeddings")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--sample-sizes", type=int, nargs="+", default=[5000, 10000])
+    parser.add_argument("--skip-full", action="store_true", help="Only run the landmark fits")
+    args = parser.parse_args()
+
+    data, _ = make_blobs(n_samples=args.rows, n_features=args.dim, centers=50, cluster_std=4.0, random_state=0)
+    data = data.astype(np.float32)
+
+    if not args.skip_full:
+        reduced_data, elapsed = _timed_fit(UmapReduction(random_state=0), data)
+        print(f"full fit:            {elapsed:7.1f}s, trustworthiness {layout_quality(data, reduced_data):.4f}")
+
+    for sample_size in args.sample_sizes:
+        for sampling in UmapReduction.SAMPLING_METHODS:
+            reducer = UmapReduction(sample_size=sample_size, sampling=sampling, random_state=0)
+            reduced_data, elapsed = _timed_fit(reducer, data)
+            print(f"{sampling:10s} {sample_size:7d}: {elapsed:7.1f}s, "
+                  f"trustworthiness {layout_quality(data, reduced_data):.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import logging
+import time
+
+from injector import Injector
+
+from spagbol import Spagbol
+from spagbol.api.modules import AppModule
+from spagbol.controllers.spagbol_controller import SpagbolController
+from spagbol.loading import SourceCache
+
+# Headless entry point, e.g.
+#   python -m spagbol prepare tatsu-lab/alpaca /data/alpaca-workspace
+#   python -m spagbol open /data/alpaca-workspace
+#   python -m spagbol --source-cache /var/cache/spagbol invalidate-source-cache /data/alpaca.json
+
+
+def _controller(source=None, source_cache_dir=None) -> SpagbolController:
+    return SpagbolController(Injector([AppModule(source=source, source_cache_dir=source_cache_dir)]).get(Spagbol))
+
+
+def prepare(args):
+    controller = _controller(args.source, args.source_cache)
+    controller.load_and_prepare_data(args.source)
+    manifest = controller.save_workspace(args.workspace)
+    print(json.dumps(manifest, indent=2))
+
+
+def open_workspace(args):
+    controller = _controller()
+    started = time.perf_counter()
+    manifest = controller.open_workspace(args.workspace)
+    print(f"Opened {manifest['rows']} rows in {time.perf_counter() - started:.2f}s, "
+          f"fingerprint {manifest['fingerprint']}")
+    print(controller.spagbol.dataset.head())
+
+
+def invalidate_source_cache(args):
+    if args.source_cache is None:
+        raise SystemExit("--source-cache is required for invalidate-source-cache")
+    SourceCache(args.source_cache).invalidate(args.source)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m spagbol", description="Headless Spagbol workspace tools")
+    parser.add_argument("--debug", action="store_true")
+    parser.add_argument("--source-cache", help="Directory of the cache of parsed and converted datasets")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    prepare_parser = commands.add_parser("prepare", help="Load, embed and reduce a dataset and save a workspace")
+    prepare_parser.add_argument("source", help="URL, path or Huggingface Hub name of the dataset")
+    prepare_parser.add_argument("workspace", help="Workspace directory")
+    prepare_parser.set_defaults(handler=prepare)
+
+    open_parser = commands.add_parser("open", help="Open a workspace and print a summary")
+    open_parser.add_argument("workspace", help="Workspace directory")
+    open_parser.set_defaults(handler=open_workspace)
+
+    invalidate_parser = commands.add_parser("invalidate-source-cache",
+                                            help="Remove cached datasets of a source, or of every source")
+    invalidate_parser.add_argument("source", nargs="?", help="Source to invalidate, everything when omitted")
+    invalidate_parser.set_defaults(handler=invalidate_source_cache)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+from importlib import import_module
+from types import ModuleType
+from typing import Dict
+
+
+class _LazyPackage(ModuleType):
+    """
+    Package module that imports the submodule behind an export on first attribute access.
+    Submodules are named after the class they export, so whenever the import system binds a submodule to the
+    package, the class is bound instead, the same way an eager `from .X import X` in __init__ would.
+    """
+
+    def __getattr__(self, name):
+        exports = self.__dict__.get("_lazy_exports", {})
+        if name not in exports:
+            raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+        value = getattr(import_module(f"{self.__name__}.{exports[name]}"), name)
+        setattr(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        if isinstance(value, ModuleType) and name in self.__dict__.get("_lazy_exports", {}):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(self.__dict__.get("_lazy_exports", {})))
+
+
+def install_lazy_exports(package_name: str, exports: Dict[str, str]):
+    """
+    Makes the exports of a package lazy. Has to be called at the end of the package __init__.
+
+    :param package_name: __name__ of the package
+    :param exports: Mapping of exported name to the submodule that defines it
+    """
+    package = sys.modules[package_name]
+    package.__class__ = _LazyPackage
+    package._lazy_exports = dict(exports)
+    package.__all__ = sorted(set(getattr(package, "__all__", [])) | set(exports))
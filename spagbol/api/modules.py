@@ -1,33 +1,85 @@
+from functools import lru_cache
+
 from injector import Module, provider, singleton
-from spagbol.loading import DataLoader, AlpacaLoader
-from spagbol.embedding import Embedder, AllMiniLMEmbedder
-from spagbol.clustering import ClusteringModel, GaussianMixtureClustering
-from spagbol.reduction import DimensionalityReduction, PcaReduction
+from spagbol.loading import DataLoader, AlpacaLoader, SourceCache
+import spagbol.embedding as embedding
+from spagbol.embedding import Embedder
+from spagbol.clustering import ClusteringModel, GaussianMixtureClustering, CachedClustering
+from spagbol.reduction import DimensionalityReduction, PcaReduction, CachedReduction
+from spagbol.storage import ResultCache
 from spagbol import Spagbol
 
 
+# Embedder class names and constructor arguments for every supported embedding backend
+EMBEDDING_BACKENDS = {
+    "torch": ("AllMiniLMEmbedder", {}),
+    "onnx": ("OnnxMiniLMEmbedder", {}),
+    "onnx-int8": ("OnnxMiniLMEmbedder", {"quantize": True}),
+}
+
+
+@lru_cache(maxsize=None)
+def create_embedder(embedding_cache_dir=None, embedding_workers=None, embedding_backend="torch",
+                    embedding_coalesce_ms=None) -> Embedder:
+    """
+    Builds the embedder stack: the embedding_backend model, run in a MultiprocessEmbedder pool when more than
+    one worker is requested, wrapped by a CachedEmbedder when a cache directory is set,
+    so only cache misses reach the model. With embedding_coalesce_ms set, concurrent single-text
+    embed calls are coalesced into batches in front of all of it.
+    The stack is built once per combination of settings and shared, so models are loaded (or warmed up) once.
+    """
+    embedder_class_name, embedder_kwargs = EMBEDDING_BACKENDS[embedding_backend]
+    embedder_class = getattr(embedding, embedder_class_name)
+    if embedding_workers is not None and embedding_workers > 1:
+        embedder = embedding.MultiprocessEmbedder(embedder_class, embedder_kwargs, workers=embedding_workers)
+    else:
+        embedder = embedder_class(**embedder_kwargs)
+    if embedding_cache_dir is not None:
+        embedder = embedding.CachedEmbedder(embedder, cache_dir=embedding_cache_dir)
+    if embedding_coalesce_ms is not None:
+        embedder = embedding.CoalescingEmbedder(embedder, max_wait_ms=embedding_coalesce_ms)
+    return embedder
+
+
 class AppModule(Module):
-    def __init__(self, source=None):
+    def __init__(self, source=None, embedding_cache_dir=None, embedding_workers=None, embedding_backend="torch",
+                 embedding_coalesce_ms=None, source_cache_dir=None, result_cache_dir=None):
         self.source = source
+        self.source_cache_dir = source_cache_dir
+        # Reductions and clusterings are cached in this directory when it is set
+        self.result_cache = ResultCache(result_cache_dir) if result_cache_dir is not None else None
+        self.embedding_cache_dir = embedding_cache_dir
+        self.embedding_workers = embedding_workers
+        self.embedding_backend = embedding_backend
+        self.embedding_coalesce_ms = embedding_coalesce_ms
 
     @singleton
     @provider
     def provide_data_loader(self) -> DataLoader:
-        return AlpacaLoader(source=self.source)
+        cache = SourceCache(self.source_cache_dir) if self.source_cache_dir is not None else None
+        return AlpacaLoader(source=self.source, cache=cache)
 
     @singleton
     @provider
     def provide_embedder(self) -> Embedder:
-        return AllMiniLMEmbedder()
+        # Keyword arguments only, so the cached stack is shared with create_embedder(**EMBEDDING_SETTINGS)
+        return create_embedder(embedding_cache_dir=self.embedding_cache_dir,
+                               embedding_workers=self.embedding_workers,
+                               embedding_backend=self.embedding_backend,
+                               embedding_coalesce_ms=self.embedding_coalesce_ms)
 
     @singleton
     @provider
     def provide_clustering_model(self) -> ClusteringModel:
+        if self.result_cache is not None:
+            return CachedClustering(GaussianMixtureClustering(), self.result_cache)
         return GaussianMixtureClustering()
 
     @singleton
     @provider
     def provide_reducer(self) -> DimensionalityReduction:
+        if self.result_cache is not None:
+            return CachedReduction(PcaReduction(), self.result_cache)
         return PcaReduction()
 
     @singleton
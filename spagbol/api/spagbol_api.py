@@ -13,17 +13,47 @@ from flask import Flask, request, jsonify
 from flask_injector import FlaskInjector, inject
 from injector import inject, singleton, Module, provider
 from flask_cors import CORS
-from .modules import AppModule
+from .modules import AppModule, create_embedder
 
 import logging
+import os
 from spagbol.controllers.spagbol_controller import SpagbolController  # Import the SpagbolController
 from spagbol.spagbol import Spagbol
+from spagbol.loading import DataLoader, AlpacaLoader
+from spagbol.embedding import Embedder
+from spagbol.clustering import ClusteringModel, GaussianMixtureClustering
+from spagbol.reduction import DimensionalityReduction, PcaReduction
+from spagbol.errors import NoDatasetError, ClusteringError, WorkspaceError, DataPointNotFoundError
+from spagbol.storage import Workspace
 
 # intialising logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Initialise Flask application
 app = Flask(__name__)
+# Embedder stack settings, see create_embedder
+EMBEDDING_SETTINGS = {
+    # Directory for the persistent embedding cache, caching is disabled when it is not set
+    "embedding_cache_dir": os.environ.get("SPAGBOL_EMBEDDING_CACHE_DIR"),
+    # Number of embedding worker processes, embeddings are computed in-process when it is not set
+    "embedding_workers": int(os.environ["SPAGBOL_EMBEDDING_WORKERS"])
+    if "SPAGBOL_EMBEDDING_WORKERS" in os.environ else None,
+    # Embedding backend, one of "torch", "onnx" and "onnx-int8"
+    "embedding_backend": os.environ.get("SPAGBOL_EMBEDDING_BACKEND", "torch"),
+    # How long single-text embed calls wait to be coalesced into a batch, e.g. 5. Coalescing is off when it is
+    # not set or empty
+    "embedding_coalesce_ms": float(os.environ["SPAGBOL_EMBEDDING_COALESCE_MS"])
+    if os.environ.get("SPAGBOL_EMBEDDING_COALESCE_MS") else None,
+}
+# Directory for the cache of parsed and converted datasets, sources are reparsed on every load when it is not set
+SOURCE_CACHE_DIR = os.environ.get("SPAGBOL_SOURCE_CACHE_DIR")
+# Directory for the cache of reduction and clustering results, analyses always run when it is not set
+RESULT_CACHE_DIR = os.environ.get("SPAGBOL_RESULT_CACHE_DIR")
+# Directory clients can save workspaces to and open them from, workspace endpoints are disabled when it is not set
+WORKSPACE_DIR = os.environ.get("SPAGBOL_WORKSPACE_DIR")
+# Load models while the app starts instead of on the first request
+if os.environ.get("SPAGBOL_PRELOAD") == "1":
+    create_embedder(**EMBEDDING_SETTINGS).warm_up()
 CORS(app, resources={r"/*": {"origins": "http://localhost:5173"}}, supports_credentials=True)
 
 
@@ -33,7 +63,7 @@ def configure(binder):
 
     # Bind interfaces to concrete implementations with singleton scope
     binder.bind(DataLoader, to=AlpacaLoader, scope=singleton)
-    binder.bind(Embedder, to=AllMiniLMEmbedder, scope=singleton)
+    binder.bind(Embedder, to=lambda: create_embedder(**EMBEDDING_SETTINGS), scope=singleton)
     binder.bind(ClusteringModel, to=GaussianMixtureClustering, scope=singleton)
     binder.bind(DimensionalityReduction, to=PcaReduction, scope=singleton)
     # Bind Spagbol class to itself so the injector creates the instance
@@ -56,7 +86,8 @@ def load_data():
         logging.debug(f"Request content: {content}")
         logging.debug(f"Dataset location: {dataset_location}")
 
-        app_module = AppModule(source=dataset_location)
+        app_module = AppModule(source=dataset_location, source_cache_dir=SOURCE_CACHE_DIR,
+                               result_cache_dir=RESULT_CACHE_DIR, **EMBEDDING_SETTINGS)
         injector = FlaskInjector(app=app, modules=[app_module]).injector
         spagbol_instance = injector.get(Spagbol)
 
@@ -83,7 +114,8 @@ def load_data():
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 def prepare_spagbol_instance(dataset_location):
-    app_module = AppModule(source=dataset_location)
+    app_module = AppModule(source=dataset_location, source_cache_dir=SOURCE_CACHE_DIR,
+                           result_cache_dir=RESULT_CACHE_DIR, **EMBEDDING_SETTINGS)
     injector = FlaskInjector(app=app, modules=[app_module]).injector
     return injector.get(Spagbol)
 
@@ -135,6 +167,9 @@ def edit_data_point(spagbol_instance: Spagbol):
     except NoDatasetError as e:
         # Return error message if no dataset is loaded
         return jsonify({"error": str(e)}), 400
+    except DataPointNotFoundError as e:
+        # Return error message if there is no data point with this id
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         # Return error message for any other exceptions
         return jsonify({"error": "An unexpected error occurred"}), 500
@@ -153,6 +188,9 @@ def delete_data_point(spagbol_instance: Spagbol):
     except NoDatasetError as e:
         # Return error message if no dataset is loaded
         return jsonify({"error": str(e)}), 400
+    except DataPointNotFoundError as e:
+        # Return error message if there is no data point with this id
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         # Return error message for any other exceptions
         return jsonify({"error": "An unexpected error occurred"}), 500
@@ -183,6 +221,11 @@ def batch_delete_data_points(spagbol_instance: Spagbol):
         spagbol_instance.batch_delete_data_points(data_point_ids)
         # Return success message if deletion is successful
         return jsonify({"message": "Data points deleted successfully"}), 200
+    except NoDatasetError as e:
+        return jsonify({"error": str(e)}), 400
+    except DataPointNotFoundError as e:
+        # Nothing is deleted when one of the ids doesn't exist
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         # Return error message if an exception occurs during batch deletion
         return jsonify({"error": "An error occurred while deleting data points"}), 500
@@ -191,15 +234,20 @@ def batch_delete_data_points(spagbol_instance: Spagbol):
 @app.route('/find_similarities', methods=['POST'])
 @inject
 def find_similarities(spagbol_instance: Spagbol):
-    # Check for Request Data if needed
+    # Query text(s) or a data point id, plus optional k and embedding field
+    options = request.get_json(silent=True) or {}
     # Find similarities using the Spagbol instance
     try:
-        similarities = spagbol_instance.find_similarities()
-        # Return the similarities
+        similarities = spagbol_instance.find_similarities(options.get('query'), options.get('data_point_id'),
+                                                          k=int(options.get('k', 10)),
+                                                          field=options.get('field', 'input_embedding'))
+        # Return the ranked ids and scores
         return jsonify(similarities), 200
-    except NoDatasetError as e:
-        # Return error message if no dataset is loaded
+    except (NoDatasetError, ValueError) as e:
+        # Return error message if no dataset is loaded or the request has no query
         return jsonify({"error": str(e)}), 400
+    except DataPointNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         # Return error message for any other exceptions
         return jsonify({"error": "An unexpected error occurred"}), 500
@@ -208,12 +256,14 @@ def find_similarities(spagbol_instance: Spagbol):
 @app.route('/apply_clustering', methods=['POST'])
 @inject
 def apply_clustering(spagbol_instance: Spagbol):
-    # Check for Request Data if needed
+    # Optional target column and forced refit, by default the input embeddings are clustered incrementally
+    options = request.get_json(silent=True) or {}
     try:
         # Apply clustering using the Spagbol instance
-        clustering_result = spagbol_instance.apply_clustering()
+        clustering_result = spagbol_instance.apply_clustering(options.get('target_column', 'input_embedding'),
+                                                              refit=bool(options.get('refit', False)))
         # Return the clustering result
-        return jsonify(clustering_result), 200
+        return jsonify(clustering_result.tolist()), 200
     except NoDatasetError as e:
         # Return error message if no dataset is loaded
         return jsonify({"error": str(e)}), 400
@@ -224,6 +274,22 @@ def apply_clustering(spagbol_instance: Spagbol):
         # Return error message for any other exceptions
         return jsonify({"error": "An unexpected error occurred"}), 500
     
+@app.route('/cluster_summaries', methods=['GET'])
+@inject
+def cluster_summaries(spagbol_instance: Spagbol):
+    # Summaries are computed when clustering finishes and again here after the rows changed
+    target_column = request.args.get('target_column', 'input_embedding')
+    try:
+        return jsonify(spagbol_instance.get_cluster_summaries(target_column)), 200
+    except NoDatasetError as e:
+        # Return error message if no dataset is loaded
+        return jsonify({"error": str(e)}), 400
+    except ClusteringError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        # Return error message for any other exceptions
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
 @app.route('/export_data', methods=['GET'])
 @inject
 def export_data(spagbol_instance: Spagbol):
@@ -254,6 +320,64 @@ def import_data(spagbol_instance: Spagbol):
         return jsonify({"error": "An error occurred while importing the data"}), 500
 
 
+@app.route('/save_workspace', methods=['POST'])
+@inject
+def save_workspace(spagbol_instance: Spagbol):
+    # Persist the current state so it can be reopened without recomputing embeddings and reductions
+    try:
+        # Workspace paths are relative to WORKSPACE_DIR, anything resolving outside of it is rejected
+        workspace_path = Workspace.in_root(WORKSPACE_DIR, request.json['path']).path
+        manifest = SpagbolController(spagbol_instance).save_workspace(workspace_path)
+        return jsonify({"message": "Workspace saved successfully", "manifest": manifest}), 200
+    except KeyError as e:
+        return jsonify({"error": f"Missing key in request: {str(e)}"}), 400
+    except (NoDatasetError, WorkspaceError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error saving workspace: {e}")
+        return jsonify({"error": "An error occurred while saving the workspace"}), 500
+
+
+@app.route('/open_workspace', methods=['POST'])
+def open_workspace():
+    # Restore a saved workspace instead of loading and embedding the dataset again
+    try:
+        # Models are unpickled on open, so only workspaces below WORKSPACE_DIR are opened
+        workspace_path = Workspace.in_root(WORKSPACE_DIR, request.json['path']).path
+        spagbol_instance = prepare_spagbol_instance(None)
+        manifest = SpagbolController(spagbol_instance).open_workspace(workspace_path)
+        return jsonify({"message": "Workspace opened successfully", "manifest": manifest,
+                        "data": spagbol_instance.to_json()}), 200
+    except KeyError as e:
+        return jsonify({"error": f"Missing key in request: {str(e)}"}), 400
+    except WorkspaceError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error opening workspace: {e}")
+        return jsonify({"error": "An error occurred while opening the workspace"}), 500
+
+
+@app.route('/embedding_metrics', methods=['GET'])
+@inject
+def embedding_metrics(spagbol_instance: Spagbol):
+    # Queue depth and batch size statistics of the coalescing embedder, if one is configured
+    metrics = getattr(spagbol_instance.embedder, "metrics", None)
+    if metrics is None:
+        return jsonify({"error": "Embedder doesn't collect metrics"}), 404
+    return jsonify(metrics()), 200
+
+
+@app.route('/result_cache_stats', methods=['GET'])
+@inject
+def result_cache_stats(spagbol_instance: Spagbol):
+    # Hit and miss statistics of the reduction and clustering result cache, if one is configured
+    cache = getattr(spagbol_instance.reducer, "cache", None) or \
+        getattr(spagbol_instance.clustering_model, "cache", None)
+    if cache is None:
+        return jsonify({"error": "Result cache is not configured"}), 404
+    return jsonify(cache.stats()), 200
+
+
 # Start the Flask application if this script is the main program
 if __name__ == '__main__':
     #app.run(debug=True)
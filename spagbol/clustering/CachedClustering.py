@@ -0,0 +1,79 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import copy
+
+import numpy as np
+
+from spagbol.clustering.ClusteringModel import ClusteringModel
+from spagbol.storage import ResultCache
+
+
+class CachedClustering(ClusteringModel):
+    """
+    Wraps any ClusteringModel with a ResultCache. Clustering data that was already clustered with the same
+    model class and parameters loads the labels and the fitted model instead of fitting again.
+    The wrapped model is only used as a prototype, every fit works on a copy of it.
+    Example usages:
+        For fitting the model and predicting clusters:
+            clustering = CachedClustering(GaussianMixtureClustering(), ResultCache("/var/cache/spagbol/results"))
+            clusters = clustering.fit_predict(data)
+        For predicting clusters of new data with the fitted model:
+            clusters = clustering.predict(new_data)
+
+    :param clustering_model: Unfitted clustering model
+    :param cache: Result cache shared by all cached models
+    """
+    def __init__(self, clustering_model: ClusteringModel, cache: ResultCache):
+        super().__init__()
+        self.clustering_model = clustering_model
+        self.cache = cache
+        self._fitted = None
+
+    def _init_model(self):
+        """
+        The wrapped clustering model owns the model
+        """
+        return None
+
+    def fit(self, data):
+        # Fitting always produces labels, so they are cached as well
+        self.fit_predict(data)
+
+    def fit_predict(self, data) -> np.array:
+        # Return cached labels, or fit a copy of the wrapped model and cache its labels
+        data = np.asarray(data)
+        key = self.cache.key(self.clustering_model, data)
+        cached = self.cache.get(key)
+        if cached is not None:
+            labels, self._fitted = cached
+            return labels
+        fitted = copy.deepcopy(self.clustering_model)
+        labels = fitted.fit_predict(data)
+        if labels is not None:
+            self.cache.put(key, labels, fitted)
+        self._fitted = fitted
+        return labels
+
+    @property
+    def can_predict(self) -> bool:
+        return self.clustering_model.can_predict
+
+    def refit_predict(self, data) -> np.array:
+        # Warm-started fits depend on the previous fit, not only on data and parameters, so they aren't cached
+        if self._fitted is None:
+            return self.fit_predict(data)
+        return self._fitted.refit_predict(data)
+
+    def predict(self, data) -> np.array:
+        # Predict the clusters with the fitted copy
+        if self._fitted is None:
+            return None
+        return self._fitted.predict(data)
@@ -0,0 +1,143 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class ClusterSummaries:
+    """
+    Per-cluster sizes, centroids, medoids and the members nearest to each centroid, computed from the cluster
+    labels in one chunked pass over the clustered matrix, so a cluster view doesn't need the labelled points.
+    The medoid is the member nearest to the centroid, which is the exact medoid under squared euclidean
+    distance. Noise labels (-1) are only counted.
+    Example usage:
+        summaries = ClusterSummaries.compute(labels, dataset["id"].to_numpy(), embeddings,
+                                             dataset[["instruction_x", "instruction_y"]].to_numpy())
+        payload = summaries.to_dict(dataset.set_index("id")[["input", "output"]])
+
+    :param clusters: Cluster labels, sorted
+    :param sizes: Number of members of every cluster
+    :param centroids: Mean of the clustered matrix per cluster
+    :param centroids_2d: Mean of the 2D coordinates per cluster, None without coordinates
+    :param member_ids: Ids of the members nearest to each centroid, nearest first, -1 pads small clusters
+    :param member_distances: Distances of those members to their centroid, NaN pads small clusters
+    :param noise: Number of rows labelled as noise
+    """
+
+    def __init__(self, clusters: np.ndarray, sizes: np.ndarray, centroids: np.ndarray,
+                 centroids_2d: Optional[np.ndarray], member_ids: np.ndarray, member_distances: np.ndarray,
+                 noise: int = 0):
+        self.clusters = clusters
+        self.sizes = sizes
+        self.centroids = centroids
+        self.centroids_2d = centroids_2d
+        self.member_ids = member_ids
+        self.member_distances = member_distances
+        self.noise = noise
+
+    def __len__(self) -> int:
+        return len(self.clusters)
+
+    @property
+    def medoids(self) -> np.ndarray:
+        """
+        :return: Id of the medoid of every cluster
+        """
+        return self.member_ids[:, 0]
+
+    @classmethod
+    def compute(cls, labels: np.ndarray, ids: np.ndarray, data: np.ndarray, coordinates: Optional[np.ndarray] = None,
+                top_k: int = 5, chunk_size: int = 16384) -> "ClusterSummaries":
+        """
+        :param labels: Cluster label of every row
+        :param ids: Id of every row
+        :param data: Matrix the rows were clustered on, e.g. an embedding matrix, can be memory-mapped
+        :param coordinates: 2D coordinates of every row
+        :param top_k: Number of members nearest to the centroid kept per cluster
+        :param chunk_size: Number of rows read from data at once
+        :return: The summaries
+        """
+        labels = np.asarray(labels)
+        ids = np.asarray(ids)
+        top_k = max(top_k, 1)
+        clustered = np.flatnonzero(labels >= 0)
+        clusters, inverse = np.unique(labels[clustered], return_inverse=True)
+        sizes = np.bincount(inverse, minlength=len(clusters))
+        centroids = (cls._sums(data, clustered, inverse, len(clusters), chunk_size)
+                     / np.maximum(sizes, 1)[:, None]).astype(np.float32)
+        centroids_2d = None
+        if coordinates is not None:
+            centroids_2d = (cls._sums(coordinates, clustered, inverse, len(clusters), chunk_size)
+                            / np.maximum(sizes, 1)[:, None]).astype(np.float32)
+
+        distances = np.empty(len(clustered), dtype=np.float32)
+        for start in range(0, len(clustered), chunk_size):
+            stop = start + chunk_size
+            difference = np.asarray(data[clustered[start:stop]], dtype=np.float32) - centroids[inverse[start:stop]]
+            distances[start:stop] = np.sqrt(np.einsum("ij,ij->i", difference, difference))
+
+        # Clustered rows ordered by cluster, then by distance to the centroid; each cluster's nearest members
+        # are the first top_k rows of its segment
+        order = np.lexsort((distances, inverse))
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+        valid = np.arange(top_k) < sizes[:, None]
+        nearest = np.zeros((len(clusters), top_k), dtype=np.int64)
+        if len(order):
+            nearest = order[np.minimum(starts[:, None] + np.arange(top_k), len(order) - 1)]
+        member_ids = np.where(valid, ids[clustered[nearest]], -1)
+        member_distances = np.where(valid, distances[nearest], np.nan).astype(np.float32)
+        return cls(clusters, sizes, centroids, centroids_2d, member_ids, member_distances,
+                   noise=int(len(labels) - len(clustered)))
+
+    def to_dict(self, texts=None) -> Dict[str, Any]:
+        """
+        :param texts: Optional DataFrame indexed by id, its columns (e.g. input and output) are added to the
+                      nearest members
+        :return: JSON serializable summaries
+        """
+        # One lookup for the texts of all members
+        records = {}
+        if texts is not None:
+            member_ids = self.member_ids[self.member_ids >= 0]
+            records = dict(zip(member_ids.tolist(), texts.loc[member_ids].to_dict("records")))
+        clusters = []
+        for position, cluster in enumerate(self.clusters):
+            members = []
+            for member_id, distance in zip(self.member_ids[position].tolist(), self.member_distances[position]):
+                if member_id < 0:
+                    break
+                members.append({"id": member_id, "distance": float(distance), **records.get(member_id, {})})
+            clusters.append({
+                "cluster": int(cluster),
+                "size": int(self.sizes[position]),
+                "centroid": self.centroids[position].tolist(),
+                "centroid_2d": None if self.centroids_2d is None else self.centroids_2d[position].tolist(),
+                "medoid": int(self.member_ids[position, 0]),
+                "members": members,
+            })
+        return {"clusters": clusters, "noise": self.noise}
+
+    @staticmethod
+    def _sums(matrix: np.ndarray, clustered: np.ndarray, inverse: np.ndarray, n_clusters: int,
+              chunk_size: int) -> np.ndarray:
+        """
+        Per-cluster sums of the clustered rows, accumulated chunk by chunk in float64
+        """
+        sums = np.zeros((n_clusters, matrix.shape[1]), dtype=np.float64)
+        for start in range(0, len(clustered), chunk_size):
+            chunk_inverse = inverse[start:start + chunk_size]
+            order = np.argsort(chunk_inverse, kind="stable")
+            sorted_inverse = chunk_inverse[order]
+            boundaries = np.flatnonzero(np.r_[True, sorted_inverse[1:] != sorted_inverse[:-1]])
+            block = np.asarray(matrix[clustered[start:start + chunk_size]], dtype=np.float64)[order]
+            sums[sorted_inverse[boundaries]] += np.add.reduceat(block, boundaries)
+        return sums
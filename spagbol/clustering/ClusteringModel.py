@@ -17,6 +17,10 @@ class ClusteringModel(ABC):
     Every clustering class imported into this project has to use this interface
     """
 
+    # Whether predict labels new points with the fitted model. Models that have to cluster again to label
+    # points (e.g. OPTICS) set this to False, so Spagbol refits them after every change instead.
+    can_predict = True
+
     @abstractmethod
     def __init__(self):
         """
@@ -47,6 +51,15 @@ class ClusteringModel(ABC):
         """
         raise NotImplementedError()
 
+    def refit_predict(self, data) -> np.array:
+        """
+        Fits the already fitted model again after the data changed and predicts the clusters.
+        Models that can start from their previous fit override this, the default fits from scratch.
+        :param data: Input data to be clustered
+        :return: Predicted clusters
+        """
+        return self.fit_predict(data)
+
     @abstractmethod
     def predict(self, data) -> np.array:
         """
@@ -61,6 +61,17 @@ class GaussianMixtureClustering(ClusteringModel):
             print(f"Error fitting and predicting the model: {e}")
             return None
 
+    def refit_predict(self, data) -> np.array:
+        # Fit again starting from the current weights, means and covariances, then predict the clusters
+        try:
+            self._model.warm_start = True
+            return self._model.fit_predict(data)
+        except Exception as e:
+            print(f"Error refitting and predicting the model: {e}")
+            return None
+        finally:
+            self._model.warm_start = False
+
     def predict(self, data) -> np.array:
         # Predict the clusters for the data
         try:
@@ -0,0 +1,224 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import HDBSCAN
+from sklearn.neighbors import BallTree, KDTree
+
+from spagbol.clustering.ClusteringModel import ClusteringModel
+from spagbol.errors import ClusteringError, UnfitModelError
+from spagbol.search import KnnGraph
+from spagbol.storage.matrix import as_matrix
+
+
+class HdbscanClustering(ClusteringModel):
+    """
+    HDBSCAN density clustering. Unlike OpticsClustering it finds neighbours with a spatial index: a k-d tree or
+    ball tree, which suits low-dimensional data such as the 2D reduced coordinates, or a cached KnnGraph
+    ('knn_graph'), which suits embedding matrices. Core distances are computed with n_jobs workers.
+    A kNN graph of well separated groups is not connected, so its components are chained with edges longer than
+    any distance in the graph: they only merge at the root of the hierarchy and split apart like well separated
+    groups of a tree-based fit, components smaller than min_cluster_size are noise.
+    The fitted model, the fitted points and their core distances are kept, so predict labels new points
+    approximately without clustering again: a point joins the cluster of the fitted point it is closest to in
+    mutual reachability distance, and is noise (-1) when that distance is larger than any core distance within
+    the cluster.
+    Example usages:
+        For clustering the reduced coordinates:
+            hc = HdbscanClustering(min_cluster_size=25)
+            clusters = hc.fit_predict(dataset[["instruction_x", "instruction_y"]])
+        For clustering embeddings on their neighbour graph:
+            hc = HdbscanClustering(algorithm="knn_graph", metric="cosine", knn_cache_dir="/data/knn")
+            clusters = hc.fit_predict(embeddings)
+            new_clusters = hc.predict(new_embeddings)
+
+    :param min_cluster_size: Smallest number of points that forms a cluster
+    :param min_samples: Number of neighbours that define the core distance, min_cluster_size when None
+    :param cluster_selection_epsilon: Clusters closer than this distance are merged
+    :param algorithm: 'kd_tree', 'ball_tree' or 'knn_graph'
+    :param metric: Distance metric
+    :param leaf_size: Leaf size of the trees
+    :param n_neighbors: Neighbours per row of the kNN graph, at least min_samples + 1 are used
+    :param knn_cache_dir: Directory kNN graphs are persisted in, see KnnGraph.cached
+    :param n_jobs: Number of workers, -1 uses every CPU
+    """
+
+    ALGORITHMS = ("kd_tree", "ball_tree", "knn_graph")
+    # Spelling of the tree algorithms in sklearn.cluster.HDBSCAN of the pinned scikit-learn 1.3
+    _SKLEARN_ALGORITHMS = {"kd_tree": "kdtree", "ball_tree": "balltree"}
+
+    def __init__(self, min_cluster_size: int = 15, min_samples: Optional[int] = None,
+                 cluster_selection_epsilon: float = 0.0, algorithm: str = "kd_tree", metric: str = "euclidean",
+                 leaf_size: int = 40, n_neighbors: int = 15, knn_cache_dir: Optional[str] = None,
+                 n_jobs: int = -1):
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(f"algorithm has to be one of {self.ALGORITHMS}")
+        self.min_cluster_size = min_cluster_size
+        self.min_samples = min_samples
+        self.cluster_selection_epsilon = cluster_selection_epsilon
+        self.algorithm = algorithm
+        self.metric = metric
+        self.leaf_size = leaf_size
+        self.n_neighbors = n_neighbors
+        self.knn_cache_dir = knn_cache_dir
+        self.n_jobs = n_jobs
+        self._model: HDBSCAN = self._init_model()
+        self._labels: Optional[np.ndarray] = None
+        self._data = None
+        self._graph: Optional[KnnGraph] = None
+        # Built on the first predict: spatial index over the fitted points, their core distances and the
+        # largest core distance of every cluster
+        self._tree = None
+        self._core_distances = None
+        self._cluster_reach = None
+
+    @property
+    def labels(self) -> np.ndarray:
+        """
+        :raises UnfitModelError: If model wasn't fit before
+        :return: Clusters of the fitted points, -1 for noise
+        """
+        if self._data is None:
+            raise UnfitModelError("Model has to be fit before accessing the labels")
+        return self._labels
+
+    def _init_model(self) -> HDBSCAN:
+        if self.algorithm == "knn_graph":
+            return HDBSCAN(min_cluster_size=self.min_cluster_size, min_samples=self.min_samples,
+                           cluster_selection_epsilon=self.cluster_selection_epsilon, metric="precomputed")
+        return HDBSCAN(min_cluster_size=self.min_cluster_size, min_samples=self.min_samples,
+                       cluster_selection_epsilon=self.cluster_selection_epsilon, metric=self.metric,
+                       algorithm=self._SKLEARN_ALGORITHMS[self.algorithm], leaf_size=self.leaf_size,
+                       n_jobs=self.n_jobs)
+
+    def fit(self, data):
+        """
+        Builds the density hierarchy of the data and extracts its clusters
+
+        :param data: Data to be clustered, a matrix or a sequence of rows
+        """
+        matrix = as_matrix(data)
+        self._model = self._init_model()
+        self._tree = self._core_distances = self._cluster_reach = None
+        if self.algorithm == "knn_graph":
+            # The row itself is the first neighbour, every row keeps min_samples neighbours besides itself
+            self._graph = KnnGraph.cached(matrix, max(self.n_neighbors, self._min_samples + 1), self.metric,
+                                          cache_dir=self.knn_cache_dir)
+            distances = self._connect_components(self._sparse_distances(self._graph))
+            self._labels = self._model.fit(distances).labels_
+        else:
+            self._labels = self._model.fit(matrix).labels_
+        self._data = matrix
+
+    def fit_predict(self, data) -> np.array:
+        """
+        Fits the model to the data and returns the clusters of the fitted points
+        :param data: Input data to be clustered
+        :return: Predicted clusters, -1 for noise
+        """
+        self.fit(data)
+        return self._labels
+
+    def predict(self, data) -> np.array:
+        """
+        Labels new points approximately with the fitted hierarchy, without clustering again
+        :param data: Input data to be clustered
+        :raises UnfitModelError: If model wasn't fit before using the method
+        :return: Predicted clusters, -1 for noise
+        """
+        if self._data is None:
+            raise UnfitModelError("Model has to be fit before using the predict method")
+        if self._core_distances is None:
+            self._build_prediction_data()
+        matrix = as_matrix(data)
+        if len(matrix) == 0:
+            return np.empty(0, dtype=self._labels.dtype)
+        neighbors, distances = self._query(matrix, self._min_samples)
+        # Mutual reachability distance to every neighbour, the new point's core distance is estimated from
+        # its neighbours among the fitted points
+        reachability = np.maximum(np.maximum(distances, distances[:, -1:]), self._core_distances[neighbors])
+        nearest = reachability.argmin(axis=1)
+        rows = np.arange(len(matrix))
+        labels = self._labels[neighbors[rows, nearest]].copy()
+        clustered = labels >= 0
+        labels[clustered & (reachability[rows, nearest] > self._cluster_reach[np.maximum(labels, 0)])] = -1
+        return labels
+
+    @property
+    def _min_samples(self) -> int:
+        return self.min_samples or self.min_cluster_size
+
+    @staticmethod
+    def _connect_components(distances: csr_matrix) -> csr_matrix:
+        """
+        Chains the connected components of the sparse distance matrix, sklearn needs a connected graph. The
+        bridging edges are longer than any distance, and so than any mutual reachability distance, of the graph.
+
+        :param distances: Symmetric sparse distance matrix with at least min_samples entries per row
+        :return: Connected symmetric sparse distance matrix
+        """
+        n_components, components = connected_components(distances, directed=False)
+        if n_components == 1:
+            return distances
+        logging.debug(f"Chaining {n_components} kNN graph components")
+        # First row of every component
+        representatives = np.unique(components, return_index=True)[1]
+        bridges = csr_matrix((np.full(n_components - 1, 2 * distances.max() + 1.0),
+                              (representatives[:-1], representatives[1:])), shape=distances.shape)
+        return (distances + bridges + bridges.T).tocsr()
+
+    def _build_prediction_data(self):
+        """
+        Core distances of the fitted points, from the kNN graph or from parallel tree queries
+        """
+        if self._graph is not None:
+            # min_samples-th neighbour besides the row itself, like the core distances of the sparse fit
+            self._core_distances = np.asarray(self._graph.distances[:, self._min_samples])
+        else:
+            tree_class = BallTree if self.algorithm == "ball_tree" else KDTree
+            self._tree = tree_class(self._data, leaf_size=self.leaf_size, metric=self.metric)
+            self._core_distances = self._query(self._data, self._min_samples)[1][:, -1]
+        labels = self._labels
+        self._cluster_reach = np.zeros(max(labels.max() + 1, 1), dtype=np.float64)
+        clustered = labels >= 0
+        np.maximum.at(self._cluster_reach, labels[clustered], self._core_distances[clustered])
+
+    def _query(self, matrix: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Positions and distances of the k nearest fitted points of every row
+        """
+        if self._graph is not None:
+            if self._graph.search_index is None:
+                raise ClusteringError("The kNN graph was loaded without its search index, it can't label new points")
+            return self._graph.search_index.query(matrix, k=k)
+        chunks = [matrix[start:start + 4096] for start in range(0, len(matrix), 4096)]
+        parts = Parallel(n_jobs=self.n_jobs, prefer="threads")(delayed(self._tree.query)(chunk, k=k)
+                                                                 for chunk in chunks)
+        return np.concatenate([part[1] for part in parts]), np.concatenate([part[0] for part in parts])
+
+    @staticmethod
+    def _sparse_distances(graph: KnnGraph) -> csr_matrix:
+        """
+        Symmetric sparse distance matrix of the graph, without the rows themselves. Zero distances (duplicate
+        rows) are stored as a tiny positive value, since the sparse matrix would treat them as missing edges.
+        """
+        rows = np.repeat(np.arange(len(graph)), graph.n_neighbors)
+        neighbors = np.asarray(graph.indices).ravel()
+        distances = np.maximum(np.asarray(graph.distances, dtype=np.float64).ravel(), 1e-12)
+        # Duplicates can push a row out of its own first column, so it is dropped wherever it appears
+        valid = (neighbors >= 0) & (neighbors != rows)
+        matrix = csr_matrix((distances[valid], (rows[valid], neighbors[valid])), shape=(len(graph), len(graph)))
+        return matrix.maximum(matrix.T).tocsr()
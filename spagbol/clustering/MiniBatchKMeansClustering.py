@@ -0,0 +1,201 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans, kmeans_plusplus
+from sklearn.metrics import silhouette_score
+
+from spagbol.clustering.ClusteringModel import ClusteringModel
+from spagbol.errors import UnfitModelError
+from spagbol.storage.matrix import as_matrix
+
+
+class MiniBatchKMeansClustering(ClusteringModel):
+    """
+    Mini-batch k-means clustering with bounded memory. The model is fit with partial_fit over chunks of the data,
+    so only one chunk is converted to float32 at a time and memory-mapped embedding matrices can be clustered
+    without loading them. Centers are seeded with k-means++ on a random sample of the rows. Mini-batches are
+    drawn in random row order every epoch: grouped rows (e.g. a sorted or sharded corpus) in storage order would
+    let sklearn reassign the centers of the groups missing from a batch into it and collapse the clusters.
+    When n_clusters is None, the number of clusters is chosen from candidate_clusters by the silhouette score of
+    k-means fits on that sample instead of repeated fits on all rows.
+    Example usages:
+        For fitting the model and predicting clusters:
+            mbk = MiniBatchKMeansClustering(n_clusters=50)
+            clusters = mbk.fit_predict(np.load("input_embedding.npy", mmap_mode="r"))
+        For streamed data:
+            mbk = MiniBatchKMeansClustering(n_clusters=50)
+            for _, block in embedder.embed_iter(texts):
+                mbk.partial_fit(block)
+            clusters = mbk.predict(embeddings)
+
+    :param n_clusters: Number of clusters, None selects it from candidate_clusters
+    :param candidate_clusters: Cluster counts that are scored when n_clusters is None
+    :param batch_size: Number of rows per mini-batch update
+    :param chunk_size: Number of rows converted and predicted at once
+    :param epochs: Number of passes over the data in fit
+    :param sample_size: Number of rows used for seeding the centers and selecting the cluster count
+    :param score_sample_size: Number of sample rows the silhouette score is computed on
+    :param random_state: Seed for sampling and seeding
+    """
+
+    def __init__(self, n_clusters: Optional[int] = None, candidate_clusters: Sequence[int] = tuple(range(2, 21)),
+                 batch_size: int = 4096, chunk_size: int = 65536, epochs: int = 1, sample_size: int = 20_000,
+                 score_sample_size: int = 5000, random_state: Optional[int] = None):
+        if n_clusters is None and not candidate_clusters:
+            raise ValueError("Either n_clusters or candidate_clusters has to be given")
+        self.n_clusters = n_clusters
+        self.candidate_clusters = tuple(candidate_clusters)
+        self.batch_size = batch_size
+        self.chunk_size = max(chunk_size, batch_size)
+        self.epochs = epochs
+        self.sample_size = sample_size
+        self.score_sample_size = score_sample_size
+        self.random_state = random_state
+        self._model: Optional[MiniBatchKMeans] = None
+        self._rng = np.random.default_rng(random_state)
+
+    @property
+    def cluster_centers(self) -> np.ndarray:
+        """
+        :raises UnfitModelError: If model wasn't fit before
+        :return: Matrix with one center per cluster
+        """
+        if self._model is None:
+            raise UnfitModelError("Model has to be fit before accessing the cluster centers")
+        return self._model.cluster_centers_
+
+    def _init_model(self, centers: np.ndarray = None) -> MiniBatchKMeans:
+        """
+        :param centers: Initial centers, they also set the number of clusters
+        :return: Unfitted MiniBatchKMeans model
+        """
+        return MiniBatchKMeans(n_clusters=len(centers), init=centers, n_init=1, batch_size=self.batch_size,
+                               random_state=self.random_state)
+
+    def fit(self, data):
+        """
+        Seeds the centers on a sample of the data, then updates them with mini-batches over all rows
+
+        :param data: Data to be clustered, a matrix or a sequence of rows
+        """
+        matrix = as_matrix(data)
+        self._seed(self._sample(matrix))
+        self._fit_passes(matrix)
+
+    def partial_fit(self, chunk):
+        """
+        Updates the centers with one chunk of rows, in random row order. The first chunk seeds the centers when
+        fit wasn't called.
+
+        :param chunk: Matrix with a chunk of rows
+        """
+        chunk = np.asarray(chunk, dtype=np.float32)
+        if self._model is None:
+            self._seed(self._sample(chunk))
+        for batch in self._batches(chunk[self._rng.permutation(len(chunk))]):
+            self._model.partial_fit(batch)
+
+    def fit_predict(self, data) -> np.array:
+        """
+        Fits the model to the data and predicts the clusters
+        :param data: Input data to be clustered
+        :return: Predicted clusters
+        """
+        matrix = as_matrix(data)
+        self.fit(matrix)
+        return self.predict(matrix)
+
+    def refit_predict(self, data) -> np.array:
+        """
+        Fits the model again starting from the current centers, which converges in fewer passes than seeding
+        from scratch and keeps cluster ids stable where the data didn't change much
+        :param data: Input data to be clustered
+        :return: Predicted clusters
+        """
+        if self._model is None:
+            return self.fit_predict(data)
+        matrix = as_matrix(data)
+        self._model = self._init_model(self._model.cluster_centers_)
+        self._fit_passes(matrix)
+        return self.predict(matrix)
+
+    def predict(self, data) -> np.array:
+        """
+        Assigns every row to its nearest center, chunk by chunk into one preallocated array
+        :param data: Input data to be clustered
+        :raises UnfitModelError: If model wasn't fit before using the method
+        :return: Predicted clusters
+        """
+        if self._model is None:
+            raise UnfitModelError("Model has to be fit before using the predict method")
+        matrix = as_matrix(data)
+        labels = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), self.chunk_size):
+            stop = start + self.chunk_size
+            labels[start:stop] = self._model.predict(np.asarray(matrix[start:stop], dtype=np.float32))
+        return labels
+
+    def select_n_clusters(self, sample: np.ndarray) -> int:
+        """
+        Picks the candidate cluster count with the best silhouette score of a k-means fit on the sample
+
+        :param sample: Matrix with sampled rows
+        :return: Number of clusters
+        """
+        candidates = [k for k in self.candidate_clusters if 1 < k < len(sample)]
+        best_k, best_score = min(self.candidate_clusters), -np.inf
+        for k in candidates:
+            labels = MiniBatchKMeans(n_clusters=k, n_init=3, batch_size=self.batch_size,
+                                     random_state=self.random_state).fit_predict(sample)
+            if len(np.unique(labels)) < 2:
+                continue
+            score = silhouette_score(sample, labels, sample_size=min(self.score_sample_size, len(sample)),
+                                     random_state=self.random_state)
+            logging.debug(f"Silhouette score for {k} clusters: {score:.4f}")
+            if score > best_score:
+                best_k, best_score = k, score
+        return best_k
+
+    def _fit_passes(self, matrix: np.ndarray):
+        """
+        Updates the seeded centers with epochs passes of mini-batches over the matrix. Every chunk is a random
+        draw of rows, read in sorted order so memory-mapped matrices are read front to back.
+        """
+        for _ in range(self.epochs):
+            order = self._rng.permutation(len(matrix))
+            for start in range(0, len(matrix), self.chunk_size):
+                self.partial_fit(matrix[np.sort(order[start:start + self.chunk_size])])
+
+    def _seed(self, sample: np.ndarray):
+        """
+        Creates the model with k-means++ centers picked from the sample
+        """
+        n_clusters = self.n_clusters or self.select_n_clusters(sample)
+        if len(sample) < n_clusters:
+            raise ValueError(f"Need at least {n_clusters} rows to seed {n_clusters} clusters, got {len(sample)}")
+        centers, _ = kmeans_plusplus(sample, n_clusters, random_state=self.random_state)
+        self._model = self._init_model(centers)
+
+    def _sample(self, matrix: np.ndarray) -> np.ndarray:
+        """
+        Random float32 rows of the matrix, indices are sorted so memory-mapped matrices are read in order
+        """
+        if len(matrix) <= self.sample_size:
+            return np.asarray(matrix, dtype=np.float32)
+        rows = np.random.default_rng(self.random_state).choice(len(matrix), self.sample_size, replace=False)
+        return np.asarray(matrix[np.sort(rows)], dtype=np.float32)
+
+    def _batches(self, chunk: np.ndarray) -> Iterator[np.ndarray]:
+        for start in range(0, len(chunk), self.batch_size):
+            yield chunk[start:start + self.batch_size]
@@ -30,6 +30,9 @@ class OpticsClustering(ClusteringModel):
 
     :param data: Data to be clustered. It should be a numpy array or similar data structure.
     """
+    # predict clusters the passed data again
+    can_predict = False
+
     def __init__(self):
         # Initialize the OPTICS model here
         try:
@@ -1,3 +1,12 @@
 from .ClusteringModel import ClusteringModel
-from .GaussianMixtureClustering import GaussianMixtureClustering
-from .OpticsClustering import OpticsClustering
+from .ClusterSummaries import ClusterSummaries
+from spagbol._lazy import install_lazy_exports
+
+# Implementations are imported on first use, so importing the package doesn't load sklearn
+install_lazy_exports(__name__, {
+    "GaussianMixtureClustering": "GaussianMixtureClustering",
+    "OpticsClustering": "OpticsClustering",
+    "MiniBatchKMeansClustering": "MiniBatchKMeansClustering",
+    "HdbscanClustering": "HdbscanClustering",
+    "CachedClustering": "CachedClustering",
+})
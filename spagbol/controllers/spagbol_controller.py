@@ -20,9 +20,19 @@ class SpagbolController:
         self.spagbol = spagbol_instance
 
     def load_and_prepare_data(self, dataset_location):
-        self.spagbol.load_data(dataset_location)
-        self.spagbol.create_embeddings()
+        # Chunks of the source are embedded while the rest is still being parsed
+        self.spagbol.load_and_embed(dataset_location)
         logging.debug("embeddings created successfully.")
 
         self.spagbol.reduce_dimensions()
-        logging.debug("Data loaded, embeddings created, and dimensionality reduced successfully.")
\ No newline at end of file
+        logging.debug("Data loaded, embeddings created, and dimensionality reduced successfully.")
+
+    def save_workspace(self, workspace_path):
+        manifest = self.spagbol.save_workspace(workspace_path)
+        logging.debug(f"Workspace saved to {workspace_path} with fingerprint {manifest['fingerprint']}")
+        return manifest
+
+    def open_workspace(self, workspace_path):
+        manifest = self.spagbol.open_workspace(workspace_path)
+        logging.debug(f"Workspace {workspace_path} opened with {manifest['rows']} rows")
+        return manifest
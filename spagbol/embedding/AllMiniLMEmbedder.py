@@ -15,34 +15,83 @@ import numpy as np
 
 from tqdm import tqdm
 
-from typing import List
+from typing import Iterator, List, Tuple
 
 from spagbol.embedding.Embedder import Embedder
 
 import logging
+import threading
 
 class AllMiniLMEmbedder(Embedder):
     """
     Embedder for all-MiniLM-L6-v2 model. This class is responsible for loading the model and tokenizer,
     and performing mean pooling on the model's output to generate sentence embeddings.
+
+    The model and the tokenizer are loaded on first use, call warm_up to load them upfront.
+    Batches are built by sorting sentences by token length and grouping them into buckets whose padded size
+    stays under max_batch_tokens, so short sentences are not padded up to the length of the longest one.
+
+    :param max_batch_tokens: Upper bound for the padded token count (sentences * longest sentence) of one
+                             forward pass in embed_batch.
     """
 
-    def __init__(self):
+    model_name = 'sentence-transformers/all-MiniLM-L6-v2'
+    # Tensor type requested from the tokenizer, matches what _encode consumes
+    _return_tensors = 'pt'
+
+    def __init__(self, max_batch_tokens: int = 8192):
+        self._max_batch_tokens = max_batch_tokens
+        self._device = "cpu"
+        if torch.cuda.is_available():
+            self._device = "cuda"
+        # Model, tokenizer and hidden size, loaded on first use or by warm_up
+        self._components = None
+        self._components_lock = threading.Lock()
+
+    @property
+    def _model(self):
+        return self._load_components()[0]
+
+    @property
+    def _tokenizer(self):
+        return self._load_components()[1]
+
+    @property
+    def _hidden_size(self) -> int:
+        return self._load_components()[2]
+
+    def warm_up(self):
+        """
+        Loads the model and the tokenizer, which otherwise happens on the first embed call
+        """
+        self._load_components()
+
+    def _load_components(self):
+        if self._components is None:
+            with self._components_lock:
+                if self._components is None:
+                    self._components = self._load()
+        return self._components
+
+    def _load(self):
+        """
+        Loads the model and the tokenizer
+        :return: Tuple of model, tokenizer and the size of the embeddings
+        """
         try:
-            self._device = "cpu"
-            if torch.cuda.is_available():
-                self._device = "cuda"
-            self._model = self._init_model().to(self._device)
-            self._tokenizer = self._init_tokenizer()
+            model = self._init_model().to(self._device)
+            model.eval()
+            return model, self._init_tokenizer(), model.config.hidden_size
         except Exception as e:
             print(f"Error initializing model or tokenizer: {e}")
+            raise
 
     def _init_model(self):
         """
         This method initializes the model
         """
         try:
-            return AutoModel.from_pretrained('sentence-transformers/all-MiniLM-L6-v2')
+            return AutoModel.from_pretrained(self.model_name)
         except Exception as e:
             print(f"Error initializing model: {e}")
             return None
@@ -52,7 +101,7 @@ class AllMiniLMEmbedder(Embedder):
         This method initializes the tokenizer
         """
         try:
-            return AutoTokenizer.from_pretrained('sentence-transformers/all-MiniLM-L6-v2')
+            return AutoTokenizer.from_pretrained(self.model_name)
         except Exception as e:
             print(f"Error initializing tokenizer: {e}")
             return None
@@ -65,52 +114,106 @@ class AllMiniLMEmbedder(Embedder):
         """
         try:
             # Tokenize the input data
-            inputs = self._tokenizer(data, return_tensors='pt', truncation=True, padding=True).to(self._device)
-
-            # Get the model's output
-            model_output = self._model(**inputs)
-
-            # Perform mean pooling on the model's output to generate sentence embeddings
-            embeddings = self._mean_pooling(model_output, inputs['attention_mask'])
+            inputs = self._tokenizer(data, return_tensors=self._return_tensors, truncation=True, padding=True)
 
-            embeddings = F.normalize(embeddings, p=2, dim=1)
-
-            return embeddings.detach().numpy()
+            return self._encode(inputs)
         except Exception as e:
             print(f"Error embedding data: {e}")
             return None
 
     def embed_batch(self, data: List[str]) -> np.array:
         """
-        Embeds the input data in batches with a progress bar.
-        
-        This method processes each sentence in the input data individually, 
-        applies the embedding model, and returns the embeddings as a numpy array.
-        A progress bar from tqdm is displayed to monitor the embedding process.
-        
+        Embeds the input data in length-bucketed batches with a progress bar.
+
+        Sentences are tokenized once, sorted by token length and grouped into buckets that fit into
+        max_batch_tokens after padding. Each bucket is run through the model in a single forward pass
+        and the embeddings are scattered back, so the output rows follow the order of the input data.
+
         :param data: List of input sentences to be embedded.
-        :return: A numpy array of sentence embeddings.
+        :return: A float32 numpy array of sentence embeddings with shape (len(data), hidden_size).
         """
-        embeddings_list = []
-        # Process each sentence individually and update the progress bar
-        for sentence in tqdm(data, desc="Embedding sentences"):
+        embeddings = np.empty((len(data), self._hidden_size), dtype=np.float32)
+        with tqdm(total=len(data), desc="Embedding sentences") as progress:
+            self._embed_into(list(data), embeddings, progress)
+        return embeddings
+
+    def embed_iter(self, data: List[str], chunk_size: int = 4096) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Streams embeddings chunk by chunk. Every chunk of chunk_size sentences is tokenized, length-bucketed
+        and embedded on its own, so memory only depends on chunk_size.
+
+        :param data: List of input sentences to be embedded.
+        :param chunk_size: Number of sentences per yielded chunk
+        :return: Iterator of (row offsets in data, float32 embeddings of these rows)
+        """
+        with tqdm(total=len(data), desc="Embedding sentences") as progress:
+            for start in range(0, len(data), chunk_size):
+                chunk = list(data[start:start + chunk_size])
+                embeddings = np.empty((len(chunk), self._hidden_size), dtype=np.float32)
+                self._embed_into(chunk, embeddings, progress)
+                yield np.arange(start, start + len(chunk)), embeddings
+
+    def _embed_into(self, data: List[str], embeddings: np.ndarray, progress: tqdm):
+        """
+        Tokenizes the sentences once without padding, runs them through the model bucket by bucket and
+        writes every bucket's embeddings into its rows of the preallocated embeddings array.
+
+        :param data: List of input sentences to be embedded.
+        :param embeddings: Array with shape (len(data), hidden_size) that receives the embeddings
+        :param progress: Progress bar that is advanced by every finished bucket
+        """
+        if len(data) == 0:
+            return
+
+        encoded = self._tokenizer(data, truncation=True)
+        lengths = np.fromiter((len(ids) for ids in encoded['input_ids']), dtype=np.int64, count=len(data))
+
+        for bucket in self._length_buckets(lengths):
             try:
-                # Tokenize the input sentence
-                inputs = self._tokenizer([sentence], return_tensors='pt', truncation=True, padding=True).to(self._device)
-                # Get the model's output
-                model_output = self._model(**inputs).last_hidden_state.cpu()
-                # Perform mean pooling on the model's output to generate sentence embeddings
-                embeddings = self._mean_pooling(model_output, inputs['attention_mask'])
-                # Normalize the embeddings
-                normalized_embeddings = F.normalize(embeddings, p=2, dim=1)
-                # Append the embeddings to the list
-                embeddings_list.append(normalized_embeddings.detach().numpy())
+                inputs = self._tokenizer.pad(
+                    {key: [encoded[key][i] for i in bucket] for key in encoded.keys()},
+                    return_tensors=self._return_tensors
+                )
+                embeddings[bucket] = self._encode(inputs)
             except Exception as e:
-                logging.debug(f"Error embedding sentence: {e}")
-                print(f"Error embedding sentence: {e}")
-                # Optionally, append None or handle the error differently
-        # Concatenate all sentence embeddings into a single numpy array
-        return np.concatenate(embeddings_list, axis=0)
+                logging.debug(f"Error embedding batch: {e}")
+                raise
+            progress.update(len(bucket))
+
+    def _encode(self, inputs) -> np.ndarray:
+        """
+        Runs one padded batch through the model and returns its L2 normalized, mean pooled embeddings.
+
+        :param inputs: Tokenizer output for the batch
+        :return: A float32 numpy array with one embedding per sentence of the batch
+        """
+        inputs = inputs.to(self._device)
+        with torch.inference_mode():
+            # Get the model's output
+            model_output = self._model(**inputs).last_hidden_state
+            # Perform mean pooling on the model's output to generate sentence embeddings
+            embeddings = self._mean_pooling(model_output, inputs['attention_mask'])
+            embeddings = F.normalize(embeddings, p=2, dim=1)
+        return embeddings.cpu().numpy()
+
+    def _length_buckets(self, lengths: np.ndarray) -> List[np.ndarray]:
+        """
+        Groups sentence positions into buckets of similar token length. Positions are sorted by length, so the
+        padded size of a bucket is the length of its last sentence times the bucket size, and a bucket is
+        closed as soon as adding the next sentence would exceed max_batch_tokens.
+        A sentence that is longer than the budget on its own still gets a bucket of its own.
+
+        :param lengths: Token counts of the sentences, in input order.
+        :return: List of arrays with original sentence positions, one array per bucket.
+        """
+        order = np.argsort(lengths, kind='stable')
+        buckets = []
+        start = 0
+        for end in range(1, len(order) + 1):
+            if end == len(order) or (end - start + 1) * lengths[order[end]] > self._max_batch_tokens:
+                buckets.append(order[start:end])
+                start = end
+        return buckets
 
     def _mean_pooling(self, model_output: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
         """
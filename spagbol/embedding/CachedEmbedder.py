@@ -0,0 +1,291 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, List
+
+import numpy as np
+
+from spagbol.embedding.Embedder import Embedder
+
+
+class CachedEmbedder(Embedder):
+    """
+    Content-addressed on-disk cache that wraps any Embedder. Only texts that are not in the cache are sent
+    to the wrapped embedder, everything else is read back from disk.
+
+    Vectors are appended to a float32 file that is read through a memory map, an index maps every key (cache key
+    of the embedder + hash of the normalized text) to its row in that file. New index entries are appended to a
+    log, which is folded into the index file once it holds more entries than that file. When the vector file
+    grows over max_bytes the least recently used entries are dropped and the file is rewritten.
+    Example usage:
+        embedder = CachedEmbedder(AllMiniLMEmbedder(), cache_dir="/var/cache/spagbol/embeddings")
+        embeddings = embedder.embed_batch(sentences)
+
+    :param embedder: Embedder that computes vectors for cache misses
+    :param cache_dir: Directory for the cache files, one subdirectory is used per cache key of the embedder, so
+                      the torch, ONNX and int8 backends of one model never share vectors
+    :param max_bytes: Size bound for the vector file, eviction shrinks it to 3/4 of this value
+    """
+
+    _INDEX_VERSION = 2
+
+    def __init__(self, embedder: Embedder, cache_dir: str, max_bytes: int = 2 * 1024 ** 3):
+        self._embedder = embedder
+        self._max_bytes = max_bytes
+        self.model_name = getattr(embedder, "model_name", type(embedder).__name__)
+        self._cache_key = embedder.cache_key
+        self._lock = threading.Lock()
+
+        key_slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", self._cache_key)
+        self._cache_dir = os.path.join(cache_dir, key_slug)
+        os.makedirs(self._cache_dir, exist_ok=True)
+        self._vectors_path = os.path.join(self._cache_dir, "vectors.f32")
+        self._index_path = os.path.join(self._cache_dir, "index.json")
+        self._log_path = os.path.join(self._cache_dir, "index.log")
+
+        self._dim = None
+        self._rows = 0
+        self._clock = 0
+        # key -> [row in the vector file, last access tick]
+        self._index: Dict[str, List[int]] = {}
+        # Number of entries in the log that are not in the index file yet
+        self._logged = 0
+        self._vectors = None
+        self._load_index()
+
+    @property
+    def cache_key(self) -> str:
+        return self._cache_key
+
+    def _init_model(self):
+        """
+        The wrapped embedder owns the model
+        """
+        return None
+
+    def _init_tokenizer(self):
+        """
+        The wrapped embedder owns the tokenizer
+        """
+        return None
+
+    def warm_up(self):
+        """
+        Loads the wrapped embedder
+        """
+        self._embedder.warm_up()
+
+    def embed(self, data: str) -> np.array:
+        """
+        Embeds a single text, reading it from the cache when possible
+        :param data: Input data to be embedded
+        :return: Embedded data with shape (1, dim)
+        """
+        return self.embed_batch([data])
+
+    def embed_batch(self, data: List[str]) -> np.array:
+        """
+        Embeds a list of texts. Cached vectors are read from disk, the remaining unique texts are embedded
+        by the wrapped embedder in a single embed_batch call and appended to the cache.
+
+        :param data: List of input sentences to be embedded.
+        :return: A float32 numpy array of embeddings in the order of the input data.
+        """
+        keys = [self._key(text) for text in data]
+
+        with self._lock:
+            self._clock += 1
+            hit_positions, hit_rows, miss_keys, miss_texts = [], [], {}, []
+            for position, key in enumerate(keys):
+                entry = self._index.get(key)
+                if entry is not None:
+                    entry[1] = self._clock
+                    hit_positions.append(position)
+                    hit_rows.append(entry[0])
+                elif key not in miss_keys:
+                    miss_keys[key] = len(miss_texts)
+                    miss_texts.append(data[position])
+            cached = self._read_rows(hit_rows)
+
+        logging.debug(f"Embedding cache: {len(hit_positions)} hits, {len(miss_texts)} misses")
+
+        computed = None
+        if miss_texts:
+            computed = np.ascontiguousarray(self._embedder.embed_batch(miss_texts), dtype=np.float32)
+
+        dim = computed.shape[1] if computed is not None else cached.shape[1] if len(cached) else self._dim
+        embeddings = np.empty((len(data), dim or 0), dtype=np.float32)
+        if hit_positions:
+            embeddings[hit_positions] = cached
+        if computed is not None:
+            miss_positions = [position for position, key in enumerate(keys) if key in miss_keys]
+            embeddings[miss_positions] = computed[[miss_keys[keys[position]] for position in miss_positions]]
+            with self._lock:
+                self._append(list(miss_keys.keys()), computed)
+
+        return embeddings
+
+    def clear(self):
+        """
+        Removes every cached vector
+        """
+        with self._lock:
+            self._index = {}
+            self._rows = 0
+            self._dim = None
+            self._vectors = None
+            if os.path.exists(self._vectors_path):
+                os.remove(self._vectors_path)
+            self._save_index()
+
+    def _key(self, text: str) -> str:
+        """
+        Cache key for a text. Unicode is NFC normalized and whitespace runs are collapsed, which doesn't change
+        the tokens the model sees.
+        """
+        normalized = " ".join(unicodedata.normalize("NFC", str(text)).split())
+        digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=20)
+        digest.update(b"\0" + self._cache_key.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _read_rows(self, rows: List[int]) -> np.ndarray:
+        """
+        Gathers rows from the memory mapped vector file
+        """
+        if not rows:
+            return np.empty((0, self._dim or 0), dtype=np.float32)
+        if self._vectors is None or self._vectors.shape[0] != self._rows:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self._dim))
+        return np.asarray(self._vectors[rows])
+
+    def _append(self, keys: List[str], vectors: np.ndarray):
+        """
+        Appends new vectors to the end of the vector file and registers them in the index. Keys that another
+        call appended since the lookup are skipped.
+        """
+        new_positions = [position for position, key in enumerate(keys) if key not in self._index]
+        if not new_positions:
+            return
+        if len(new_positions) < len(keys):
+            keys = [keys[position] for position in new_positions]
+            vectors = vectors[new_positions]
+        if self._dim is None:
+            self._dim = vectors.shape[1]
+        # Rows past the indexed end (e.g. left by an interrupted write) are overwritten
+        with open(self._vectors_path, "r+b" if os.path.exists(self._vectors_path) else "wb") as vectors_file:
+            vectors_file.seek(self._rows * self._dim * 4)
+            vectors_file.write(vectors.tobytes())
+            vectors_file.truncate()
+        entries = [[key, self._rows + offset, self._clock] for offset, key in enumerate(keys)]
+        for key, row, tick in entries:
+            self._index[key] = [row, tick]
+        self._rows += len(keys)
+
+        logged = self._logged + len(entries)
+        if self._rows * self._dim * 4 > self._max_bytes:
+            self._evict()
+            self._save_index()
+        elif logged > max(len(self._index) - logged, 1024):
+            self._save_index()
+        else:
+            # One line per call, a line torn by an interrupted write is skipped on load
+            with open(self._log_path, "a") as log_file:
+                log_file.write(json.dumps({"dim": self._dim, "entries": entries}) + "\n")
+            self._logged = logged
+
+    def _evict(self):
+        """
+        Keeps the most recently used entries that fit into 3/4 of max_bytes and rewrites the vector file
+        """
+        keep_rows = max(int(self._max_bytes * 0.75) // (self._dim * 4), 0)
+        survivors = sorted(self._index.items(), key=lambda item: item[1][1], reverse=True)[:keep_rows]
+        survivors.sort(key=lambda item: item[1][0])
+        logging.debug(f"Embedding cache: evicting {len(self._index) - len(survivors)} entries")
+
+        vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self._dim))
+        tmp_path = self._vectors_path + ".tmp"
+        with open(tmp_path, "wb") as vectors_file:
+            for start in range(0, len(survivors), 65536):
+                rows = [entry[0] for _, entry in survivors[start:start + 65536]]
+                vectors_file.write(np.ascontiguousarray(vectors[rows]).tobytes())
+        del vectors
+        self._vectors = None
+        os.replace(tmp_path, self._vectors_path)
+
+        self._index = {key: [row, entry[1]] for row, (key, entry) in enumerate(survivors)}
+        self._rows = len(survivors)
+
+    def _load_index(self):
+        """
+        Loads the index from disk and replays the log on top of it. A mismatching index resets the cache.
+        """
+        try:
+            if os.path.exists(self._index_path):
+                with open(self._index_path) as index_file:
+                    state = json.load(index_file)
+                if state["version"] != self._INDEX_VERSION or state["cache_key"] != self._cache_key:
+                    raise ValueError("Embedding cache index belongs to a different version or cache key")
+                self._dim = state["dim"]
+                self._rows = state["rows"]
+                self._clock = state["clock"]
+                self._index = state["entries"]
+            self._replay_log()
+            if self._dim is not None and os.path.getsize(self._vectors_path) < self._rows * self._dim * 4:
+                raise ValueError("Embedding cache vector file is shorter than its index")
+        except (OSError, ValueError, KeyError) as e:
+            logging.debug(f"Discarding embedding cache at {self._cache_dir}: {e}")
+            self._index, self._rows, self._dim, self._clock, self._logged = {}, 0, None, 0, 0
+            for path in (self._vectors_path, self._log_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _replay_log(self):
+        """
+        Registers the entries of the log in the index, up to the first incomplete line. The index is written
+        again after an incomplete line, so later entries aren't appended behind it.
+        """
+        if not os.path.exists(self._log_path):
+            return
+        torn = False
+        with open(self._log_path) as log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    torn = True
+                    break
+                self._dim = record["dim"]
+                for key, row, tick in record["entries"]:
+                    self._index[key] = [row, tick]
+                    self._rows = max(self._rows, row + 1)
+                    self._clock = max(self._clock, tick)
+                self._logged += len(record["entries"])
+        if torn:
+            self._save_index()
+
+    def _save_index(self):
+        """
+        Atomically writes the index next to the vector file and empties the log, which the index now contains
+        """
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as index_file:
+            json.dump({"version": self._INDEX_VERSION, "cache_key": self._cache_key, "dim": self._dim,
+                       "rows": self._rows, "clock": self._clock, "entries": self._index}, index_file)
+        os.replace(tmp_path, self._index_path)
+        if os.path.exists(self._log_path):
+            os.remove(self._log_path)
+        self._logged = 0
@@ -0,0 +1,174 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from spagbol.embedding.Embedder import Embedder
+
+
+class CoalescingEmbedder(Embedder):
+    """
+    Embedder that coalesces concurrent single-text embed calls into padded batches. Calls are queued and a
+    background thread collects them for up to max_wait_ms or until max_batch_size texts are waiting, runs one
+    embed_batch on the wrapped embedder and hands every caller its own row.
+    embed_batch and embed_iter calls are already batched and go straight to the wrapped embedder.
+    Example usage:
+        embedder = CoalescingEmbedder(AllMiniLMEmbedder(), max_batch_size=32, max_wait_ms=5)
+        embedding = embedder.embed(text)  # From any number of request threads
+        print(embedder.metrics())
+
+    :param embedder: Embedder that computes the batches
+    :param max_batch_size: Maximum number of texts in one coalesced batch
+    :param max_wait_ms: How long the first queued text waits for others to join its batch
+    """
+
+    def __init__(self, embedder: Embedder, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self._embedder = embedder
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self.model_name = getattr(embedder, "model_name", type(embedder).__name__)
+        self._cache_key = embedder.cache_key
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        self._metrics_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._requests = 0
+        self._max_queue_depth = 0
+
+    @property
+    def cache_key(self) -> str:
+        return self._cache_key
+
+    def _init_model(self):
+        """
+        The wrapped embedder owns the model
+        """
+        return None
+
+    def _init_tokenizer(self):
+        """
+        The wrapped embedder owns the tokenizer
+        """
+        return None
+
+    def warm_up(self):
+        """
+        Loads the wrapped embedder
+        """
+        self._embedder.warm_up()
+
+    def embed(self, data: str) -> np.array:
+        """
+        Queues the text for the next coalesced batch and waits for its embedding
+        :param data: Input data to be embedded
+        :return: Embedded data with shape (1, dim)
+        """
+        future = Future()
+        self._queue.put((data, future))
+        with self._metrics_lock:
+            self._requests += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        self._ensure_worker()
+        return future.result()
+
+    def embed_batch(self, data: List[str]) -> np.array:
+        """
+        Embeds an already batched input with the wrapped embedder
+        :param data: Input data to be embedded
+        :return: Embedded data
+        """
+        return self._embedder.embed_batch(data)
+
+    def embed_iter(self, data: List[str], chunk_size: int = 4096) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Streams embeddings from the wrapped embedder
+        :param data: Input data to be embedded
+        :param chunk_size: Number of texts per yielded chunk
+        :return: Iterator of (row offsets in data, float32 embeddings of these rows)
+        """
+        return self._embedder.embed_iter(data, chunk_size)
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Returns queue and batching statistics: current and maximum queue depth, number of embed requests and
+        batches, and the distribution of coalesced batch sizes.
+        """
+        with self._metrics_lock:
+            batches = sum(self._batch_sizes.values())
+            batched_requests = sum(size * count for size, count in self._batch_sizes.items())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "requests": self._requests,
+                "batches": batches,
+                "mean_batch_size": batched_requests / batches if batches else 0.0,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+            }
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-coalescer", daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self) -> list:
+        """
+        Blocks for the first queued text, then gathers more until the batch is full or max_wait_ms has passed
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self._embedder.embed_batch(texts)
+            except Exception as e:
+                logging.debug(f"Coalesced embedding batch of {len(batch)} failed, embedding its texts one by one: {e}")
+                self._run_one_by_one(batch)
+                continue
+
+            with self._metrics_lock:
+                self._batch_sizes[len(batch)] += 1
+            for position, (_, future) in enumerate(batch):
+                future.set_result(embeddings[position:position + 1])
+
+    def _run_one_by_one(self, batch: list):
+        """
+        Embeds the texts of a failed batch separately, so only the callers whose text fails get the exception
+        """
+        for text, future in batch:
+            try:
+                future.set_result(self._embedder.embed_batch([text]))
+            except Exception as e:
+                future.set_exception(e)
+        with self._metrics_lock:
+            self._batch_sizes[1] += len(batch)
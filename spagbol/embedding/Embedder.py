@@ -9,6 +9,7 @@ You should have received a copy of the GNU Affero General Public License along w
 """
 
 from abc import ABC, abstractmethod
+from typing import Iterator, Tuple
 import numpy as np
 
 class Embedder(ABC):
@@ -56,4 +57,30 @@ class Embedder(ABC):
         """
         raise NotImplementedError()
 
-    
\ No newline at end of file
+    @property
+    def cache_key(self) -> str:
+        """
+        Identity of the vectors this embedder produces, which caches of its vectors are keyed on. It is the model
+        name by default, embedders whose vectors also depend on the runtime or quantization include those.
+        """
+        return getattr(self, "model_name", type(self).__name__)
+
+    def warm_up(self):
+        """
+        Loads everything the embedder needs before the first request, so a server can preload models before it
+        accepts traffic. Embedders that load lazily should override this method, by default it does nothing.
+        """
+        pass
+
+    def embed_iter(self, data: list[str], chunk_size: int = 4096) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Streams embeddings of the input data in chunks, so callers can write them straight into their
+        destination instead of holding every intermediate result. Embedders that can do better than
+        calling embed_batch chunk by chunk should override this method.
+        :param data: Input data to be embedded
+        :param chunk_size: Number of texts per yielded chunk
+        :return: Iterator of (row offsets in data, float32 embeddings of these rows)
+        """
+        for start in range(0, len(data), chunk_size):
+            embeddings = np.asarray(self.embed_batch(data[start:start + chunk_size]), dtype=np.float32)
+            yield np.arange(start, start + len(embeddings)), embeddings
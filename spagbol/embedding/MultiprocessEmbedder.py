@@ -0,0 +1,170 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from spagbol.embedding.Embedder import Embedder
+
+# Embedder instance owned by a worker process, created once by _init_worker
+_worker_embedder: Optional[Embedder] = None
+
+
+def _init_worker(embedder_class: type, embedder_kwargs: dict, threads_per_worker: int):
+    """
+    Pins the torch thread pools of the worker and loads its embedder
+    """
+    global _worker_embedder
+    import torch
+
+    torch.set_num_threads(threads_per_worker)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Inter-op pool was already started, intra-op pinning is what matters here
+        pass
+    _worker_embedder = embedder_class(**embedder_kwargs)
+    _worker_embedder.warm_up()
+
+
+def _worker_pid(_) -> int:
+    return os.getpid()
+
+
+def _embed_shard(shard: List[str]) -> np.ndarray:
+    return np.ascontiguousarray(_worker_embedder.embed_batch(shard), dtype=np.float32)
+
+
+class MultiprocessEmbedder(Embedder):
+    """
+    Embedder that shards embed_batch inputs across a pool of worker processes, for CPU-only hosts where a
+    single process can't use all cores. Every worker loads its own embedder once and pins its torch thread
+    count to threads_per_worker, so workers * threads_per_worker never oversubscribes the machine.
+    The pool is started on first use and uses the spawn start method, which is safe with torch.
+    Example usage:
+        embedder = MultiprocessEmbedder(AllMiniLMEmbedder, workers=8)
+        embeddings = embedder.embed_batch(sentences)
+        embedder.close()
+
+    :param embedder_class: Embedder class instantiated in every worker, it has to be importable by the workers
+    :param embedder_kwargs: Keyword arguments for the embedder_class constructor
+    :param workers: Number of worker processes, all CPU cores by default
+    :param threads_per_worker: Torch threads per worker, cores are split evenly between workers by default
+    :param shard_size: Number of texts sent to a worker at once
+    """
+
+    def __init__(self, embedder_class: type, embedder_kwargs: Optional[dict] = None, workers: Optional[int] = None,
+                 threads_per_worker: Optional[int] = None, shard_size: int = 1024):
+        cpu_count = os.cpu_count() or 1
+        self._embedder_class = embedder_class
+        self._embedder_kwargs = embedder_kwargs or {}
+        self._workers = workers or cpu_count
+        self._threads_per_worker = threads_per_worker or max(cpu_count // self._workers, 1)
+        self._shard_size = shard_size
+        self.model_name = getattr(embedder_class, "model_name", embedder_class.__name__)
+        # Embedders load their models lazily, so an instance in this process only costs its constructor
+        self._cache_key = embedder_class(**self._embedder_kwargs).cache_key
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def cache_key(self) -> str:
+        return self._cache_key
+
+    def _init_model(self):
+        """
+        Models are loaded inside the worker processes, see _init_worker
+        """
+        return None
+
+    def _init_tokenizer(self):
+        """
+        Tokenizers are loaded inside the worker processes, see _init_worker
+        """
+        return None
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                logging.debug(f"Starting {self._workers} embedding workers with "
+                              f"{self._threads_per_worker} threads each")
+                self._pool = multiprocessing.get_context("spawn").Pool(
+                    processes=self._workers,
+                    initializer=_init_worker,
+                    initargs=(self._embedder_class, self._embedder_kwargs, self._threads_per_worker)
+                )
+            return self._pool
+
+    def warm_up(self):
+        """
+        Starts the worker processes and waits until they have loaded their models
+        """
+        self._get_pool().map(_worker_pid, range(self._workers), chunksize=1)
+
+    def embed(self, data: str) -> np.array:
+        """
+        Embeds a single text in one of the workers
+        :param data: Input data to be embedded
+        :return: Embedded data with shape (1, dim)
+        """
+        return self._get_pool().apply(_embed_shard, ([data],))
+
+    def embed_batch(self, data: List[str]) -> np.array:
+        """
+        Splits the data into shards, embeds them in the worker pool and collects the results in input order.
+
+        :param data: List of input sentences to be embedded.
+        :return: A float32 numpy array of sentence embeddings.
+        """
+        embeddings = None
+        for rows, block in self.embed_iter(data, self._shard_size):
+            if embeddings is None:
+                embeddings = np.empty((len(data), block.shape[1]), dtype=np.float32)
+            embeddings[rows] = block
+        if embeddings is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return embeddings
+
+    def embed_iter(self, data: List[str], chunk_size: int = 1024) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Sends chunks of texts to the workers and yields each chunk as soon as it and every chunk before it
+        are done. Chunks are capped at shard_size so that all workers get a share of the data.
+
+        :param data: List of input sentences to be embedded.
+        :param chunk_size: Maximum number of texts sent to a worker at once
+        :return: Iterator of (row offsets in data, float32 embeddings of these rows)
+        """
+        data = list(data)
+        chunk_size = min(chunk_size, self._shard_size)
+        offsets = range(0, len(data), chunk_size)
+        shards = (data[start:start + chunk_size] for start in offsets)
+        for start, block in zip(offsets, self._get_pool().imap(_embed_shard, shards)):
+            yield np.arange(start, start + len(block)), block
+
+    def close(self):
+        """
+        Stops the worker processes
+        """
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
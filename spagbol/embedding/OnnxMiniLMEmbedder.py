@@ -0,0 +1,140 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+from transformers import AutoConfig, AutoModel, AutoTokenizer
+
+from spagbol.embedding.AllMiniLMEmbedder import AllMiniLMEmbedder
+
+
+class OnnxMiniLMEmbedder(AllMiniLMEmbedder):
+    """
+    CPU embedder for all-MiniLM-L6-v2 that runs the model with ONNX Runtime instead of PyTorch.
+    The model is exported once to a local ONNX file and, when quantize is set, converted to dynamic int8.
+    Pooling and normalization are the same as in AllMiniLMEmbedder, so both backends produce
+    interchangeable vectors (see benchmarks/onnx_backend.py for the agreement check).
+    Requires the optional onnxruntime and onnx packages, see requirements-onnx.txt. Like AllMiniLMEmbedder, the
+    session is created on first use or by warm_up.
+    Example usage:
+        embedder = OnnxMiniLMEmbedder(quantize=True)
+        embeddings = embedder.embed_batch(sentences)
+
+    :param onnx_dir: Directory for the exported models, ~/.cache/spagbol/onnx by default
+    :param quantize: Whether to run the dynamic int8 quantized model
+    :param max_batch_tokens: Upper bound for the padded token count of one forward pass in embed_batch
+    :param threads: ONNX Runtime intra-op threads, ONNX Runtime picks a value when not set
+    """
+
+    _return_tensors = 'np'
+
+    def __init__(self, onnx_dir: Optional[str] = None, quantize: bool = False, max_batch_tokens: int = 8192,
+                 threads: Optional[int] = None):
+        self._max_batch_tokens = max_batch_tokens
+        self._onnx_dir = onnx_dir or os.path.join(os.path.expanduser("~"), ".cache", "spagbol", "onnx")
+        self._quantize = quantize
+        self._threads = threads
+        self._device = "cpu"
+        self._components = None
+        self._components_lock = threading.Lock()
+
+    @property
+    def cache_key(self) -> str:
+        """
+        The model name plus the runtime and quantization, ONNX and int8 vectors differ slightly from torch ones
+        """
+        return f"{self.model_name}-onnx{'-int8' if self._quantize else ''}"
+
+    @property
+    def onnx_path(self) -> str:
+        """
+        Path of the ONNX file this embedder runs
+        """
+        model_slug = self.model_name.split("/")[-1]
+        return os.path.join(self._onnx_dir, f"{model_slug}{'.int8' if self._quantize else ''}.onnx")
+
+    def _load(self):
+        """
+        Exports the model if needed and opens the ONNX Runtime session and the tokenizer
+        :return: Tuple of session, tokenizer and the size of the embeddings
+        """
+        return self._init_model(), self._init_tokenizer(), AutoConfig.from_pretrained(self.model_name).hidden_size
+
+    def _init_model(self):
+        """
+        Exports the model if there is no ONNX file yet and opens an ONNX Runtime session for it
+        """
+        import onnxruntime as ort
+
+        fp32_path = os.path.join(self._onnx_dir, f"{self.model_name.split('/')[-1]}.onnx")
+        if not os.path.exists(fp32_path):
+            self._export(fp32_path)
+        if self._quantize and not os.path.exists(self.onnx_path):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            logging.debug(f"Quantizing {fp32_path} to {self.onnx_path}")
+            quantize_dynamic(fp32_path, self.onnx_path, weight_type=QuantType.QInt8)
+
+        options = ort.SessionOptions()
+        if self._threads is not None:
+            options.intra_op_num_threads = self._threads
+        return ort.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+
+    def _init_tokenizer(self):
+        """
+        This method initializes the tokenizer
+        """
+        return AutoTokenizer.from_pretrained(self.model_name)
+
+    def _export(self, path: str):
+        """
+        Exports the PyTorch model to ONNX with dynamic batch and sequence axes
+        """
+        import torch
+
+        logging.debug(f"Exporting {self.model_name} to {path}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        model = AutoModel.from_pretrained(self.model_name).eval()
+        sample = AutoTokenizer.from_pretrained(self.model_name)(["export sample"], return_tensors="pt")
+        dynamic_axes = {"batch": 0, "sequence": 1}
+        tmp_path = path + ".tmp"
+        with torch.inference_mode():
+            torch.onnx.export(
+                model,
+                (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+                tmp_path,
+                input_names=["input_ids", "attention_mask", "token_type_ids"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={"input_ids": dynamic_axes, "attention_mask": dynamic_axes,
+                              "token_type_ids": dynamic_axes, "last_hidden_state": dynamic_axes},
+                opset_version=14,
+            )
+        os.replace(tmp_path, path)
+
+    def _encode(self, inputs) -> np.ndarray:
+        """
+        Runs one padded batch through the ONNX session and applies the same mean pooling and
+        L2 normalization as AllMiniLMEmbedder._mean_pooling and F.normalize.
+
+        :param inputs: Tokenizer output for the batch as numpy arrays
+        :return: A float32 numpy array with one embedding per sentence of the batch
+        """
+        feed = {model_input.name: np.asarray(inputs[model_input.name], dtype=np.int64)
+                for model_input in self._model.get_inputs()}
+        token_embeddings = self._model.run(["last_hidden_state"], feed)[0]
+
+        mask = feed["attention_mask"][..., np.newaxis].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
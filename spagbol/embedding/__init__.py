@@ -1,2 +1,11 @@
 from .Embedder import Embedder
-from .AllMiniLMEmbedder import AllMiniLMEmbedder
+from spagbol._lazy import install_lazy_exports
+
+# Implementations are imported on first use, so importing the package doesn't load torch or transformers
+install_lazy_exports(__name__, {
+    "AllMiniLMEmbedder": "AllMiniLMEmbedder",
+    "CachedEmbedder": "CachedEmbedder",
+    "MultiprocessEmbedder": "MultiprocessEmbedder",
+    "OnnxMiniLMEmbedder": "OnnxMiniLMEmbedder",
+    "CoalescingEmbedder": "CoalescingEmbedder",
+})
@@ -1,3 +1,4 @@
 from .loader import InvalidSourceError
 from .reduction import UnfitModelError
-from .spagbol import NoDatasetError, ClusteringError
+from .spagbol import NoDatasetError, ClusteringError, DataPointNotFoundError
+from .storage import WorkspaceError
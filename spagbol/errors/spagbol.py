@@ -28,4 +28,15 @@ class ClusteringError(Exception):
         self.msg = msg
 
     def __str__(self):
-        return self.msg
\ No newline at end of file
+        return self.msg
+
+
+class DataPointNotFoundError(Exception):
+    """
+    Error for Spagbol module operations on a data point id that doesn't exist or was deleted
+    """
+    def __init__(self, msg: str):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
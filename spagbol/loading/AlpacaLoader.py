@@ -12,13 +12,19 @@ import pandas as pd
 from pandas.errors import ParserError
 from urllib.error import HTTPError
 from validators import url as is_valid_url
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import glob
+import itertools
+import json
 import os
-from datasets import load_dataset
 import numpy as np
 
 import logging
 
-from spagbol.loading import DataLoader
+from spagbol.loading import DataLoader, SourceFormat, SourceCache
 from spagbol.errors import InvalidSourceError
 
 
@@ -26,7 +32,10 @@ class AlpacaLoader(DataLoader):
     """
     Data loader for Alpaca dataset. Supports both base and clean version of the dataset.
     You can load the dataset from file with load_dataset method,
-    url or Huggigface Hub, for file and URL only CSV and JSON are supported.
+    url or Huggigface Hub, for file and URL CSV, JSON, JSONL and Parquet are supported, optionally compressed
+    with gzip, zstd, bz2 or xz. The format is detected from magic bytes and the extension, see SourceFormat.
+    Sources can also be streamed in converted chunks with iter_chunks, which only keeps one chunk of the raw
+    file in memory and reads just the instruction, input and output columns.
     Example usages:
         For local CSV/JSON file:
             loader = AlpacaLoader(source="/path/to/alpaca.csv")
@@ -37,12 +46,32 @@ class AlpacaLoader(DataLoader):
         For Huggigface Hub:
             loader = AlpacaLoader(source="tatsu-lab/alpaca") # Or you can use any other alpaca from the hub
             dataset = loader.load_data(split=preferred_dataset_part) # 'train' is used as a default split value
+        For large files:
+            loader = AlpacaLoader(source="/path/to/alpaca.jsonl")
+            for chunk in loader.iter_chunks(chunk_size=50_000):
+                ...
+        For sharded datasets, shards are parsed in parallel and concatenated in sorted path order:
+            loader = AlpacaLoader(source="/path/to/train-*-of-00512.parquet", workers=8)
+            dataset = loader.load_data()
+        With a cache of converted datasets, repeated loads of an unchanged source skip parsing:
+            loader = AlpacaLoader(source="/path/to/alpaca.json", cache=SourceCache("/var/cache/spagbol/sources"))
+            dataset = loader.load_data()
 
-    :param source: Source of the dataset. Supported sources: URL, absolute path and huggingface hub.
+    :param source: Source of the dataset. Supported sources: URL, absolute path, directory or glob of shards
+                   and huggingface hub.
+    :param workers: Number of processes parsing shards, defaults to the number of CPUs
+    :param cache: Optional cache for converted datasets
     """
 
-    def __init__(self, source: str):
+    # Raw columns used by _convert_dataset, everything else is dropped while reading
+    TEXT_COLUMNS = ["instruction", "input", "output"]
+    # Has to be bumped whenever _convert_dataset changes its output, so cached datasets are not reused
+    CONVERSION_VERSION = 1
+
+    def __init__(self, source: str, workers: Optional[int] = None, cache: Optional[SourceCache] = None):
         self.source = source
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache
 
     def load_data(self, split=None) -> pd.DataFrame:
         """
@@ -52,69 +81,264 @@ class AlpacaLoader(DataLoader):
         :return: Loaded and converted dataset. You can see conversion process in _convert_dataset method.
         :raises InvalidSourceError:
         """
-        if is_valid_url(self.source):
-            logging.debug("loading from json")
+        key = self._cache_key(split)
+        if key is not None:
+            dataset = self.cache.get(key)
+            if dataset is not None:
+                logging.debug(f"loaded {self.source} from the source cache")
+                return dataset
+        chunks = list(self._iter_source_chunks(100_000, split))
+        if not chunks:
+            dataset = self._convert_dataset(pd.DataFrame(columns=self.TEXT_COLUMNS))
+        else:
+            dataset = pd.concat(chunks, ignore_index=True)
+        if key is not None:
+            self.cache.put(key, self.source, dataset)
+        return dataset
+
+    def iter_chunks(self, chunk_size: int = 100_000, split=None) -> Iterator[pd.DataFrame]:
+        """
+        Streams the dataset from the source as converted chunks. JSONL is read line by line, JSON arrays are
+        parsed incrementally and CSV is read with pandas chunksize, all projected to TEXT_COLUMNS.
+        With a source cache, a cached dataset is served in chunks; otherwise the converted chunks are kept until
+        the stream is exhausted and then cached together.
+        :param chunk_size: Maximal number of rows per chunk
+        :param split: Optional parameter for loading from Hugginface Hub to select a part of dataset to load.
+                      'train' is selected by default.
+        :return: Iterator over converted chunks with consecutive ids
+        :raises InvalidSourceError:
+        """
+        key = self._cache_key(split)
+        dataset = self.cache.get(key) if key is not None else None
+        if dataset is not None:
+            for start in range(0, len(dataset), chunk_size):
+                yield dataset.iloc[start:start + chunk_size]
+            return
+        if key is None:
+            yield from self._iter_source_chunks(chunk_size, split)
+            return
+        chunks = []
+        for chunk in self._iter_source_chunks(chunk_size, split):
+            chunks.append(chunk)
+            yield chunk
+        if chunks:
+            self.cache.put(key, self.source, pd.concat(chunks, ignore_index=True))
+
+    def _iter_source_chunks(self, chunk_size: int, split) -> Iterator[pd.DataFrame]:
+        shards = self._shard_paths()
+        if shards is not None:
+            yield from self._iter_shard_chunks(shards, chunk_size)
+            return
+        first_id = 0
+        for chunk in self._iter_raw_chunks(chunk_size, split):
+            converted = self._convert_dataset(self._project(chunk), first_id=first_id)
+            first_id += len(converted)
+            yield converted
+
+    def _cache_key(self, split) -> Optional[str]:
+        if self.cache is None:
+            return None
+        paths = self._shard_paths()
+        if paths is None and os.path.isfile(self.source):
+            paths = [self.source]
+        return self.cache.key(self.source, f"{type(self).__name__}:{self.CONVERSION_VERSION}", split=split,
+                              paths=paths)
+
+    def _shard_paths(self) -> Optional[List[str]]:
+        """
+        :return: Sorted shard paths if the source is a directory or a glob, None for single sources
+        :raises InvalidSourceError: If no shard matches
+        """
+        if os.path.isdir(self.source):
+            extensions = set(SourceFormat.FORMAT_EXTENSIONS) | set(SourceFormat.COMPRESSION_EXTENSIONS)
+            # Marker files like _SUCCESS or .DS_Store are not shards
+            paths = [entry.path for entry in os.scandir(self.source)
+                     if entry.is_file() and not entry.name.startswith((".", "_"))
+                     and os.path.splitext(entry.name)[1].lower() in extensions]
+        elif glob.has_magic(self.source) and not is_valid_url(self.source):
+            paths = [path for path in glob.glob(self.source) if os.path.isfile(path)]
+        else:
+            return None
+        if not paths:
+            raise InvalidSourceError(f"No dataset shards found in {self.source}")
+        return sorted(paths)
+
+    def _iter_shard_chunks(self, shards: List[str], chunk_size: int) -> Iterator[pd.DataFrame]:
+        """
+        Parses and converts shards in a process pool. At most two shards per worker are in flight, results are
+        yielded in shard order and ids are offset to stay globally unique.
+        """
+        first_id = 0
+        for shard in self._map_shards(shards):
+            shard["id"] += first_id
+            first_id += len(shard)
+            for start in range(0, len(shard), chunk_size):
+                yield shard.iloc[start:start + chunk_size]
+
+    def _map_shards(self, shards: List[str]) -> Iterator[pd.DataFrame]:
+        workers = min(self.workers, len(shards))
+        if workers == 1:
+            yield from map(_load_shard, shards)
+            return
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as executor:
+            remaining = iter(shards)
+            pending = deque(executor.submit(_load_shard, path) for path in itertools.islice(remaining, 2 * workers))
+            while pending:
+                shard = pending.popleft().result()
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    pending.append(executor.submit(_load_shard, next_path))
+                yield shard
+
+    def _iter_raw_chunks(self, chunk_size: int, split) -> Iterator[pd.DataFrame]:
+        if is_valid_url(self.source) or os.path.exists(self.source):
             try:
-                if ".json" in self.source:
-                    dataset = pd.read_json(self.source)
-                else:
-                    dataset = pd.read_csv(self.source)
+                yield from self._iter_file_chunks(chunk_size)
             except ParserError:
+                logging.debug("Couldn't parse file from path or URL. Maybe it has a wrong format.")
                 raise InvalidSourceError("Couldn't parse file from path or URL. Maybe it has a wrong format.")
             except HTTPError:
                 raise InvalidSourceError(
                     "Couldn't reach this source URL, it may have a protected access or is inactive."
                 )
-        elif os.path.exists(self.source):
-            logging.debug("os path exists")
-            try:
-                if ".json" in self.source:
-                    dataset = pd.read_json(self.source)
-                else:
-                    logging.debug("reading a csv")
-                    logging.debug(f'csv file location is, {self.source}')
-
-                    dataset = pd.read_csv(self.source)
-                
-            except ParserError:
-                logging.debug("Couldn't parse file from path or URL. Maybe it has a wrong format.")
-                raise InvalidSourceError("Couldn't parse file from path or URL. Maybe it has a wrong format.")
+            except (OSError, EOFError) as e:
+                raise InvalidSourceError(f"Couldn't read or decompress the source: {e}")
             except UnicodeDecodeError:
                 logging.debug("Encountered UnicodeDecode error while parsing the file. Maybe it has a wrong format.")
                 raise InvalidSourceError(
                     "Encountered UnicodeDecode error while parsing the file. Maybe it has a wrong format."
                 )
+            except ValueError as e:
+                raise InvalidSourceError(f"Couldn't parse file from path or URL: {e}")
         else:
             logging.debug("attempting huggingface dataset download")
             try:
                 dataset_split = "train"
                 if split is not None:
                     dataset_split = split
-                huggingface_dataset = load_dataset(self.source, split=split)
-                dataset = pd.DataFrame(huggingface_dataset[dataset_split])
+                # datasets is slow to import, so it is only loaded for hub sources
+                from datasets import load_dataset
+
+                # Hub datasets are memory-mapped Arrow tables, batches are read from the cache on demand
+                huggingface_dataset = load_dataset(self.source, split=dataset_split)
+                columns = [column for column in self.TEXT_COLUMNS if column in huggingface_dataset.column_names]
+                huggingface_dataset = huggingface_dataset.select_columns(columns)
+                for batch in huggingface_dataset.iter(batch_size=chunk_size):
+                    yield pd.DataFrame(batch)
             except FileNotFoundError:
                 raise InvalidSourceError("Source is not a valid url, path or huggingface hub dataset")
             except ValueError as e:
                 raise InvalidSourceError(e.__str__())
 
-        return self._convert_dataset(dataset)
+    def _iter_file_chunks(self, chunk_size: int) -> Iterator[pd.DataFrame]:
+        source_format = SourceFormat.detect(self.source)
+        logging.debug(f"reading {source_format}")
+        if source_format.data_format == "parquet":
+            parquet_file = source_format.open_parquet()
+            # Only the text columns are read, one row group range at a time
+            columns = [column for column in self.TEXT_COLUMNS if column in parquet_file.schema_arrow.names]
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+                yield batch.to_pandas()
+        elif source_format.data_format == "csv":
+            with source_format.open_binary() as stream, \
+                    pd.read_csv(stream, chunksize=chunk_size,
+                                usecols=lambda column: column in self.TEXT_COLUMNS) as reader:
+                yield from reader
+        elif source_format.data_format == "jsonl":
+            with source_format.open_text() as stream, \
+                    pd.read_json(stream, lines=True, chunksize=chunk_size, dtype=False) as reader:
+                yield from reader
+        else:
+            with source_format.open_text() as stream:
+                for records in self._iter_json_array(stream, chunk_size):
+                    yield pd.DataFrame.from_records(records, columns=self.TEXT_COLUMNS)
+
+    def _iter_json_array(self, stream: TextIO, chunk_size: int,
+                         read_size: int = 1 << 20) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Incrementally parses a JSON array of records, reading the stream in blocks of read_size characters.
+
+        :param stream: Text stream with the JSON array
+        :param chunk_size: Maximal number of records per yielded list
+        :param read_size: Number of characters read at once
+        :return: Iterator over lists of records projected to TEXT_COLUMNS
+        :raises ValueError: If the stream isn't a JSON array of objects
+        """
+        decoder = json.JSONDecoder()
+        buffer = ""
+        started = finished = False
+        records = []
+        for block in iter(lambda: stream.read(read_size), ""):
+            buffer += block
+            if not started:
+                buffer = buffer.lstrip()
+                if not buffer:
+                    continue
+                if buffer[0] != "[":
+                    raise ValueError("Expected a JSON array")
+                buffer = buffer[1:]
+                started = True
+            position = 0
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position == len(buffer):
+                    break
+                if buffer[position] == "]":
+                    finished = True
+                    break
+                try:
+                    record, position_end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # The record continues in the next block
+                    break
+                if not isinstance(record, dict):
+                    raise ValueError("Expected a JSON array of objects")
+                records.append({column: record.get(column) for column in self.TEXT_COLUMNS})
+                position = position_end
+                if len(records) == chunk_size:
+                    yield records
+                    records = []
+            buffer = buffer[position:]
+            if finished:
+                break
+        if not finished:
+            raise ValueError("JSON array is truncated or malformed")
+        if records:
+            yield records
+
+    def _project(self, dataset: pd.DataFrame) -> pd.DataFrame:
+        """
+        Keeps only TEXT_COLUMNS, adding missing ones as empty
+        """
+        return dataset.reindex(columns=self.TEXT_COLUMNS)
 
-    def _convert_dataset(self, dataset: pd.DataFrame) -> pd.DataFrame:
+    def _convert_dataset(self, dataset: pd.DataFrame, first_id: int = 0) -> pd.DataFrame:
         """
         Converts Alpaca dataset to our universal format.
 
         :param dataset: Raw Alpaca dataset
+        :param first_id: Id of the first row, so streamed chunks get consecutive ids
         :return: Converted dataset
         """
 
         logging.debug("converting dataset")
         # Combine 'instruction' and 'input' columns, handling NaN values and stripping whitespace
-        dataset["input"] = dataset["instruction"].fillna('') + " " + dataset["input"].fillna('')
-        dataset["input"] = dataset["input"].apply(lambda x: x.strip())
+        dataset["input"] = (dataset["instruction"].fillna('') + " " + dataset["input"].fillna('')).str.strip()
         # Assuming 'output' column does not require modification, so it's not explicitly mentioned here
 
+        # Stable row ids, assigned once at load time and never reused
+        dataset["id"] = np.arange(first_id, first_id + len(dataset), dtype=np.int64)
+
         logging.debug("dataset converted")
 
-        # Return the modified dataset with only the 'input' and 'output' columns if needed
-        return dataset[['input', 'output']]
+        # Return the modified dataset with only the 'id', 'input' and 'output' columns if needed
+        return dataset[['id', 'input', 'output']]
     
+
+
+def _load_shard(path: str) -> pd.DataFrame:
+    """
+    Loads and converts a single shard, runs in shard loading worker processes
+    """
+    return AlpacaLoader(path, workers=1).load_data()
@@ -9,6 +9,7 @@ You should have received a copy of the GNU Affero General Public License along w
 """
 
 from abc import ABC, abstractmethod
+from typing import Iterator
 import pandas as pd
 
 
@@ -33,6 +34,16 @@ class DataLoader(ABC):
         """
         raise NotImplementedError()
 
+    def iter_chunks(self, chunk_size: int = 100_000) -> Iterator[pd.DataFrame]:
+        """
+        Streams the dataset as converted chunks, so sources that don't fit in memory can be consumed
+        incrementally. Chunks have consecutive ids. Loaders that can't stream yield the whole dataset
+        from load_data as a single chunk.
+        :param chunk_size: Maximal number of rows per chunk
+        :return: Iterator over converted chunks in pandas.DataFrame format
+        """
+        yield self.load_data()
+
     @abstractmethod
     def _convert_dataset(self, dataset: pd.DataFrame) -> pd.DataFrame:
         """
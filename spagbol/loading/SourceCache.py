@@ -0,0 +1,231 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+import pandas as pd
+from validators import url as is_valid_url
+
+
+class SourceCache:
+    """
+    On-disk cache of converted datasets, stored as uncompressed Arrow IPC files that are read back through a
+    memory map. Numeric columns are served as views of the map; text columns still become Python strings, which
+    pandas needs for object columns. Local sources are keyed by the content hash and size of their files; the
+    hash of a file is only recomputed when its path, size or mtime changes. Huggingface Hub sources are keyed by
+    the dataset revision, URLs are not cached. When the artifacts grow over max_bytes the least recently used
+    are removed.
+    Example usage:
+        cache = SourceCache("/var/cache/spagbol/sources")
+        loader = AlpacaLoader("/data/alpaca.jsonl.zst", cache=cache)
+        dataset = loader.load_data()  # parsed and converted once, read from the Arrow file afterwards
+        cache.invalidate("/data/alpaca.jsonl.zst")
+
+    :param cache_dir: Directory for the artifacts and the index
+    :param max_bytes: Size bound for all artifacts together
+    """
+
+    _INDEX_VERSION = 1
+    _HASH_BLOCK = 1 << 20
+
+    def __init__(self, cache_dir: str, max_bytes: int = 8 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._clock = 0
+        # key -> {"source", "bytes", "last_used"}
+        self._artifacts: Dict[str, Dict] = {}
+        # absolute path -> {"size", "mtime_ns", "hash"}
+        self._files: Dict[str, Dict] = {}
+        self._load_index()
+
+    def key(self, source: str, namespace: str, split: Optional[str] = None,
+            paths: Optional[List[str]] = None) -> Optional[str]:
+        """
+        :param source: Source of the dataset
+        :param namespace: Loader name and conversion version, artifacts are never shared between namespaces
+        :param split: Huggingface Hub split
+        :param paths: Local files the source consists of, shards included. Hub sources are looked up when None.
+        :return: Cache key, or None if the source can't be cached
+        """
+        if paths is not None:
+            with self._lock:
+                parts = [self._file_hash(path) for path in paths]
+                self._save_index()
+        elif is_valid_url(source):
+            return None
+        else:
+            revision = self._hub_revision(source)
+            if revision is None:
+                return None
+            parts = [f"hub:{source}:{revision}"]
+        digest = hashlib.blake2b(digest_size=20)
+        for part in [namespace, str(split)] + parts:
+            digest.update(part.encode("utf-8") + b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        :param key: Cache key from the key method
+        :return: Cached dataset, or None on a cache miss
+        """
+        import pyarrow as pa
+
+        with self._lock:
+            entry = self._artifacts.get(key)
+            if entry is None:
+                return None
+            self._clock += 1
+            entry["last_used"] = self._clock
+            self._save_index()
+        try:
+            with pa.memory_map(self._artifact_path(key)) as source:
+                table = pa.ipc.open_file(source).read_all()
+            # One block per column lets numeric columns stay views of the map, self_destruct frees every other
+            # Arrow buffer as soon as its column is converted
+            return table.to_pandas(split_blocks=True, self_destruct=True)
+        except (OSError, pa.ArrowInvalid) as e:
+            logging.debug(f"Discarding source cache artifact {key}: {e}")
+            with self._lock:
+                self._remove(key)
+                self._save_index()
+            return None
+
+    def put(self, key: str, source: str, dataset: pd.DataFrame):
+        """
+        Stores a converted dataset. Datasets larger than max_bytes are not cached.
+
+        :param key: Cache key from the key method
+        :param source: Source of the dataset, used by invalidate
+        :param dataset: Converted dataset
+        """
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(dataset, preserve_index=False)
+        path = self._artifact_path(key)
+        tmp_path = path + ".tmp"
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            os.remove(tmp_path)
+            return
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._clock += 1
+            self._artifacts[key] = {"source": self._normalize(source), "bytes": size, "last_used": self._clock}
+            self._evict()
+            self._save_index()
+
+    def invalidate(self, source: Optional[str] = None):
+        """
+        Removes the cached artifacts of a source, or of every source
+
+        :param source: Source of the dataset, everything is removed when None
+        """
+        source = self._normalize(source) if source is not None else None
+        with self._lock:
+            for key in [key for key, entry in self._artifacts.items() if source is None or entry["source"] == source]:
+                self._remove(key)
+            if source is None:
+                self._files = {}
+            self._save_index()
+
+    @staticmethod
+    def _normalize(source: str) -> str:
+        """
+        Local paths and globs are made absolute, so invalidate matches however the source was spelled
+        """
+        if os.path.exists(source) or glob.has_magic(source):
+            return os.path.abspath(source)
+        return source
+
+    def _artifact_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.arrow")
+
+    def _file_hash(self, path: str) -> str:
+        """
+        Content hash of a file, reused while its path, size and mtime stay the same
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        record = self._files.get(path)
+        if record is None or record["size"] != stat.st_size or record["mtime_ns"] != stat.st_mtime_ns:
+            digest = hashlib.blake2b(digest_size=20)
+            with open(path, "rb") as source_file:
+                for block in iter(lambda: source_file.read(self._HASH_BLOCK), b""):
+                    digest.update(block)
+            record = self._files[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                          "hash": digest.hexdigest()}
+        return f"{record['size']}:{record['hash']}"
+
+    def _hub_revision(self, source: str) -> Optional[str]:
+        try:
+            from huggingface_hub import HfApi
+
+            return HfApi().dataset_info(source).sha
+        except Exception as e:
+            # Offline or unknown datasets are loaded without the cache
+            logging.debug(f"Couldn't resolve the revision of {source}: {e}")
+            return None
+
+    def _remove(self, key: str):
+        self._artifacts.pop(key, None)
+        if os.path.exists(self._artifact_path(key)):
+            os.remove(self._artifact_path(key))
+
+    def _evict(self):
+        """
+        Removes least recently used artifacts until all of them fit into max_bytes
+        """
+        total = sum(entry["bytes"] for entry in self._artifacts.values())
+        for key, entry in sorted(self._artifacts.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            logging.debug(f"Source cache: evicting {entry['source']}")
+            total -= entry["bytes"]
+            self._remove(key)
+
+    def _load_index(self):
+        """
+        Loads the index from disk. A missing or mismatching index resets the cache.
+        """
+        if not os.path.exists(self._index_path):
+            return
+        try:
+            with open(self._index_path) as index_file:
+                state = json.load(index_file)
+            if state["version"] != self._INDEX_VERSION:
+                raise ValueError("Source cache index belongs to a different version")
+            self._clock = state["clock"]
+            self._artifacts = {key: entry for key, entry in state["artifacts"].items()
+                               if os.path.exists(self._artifact_path(key))}
+            self._files = state["files"]
+        except (OSError, ValueError, KeyError) as e:
+            logging.debug(f"Discarding source cache index at {self.cache_dir}: {e}")
+            self._clock, self._artifacts, self._files = 0, {}, {}
+
+    def _save_index(self):
+        """
+        Atomically writes the index
+        """
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as index_file:
+            json.dump({"version": self._INDEX_VERSION, "clock": self._clock, "artifacts": self._artifacts,
+                       "files": self._files}, index_file)
+        os.replace(tmp_path, self._index_path)
@@ -0,0 +1,141 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+from typing import BinaryIO, Optional, TextIO
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+from validators import url as is_valid_url
+
+from spagbol.errors import InvalidSourceError
+
+
+class SourceFormat:
+    """
+    Data format and compression of a file or URL source. Detection looks at magic bytes first and falls back to
+    the file extension, so misnamed files are still read correctly. Opened streams decompress on the fly.
+    Example usage:
+        source_format = SourceFormat.detect("/path/to/alpaca.jsonl.zst")
+        source_format.data_format  # 'jsonl'
+        with source_format.open_text() as stream:
+            ...
+
+    :param source: Path or URL of the source
+    :param data_format: One of 'csv', 'json', 'jsonl' or 'parquet'
+    :param compression: One of 'gzip', 'zstd', 'bz2', 'xz' or None
+    """
+
+    COMPRESSION_MAGIC = [
+        (b"\x1f\x8b", "gzip"),
+        (b"\x28\xb5\x2f\xfd", "zstd"),
+        (b"BZh", "bz2"),
+        (b"\xfd7zXZ\x00", "xz"),
+    ]
+    COMPRESSION_EXTENSIONS = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd", ".bz2": "bz2",
+                              ".xz": "xz"}
+    FORMAT_EXTENSIONS = {".parquet": "parquet", ".pq": "parquet", ".jsonl": "jsonl", ".ndjson": "jsonl",
+                         ".json": "json", ".csv": "csv"}
+    PARQUET_MAGIC = b"PAR1"
+
+    def __init__(self, source: str, data_format: str, compression: Optional[str] = None):
+        self.source = source
+        self.data_format = data_format
+        self.compression = compression
+
+    def __repr__(self):
+        return f"SourceFormat({self.source!r}, {self.data_format!r}, {self.compression!r})"
+
+    @classmethod
+    def detect(cls, source: str) -> "SourceFormat":
+        """
+        :param source: Path or URL of the source
+        :return: Detected format of the source
+        :raises InvalidSourceError: If the source is compressed with an unsupported codec
+        """
+        name = (urlparse(source).path if is_valid_url(source) else source).lower()
+        root, extension = os.path.splitext(name)
+        with cls(source, "csv")._open_raw() as stream:
+            head = stream.read(8)
+        compression = next((codec for magic, codec in cls.COMPRESSION_MAGIC if head.startswith(magic)), None)
+        if extension in cls.COMPRESSION_EXTENSIONS:
+            compression = compression or cls.COMPRESSION_EXTENSIONS[extension]
+            extension = os.path.splitext(root)[1]
+
+        source_format = cls(source, cls.FORMAT_EXTENSIONS.get(extension), compression)
+        if head.startswith(cls.PARQUET_MAGIC):
+            source_format.data_format = "parquet"
+        elif source_format.data_format in (None, "json"):
+            # JSON arrays and line-delimited JSON share the extension, so look at the decompressed content
+            with source_format.open_binary() as stream:
+                content = stream.read(4096)
+            first = content.lstrip(b"\xef\xbb\xbf \t\r\n")[:1]
+            if content.startswith(cls.PARQUET_MAGIC):
+                source_format.data_format = "parquet"
+            elif first == b"[":
+                source_format.data_format = "json"
+            elif first == b"{":
+                source_format.data_format = "jsonl"
+            elif source_format.data_format is None:
+                source_format.data_format = "csv"
+        return source_format
+
+    def open_binary(self) -> BinaryIO:
+        """
+        :return: Binary stream of the decompressed source
+        """
+        # Decompressors opened on a path close their file, URL responses close themselves once read to the end
+        target = self.source if not is_valid_url(self.source) else None
+        if self.compression == "gzip":
+            return gzip.open(target or self._open_raw(), "rb")
+        if self.compression == "bz2":
+            return bz2.open(target or self._open_raw(), "rb")
+        if self.compression == "xz":
+            return lzma.open(target or self._open_raw(), "rb")
+        stream = self._open_raw()
+        if self.compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                stream.close()
+                raise InvalidSourceError("Reading zstd compressed sources requires the zstandard package, "
+                                         "see requirements-zstd.txt")
+            return zstandard.ZstdDecompressor().stream_reader(stream, closefd=True)
+        return stream
+
+    def open_text(self) -> TextIO:
+        """
+        :return: UTF-8 text stream of the decompressed source
+        """
+        return io.TextIOWrapper(self.open_binary(), encoding="utf-8-sig")
+
+    def open_parquet(self):
+        """
+        Opens the source as a pyarrow ParquetFile. Local uncompressed files are memory-mapped, so only the row
+        groups and columns that are read get paged in; other sources are buffered in memory first.
+
+        :return: pyarrow.parquet.ParquetFile
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.compression is None and not is_valid_url(self.source):
+            return pq.ParquetFile(self.source, memory_map=True)
+        with self.open_binary() as stream:
+            return pq.ParquetFile(pa.BufferReader(stream.read()))
+
+    def _open_raw(self) -> BinaryIO:
+        if is_valid_url(self.source):
+            return urlopen(self.source)
+        return open(self.source, "rb")
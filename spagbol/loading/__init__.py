@@ -1,2 +1,4 @@
 from .DataLoader import DataLoader
+from .SourceFormat import SourceFormat
+from .SourceCache import SourceCache
 from .AlpacaLoader import AlpacaLoader
@@ -0,0 +1,77 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import copy
+from typing import Iterable
+
+import numpy as np
+
+from spagbol.reduction import DimensionalityReduction
+from spagbol.errors import UnfitModelError
+from spagbol.storage import ResultCache
+
+
+class CachedReduction(DimensionalityReduction):
+    """
+    Wraps any DimensionalityReduction with a ResultCache. Fitting on data that was already reduced with the same
+    reducer class and parameters loads the reduced data and the fitted reducer instead of fitting again.
+    The wrapped reducer is only used as a prototype, every fit works on a copy of it.
+    Example usage:
+        reducer = CachedReduction(UmapReduction(), ResultCache("/var/cache/spagbol/results"))
+        reduced_data = reducer.fit_transform(embeddings)
+        reduced_new_data = reducer.transform(new_embeddings)
+
+    :param reducer: Unfitted reducer
+    :param cache: Result cache shared by all cached models
+    """
+
+    def __init__(self, reducer: DimensionalityReduction, cache: ResultCache):
+        self.reducer = reducer
+        self.cache = cache
+        self._fitted = None
+
+    def fit(self, data: Iterable) -> None:
+        """
+        Fits a copy of the wrapped reducer, or loads it from the cache
+
+        :param data: Data that will be used to fit the model
+        """
+        self.fit_transform(data)
+
+    def fit_transform(self, data: Iterable) -> np.ndarray:
+        """
+        Returns the cached reduction of the data, or fits a copy of the wrapped reducer and caches its result.
+
+        :param data: Data that will be used to fit the model and that will be reduced by the model
+        :return: Reduced data
+        """
+        data = np.asarray(data)
+        key = self.cache.key(self.reducer, data)
+        cached = self.cache.get(key)
+        if cached is not None:
+            reduced_data, self._fitted = cached
+            return reduced_data
+        fitted = copy.deepcopy(self.reducer)
+        reduced_data = fitted.fit_transform(data)
+        self.cache.put(key, reduced_data, fitted)
+        self._fitted = fitted
+        return reduced_data
+
+    def transform(self, data: Iterable) -> np.ndarray:
+        """
+        Applies the fitted reducer on the given data. Model has to be fit before using this method.
+
+        :param data: Data that will be reduced
+        :raises UnfitModelError: If model wasn't fit before using the method
+        :return: Reduced data
+        """
+        if self._fitted is None:
+            raise UnfitModelError("Model has to be fit before using the transform method")
+        return self._fitted.transform(data)
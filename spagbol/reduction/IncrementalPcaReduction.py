@@ -0,0 +1,128 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+from sklearn.decomposition import PCA, IncrementalPCA
+
+from spagbol.reduction.PcaReduction import PcaReduction
+from spagbol.errors import UnfitModelError
+from spagbol.storage.matrix import as_matrix
+
+
+class IncrementalPcaReduction(PcaReduction):
+    """
+    Object for applying PCA dimensionality reduction with bounded memory. The default 'incremental' solver fits
+    sklearn IncrementalPCA with partial_fit chunk by chunk and transforms chunk by chunk, so only one chunk is
+    converted to float64 at a time. That makes it possible to reduce memory-mapped embedding matrices that are
+    larger than RAM, or embeddings streamed from Embedder.embed_iter with fit_chunks.
+    The 'randomized' solver fits a randomized-SVD PCA in one shot, which is faster when the matrix fits in memory.
+    Example usage:
+        reducer = IncrementalPcaReduction(chunk_size=50_000)
+        reduced_data = reducer.fit_transform(np.load("input_embedding.npy", mmap_mode="r"))
+        For streamed data:
+            reducer = IncrementalPcaReduction()
+            reducer.fit_chunks(block for _, block in embedder.embed_iter(texts))
+            reduced_data = reducer.transform(embeddings)
+
+    :param n_components: Number of dimensions of the reduced data
+    :param chunk_size: Number of rows fitted and transformed at once
+    :param svd_solver: 'incremental' or 'randomized'
+    :param random_state: Seed of the randomized solver
+    """
+
+    SVD_SOLVERS = ("incremental", "randomized")
+
+    def __init__(self, n_components: int = 2, chunk_size: int = 65536, svd_solver: str = "incremental",
+                 random_state: Optional[int] = None):
+        if svd_solver not in self.SVD_SOLVERS:
+            raise ValueError(f"svd_solver has to be one of {self.SVD_SOLVERS}")
+        self.n_components = n_components
+        self.chunk_size = max(chunk_size, n_components)
+        self.svd_solver = svd_solver
+        self.random_state = random_state
+        self._model = self._new_model()
+        self._was_fit = False
+
+    def fit(self, data: Iterable):
+        """
+        Fits the PCA model with the passed data, chunk by chunk for the incremental solver
+
+        :param data: Data that will be used to fit the model
+        """
+        matrix = as_matrix(data)
+        if self.svd_solver == "randomized":
+            self._model = self._new_model()
+            self._model.fit(matrix)
+            self._was_fit = True
+        else:
+            self.fit_chunks(matrix[start:stop] for start, stop in self._chunk_bounds(len(matrix)))
+
+    def fit_chunks(self, chunks: Iterable[np.ndarray]):
+        """
+        Fits the incremental PCA model on a stream of matrices, each has to have at least n_components rows.
+        Only the current chunk is held in memory.
+
+        :param chunks: Iterable of matrices with the same number of columns
+        """
+        if self.svd_solver != "incremental":
+            raise ValueError("fit_chunks needs the incremental solver")
+        self._model = self._new_model()
+        rows = 0
+        for chunk in chunks:
+            self._model.partial_fit(as_matrix(chunk))
+            rows += len(chunk)
+        logging.debug(f"Incremental PCA fit on {rows} rows")
+        self._was_fit = rows > 0
+
+    def fit_transform(self, data: Iterable) -> np.ndarray:
+        """
+        Fits the PCA model and then applies reduction on the data it was fit on.
+
+        :param data: Data that will be used to fit the model and that will be reduced by the model
+        :return: Reduced data
+        """
+        matrix = as_matrix(data)
+        self.fit(matrix)
+        return self.transform(matrix)
+
+    def transform(self, data: Iterable) -> np.ndarray:
+        """
+        Applies PCA dimensionality reduction chunk by chunk into one preallocated float32 matrix.
+        Model has to be fit before using this method.
+
+        :param data: Data that will be reduced
+        :raises UnfitModelError: If model wasn't fit before using the method
+        :return: Reduced data
+        """
+        if not self._was_fit:
+            raise UnfitModelError("Model has to be fit before using the transform method")
+        matrix = as_matrix(data)
+        reduced_data = np.empty((len(matrix), self.n_components), dtype=np.float32)
+        for start in range(0, len(matrix), self.chunk_size):
+            stop = start + self.chunk_size
+            reduced_data[start:stop] = self._model.transform(matrix[start:stop])
+        return reduced_data
+
+    def _new_model(self):
+        if self.svd_solver == "randomized":
+            return PCA(n_components=self.n_components, svd_solver="randomized", random_state=self.random_state)
+        return IncrementalPCA(n_components=self.n_components)
+
+    def _chunk_bounds(self, rows: int) -> Iterator:
+        """
+        Chunk boundaries over rows, a last chunk shorter than n_components is merged into the previous one
+        """
+        starts = list(range(0, rows, self.chunk_size))
+        if len(starts) > 1 and rows - starts[-1] < self.n_components:
+            starts.pop()
+        return zip(starts, starts[1:] + [rows])
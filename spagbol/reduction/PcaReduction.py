@@ -16,6 +16,7 @@ from typing import Iterable
 
 from spagbol.reduction import DimensionalityReduction
 from spagbol.errors import UnfitModelError
+from spagbol.storage.matrix import as_matrix
 
 
 class PcaReduction(DimensionalityReduction):
@@ -41,11 +42,9 @@ class PcaReduction(DimensionalityReduction):
 
         :param data: Data that will be used to fit the model
         """
-        self._model.fit(data)
+        self._model.fit(as_matrix(data))
         self._was_fit = True
 
-
-
     def fit_transform(self, data: Iterable) -> np.ndarray:
         """
         Fits the PCA model and then applies reduction on the data it was fit on.
@@ -55,11 +54,7 @@ class PcaReduction(DimensionalityReduction):
         """
         logging.debug("Starting PCA fit_transform.")
         try:
-            # Convert data to a numpy array and ensure it's of type float
-            data = np.asarray(data, dtype=object)
-            
-            # Convert each element in the array to a numpy array of floats
-            data = np.array([np.asarray(d, dtype=float) for d in data])
+            data = as_matrix(data)
 
             # Proceed with PCA fit_transform
             reduced_data = np.array(self._model.fit_transform(data))
@@ -83,4 +78,4 @@ class PcaReduction(DimensionalityReduction):
         """
         if not self._was_fit:
             raise UnfitModelError("Model has to be fit before using the transform method")
-        return np.array(self._model.transform(data))
+        return np.array(self._model.transform(as_matrix(data)))
@@ -8,18 +8,27 @@ This program is distributed in the hope that it will be useful, but WITHOUT ANY
 You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
-from typing import Iterable
+from typing import Iterable, Optional
+import logging
 import umap
 import numpy as np
+from joblib import Parallel, delayed
 
 from spagbol.reduction import DimensionalityReduction
 from spagbol.errors import UnfitModelError
+from spagbol.search import KnnGraph
 
 
 class UmapReduction(DimensionalityReduction):
     """
     Object for applying UMAP dimensionality reduction. Can only work with numerical features.
     You have to fit a model before using transform. You should use scaled or normalized data for better performance
+    With sample_size set, UMAP is fit on a sample of landmark rows only and the remaining rows are projected
+    with transform in parallel chunks, which keeps the cost of large datasets close to linear. The sample is
+    random, or stratified over coarse k-means strata (or labels passed to fit/fit_transform) so small regions of
+    the data keep their landmarks.
+    With share_knn or knn_cache_dir set, the neighbour graph is taken from KnnGraph.cached instead of being
+    searched by UMAP, so refits of the same data with other min_dist or n_components skip the neighbour search.
     Example usage:
         If you want to apply reduction to a feature set that wasn't used to fit the model:
             reducer = UmapReduction()
@@ -28,36 +37,83 @@ class UmapReduction(DimensionalityReduction):
         Otherwise:
             reducer = UmapReduction()
             reduced_data = reducer.fit_transform(numerical_features)
+        For large datasets:
+            reducer = UmapReduction(sample_size=20_000, sampling="stratified", n_jobs=8)
+            reduced_data = reducer.fit_transform(numerical_features)
+        With a persisted neighbour graph:
+            reducer = UmapReduction(min_dist=0.5, knn_cache_dir="/data/knn")
+            reduced_data = reducer.fit_transform(numerical_features)
+
+    :param sample_size: Number of landmark rows UMAP is fit on, every row is used when None
+    :param sampling: 'random' or 'stratified'
+    :param strata: Number of k-means strata for stratified sampling
+    :param transform_chunk_size: Number of rows per parallel transform task
+    :param n_jobs: Number of threads projecting the remaining rows, -1 uses every CPU
+    :param random_state: Seed for sampling and UMAP
+    :param share_knn: Use the neighbour graph cached in memory by KnnGraph
+    :param knn_cache_dir: Directory the neighbour graphs are persisted in, implies share_knn
+    :param umap_kwargs: Arguments of umap.UMAP, e.g. n_neighbors, min_dist or n_components
     """
 
-    def __init__(self):
-        self._model = umap.UMAP()
+    SAMPLING_METHODS = ("random", "stratified")
+
+    def __init__(self, sample_size: Optional[int] = None, sampling: str = "random", strata: int = 32,
+                 transform_chunk_size: int = 16384, n_jobs: int = -1, random_state: Optional[int] = None,
+                 share_knn: bool = False, knn_cache_dir: Optional[str] = None, **umap_kwargs):
+        if sampling not in self.SAMPLING_METHODS:
+            raise ValueError(f"sampling has to be one of {self.SAMPLING_METHODS}")
+        self.sample_size = sample_size
+        self.sampling = sampling
+        self.strata = strata
+        self.transform_chunk_size = transform_chunk_size
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.share_knn = share_knn or knn_cache_dir is not None
+        self.knn_cache_dir = knn_cache_dir
+        self._umap_kwargs = umap_kwargs
+        self._model = umap.UMAP(random_state=random_state, **umap_kwargs)
         self._was_fit = False
 
-    def fit(self, data: Iterable) -> None:
+    def fit(self, data: Iterable, labels: Optional[Iterable] = None) -> None:
         """
-        Fits the UMAP reduction model with the passed data
+        Fits the UMAP reduction model with the passed data, or with a sample of it when sample_size is set
 
         :param data: Data that will be used to fit the model
+        :param labels: Optional labels to stratify the sample by
         """
-        self._model.fit(data)
-        self._was_fit = True
+        data = np.asarray(data)
+        sample = self._sample(data, labels)
+        self._fit_model(data if sample is None else data[sample])
 
-    def fit_transform(self, data: Iterable) -> np.ndarray:
+    def fit_transform(self, data: Iterable, labels: Optional[Iterable] = None) -> np.ndarray:
         """
-        Fits the UMAP model and then applies reduction on the data it was fit on.
+        Fits the UMAP model and then applies reduction on the data it was fit on. With sample_size set, only
+        the sample is used for fitting and the other rows are projected with transform.
 
         :param data: Data that will be used to fit the model and that will be reduced by the model
+        :param labels: Optional labels to stratify the sample by
         :return: Reduced data
         """
-        reduced_data = np.array(self._model.fit_transform(data))
-        self._was_fit = True
+        data = np.asarray(data)
+        sample = self._sample(data, labels)
+        if sample is None:
+            self._fit_model(data)
+            return np.array(self._model.embedding_)
+
+        self._fit_model(data[sample])
+        reduced_data = np.empty((len(data), self._model.n_components), dtype=np.float32)
+        reduced_data[sample] = self._model.embedding_
+        rest = np.ones(len(data), dtype=bool)
+        rest[sample] = False
+        rest = np.flatnonzero(rest)
+        logging.debug(f"UMAP fit on {len(sample)} landmarks, projecting {len(rest)} rows")
+        reduced_data[rest] = self._transform_rows(data, rest)
         return reduced_data
 
     def transform(self, data: Iterable) -> np.ndarray:
         """
-        Applies UMAP dimensionality reduction on the given data. Model has to be fit before using
-        this method.
+        Applies UMAP dimensionality reduction on the given data, in parallel chunks. Model has to be fit before
+        using this method.
 
         :param data: Data that will be reduced
         :raises UnfitModelError: If model wasn't fit before using the method
@@ -65,6 +121,60 @@ class UmapReduction(DimensionalityReduction):
         """
         if not self._was_fit:
             raise UnfitModelError("Model has to be fit before using the transform method")
-        return np.array(self._model.transform(data))
+        data = np.asarray(data)
+        return self._transform_rows(data, np.arange(len(data)))
+
+    def _fit_model(self, data: np.ndarray):
+        if self.share_knn and isinstance(self._model.metric, str):
+            graph = KnnGraph.cached(data, n_neighbors=self._model.n_neighbors, metric=self._model.metric,
+                                    cache_dir=self.knn_cache_dir, random_state=self.random_state)
+            self._model = umap.UMAP(random_state=self.random_state, precomputed_knn=graph.umap_knn(),
+                                    **self._umap_kwargs)
+        self._model.fit(data)
+        self._was_fit = True
 
+    def _transform_rows(self, data: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        chunks = [rows[start:start + self.transform_chunk_size]
+                  for start in range(0, len(rows), self.transform_chunk_size)]
+        if len(chunks) <= 1 or self.n_jobs == 1:
+            parts = [self._model.transform(data[chunk]) for chunk in chunks]
+        else:
+            # Threads share the fitted model, processes would receive a pickled copy of it, including its
+            # training data and neighbour index, with every chunk. The numba kernels of transform release the GIL
+            parts = Parallel(n_jobs=self.n_jobs, prefer="threads")(delayed(self._model.transform)(data[chunk])
+                                                                   for chunk in chunks)
+        if not parts:
+            return np.empty((0, self._model.n_components), dtype=np.float32)
+        return np.concatenate(parts).astype(np.float32, copy=False)
+
+    def _sample(self, data: np.ndarray, labels: Optional[Iterable]) -> Optional[np.ndarray]:
+        """
+        :return: Sorted positions of the landmark rows, None if every row is used
+        """
+        if self.sample_size is None or len(data) <= self.sample_size:
+            return None
+        rng = np.random.default_rng(self.random_state)
+        if labels is None and self.sampling == "random":
+            return np.sort(rng.choice(len(data), self.sample_size, replace=False))
+        if labels is None:
+            labels = self._strata_labels(data, rng)
+
+        # Proportional allocation with at least one landmark per stratum
+        _, inverse, counts = np.unique(np.asarray(labels), return_inverse=True, return_counts=True)
+        quotas = np.minimum(np.maximum(1, counts * self.sample_size // len(data)), counts)
+        order = rng.permutation(len(data))
+        grouped = order[np.argsort(inverse[order], kind="stable")]
+        starts = np.cumsum(counts) - counts
+        return np.sort(np.concatenate([grouped[start:start + quota] for start, quota in zip(starts, quotas)]))
+
+    def _strata_labels(self, data: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        Coarse k-means partition of the data, fit on a sample and assigned chunk by chunk
+        """
+        from sklearn.cluster import MiniBatchKMeans
 
+        strata = min(self.strata, len(data))
+        fit_rows = np.sort(rng.choice(len(data), min(len(data), 256 * strata), replace=False))
+        kmeans = MiniBatchKMeans(n_clusters=strata, n_init=3, random_state=self.random_state).fit(data[fit_rows])
+        return np.concatenate([kmeans.predict(data[start:start + self.transform_chunk_size])
+                               for start in range(0, len(data), self.transform_chunk_size)])
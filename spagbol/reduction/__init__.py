@@ -1,3 +1,10 @@
 from .DimensionalityReduction import DimensionalityReduction
-from .UmapReduction import UmapReduction
-from .PcaReduction import PcaReduction
\ No newline at end of file
+from spagbol._lazy import install_lazy_exports
+
+# Implementations are imported on first use, so importing the package doesn't load umap or sklearn
+install_lazy_exports(__name__, {
+    "UmapReduction": "UmapReduction",
+    "PcaReduction": "PcaReduction",
+    "IncrementalPcaReduction": "IncrementalPcaReduction",
+    "CachedReduction": "CachedReduction",
+})
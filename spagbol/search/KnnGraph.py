@@ -0,0 +1,195 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import glob
+import logging
+import os
+import pickle
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from spagbol.storage.fingerprint import array_fingerprint
+
+
+class KnnGraph:
+    """
+    Approximate k-nearest-neighbour graph of an embedding matrix, built once with NN-descent and shared by
+    everything that needs neighbours: UMAP (as precomputed_knn), outlier scoring and similar-item lookup.
+    Row i of indices and distances holds the neighbours of row i sorted by distance, the row itself first.
+    Graphs are cached by the fingerprint of the matrix and the metric, in memory and optionally on disk, and a
+    cached graph with more neighbours serves requests for fewer.
+    Example usage:
+        graph = KnnGraph.cached(embeddings, n_neighbors=15, metric="cosine", cache_dir="/data/knn")
+        scores = graph.outlier_scores()
+        reducer = UmapReduction(n_neighbors=15, metric="cosine", knn_cache_dir="/data/knn")
+
+    :param indices: Neighbour positions, shape (rows, n_neighbors)
+    :param distances: Neighbour distances, shape (rows, n_neighbors)
+    :param metric: Distance metric of the graph
+    :param search_index: Optional pynndescent index, needed to query new points (e.g. UMAP transform)
+    """
+
+    # Most recently used graphs of this process, keyed by (fingerprint, metric)
+    _memory: Dict[Tuple[str, str], "KnnGraph"] = {}
+    _MEMORY_GRAPHS = 4
+    # Guards _memory, graphs are built outside of it so different matrices are built concurrently
+    _memory_lock = threading.Lock()
+
+    def __init__(self, indices: np.ndarray, distances: np.ndarray, metric: str, search_index=None):
+        if indices.shape != distances.shape:
+            raise ValueError("Neighbour indices and distances need the same shape")
+        self.indices = indices
+        self.distances = distances
+        self.metric = metric
+        self.search_index = search_index
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    @property
+    def n_neighbors(self) -> int:
+        return self.indices.shape[1]
+
+    @classmethod
+    def build(cls, data: np.ndarray, n_neighbors: int = 15, metric: str = "euclidean",
+              random_state: Optional[int] = None, n_jobs: int = -1) -> "KnnGraph":
+        """
+        Builds the graph with pynndescent, the same neighbour search UMAP uses internally
+
+        :param data: Embedding matrix
+        :param n_neighbors: Number of neighbours per row, the row itself included
+        :param metric: Distance metric, see pynndescent for the supported metrics
+        :param random_state: Seed of the neighbour search
+        :param n_jobs: Number of threads, -1 uses every CPU
+        :return: The graph
+        """
+        from pynndescent import NNDescent
+
+        index = NNDescent(data, n_neighbors=n_neighbors, metric=metric, random_state=random_state,
+                          n_jobs=n_jobs, low_memory=True, verbose=False)
+        indices, distances = index.neighbor_graph
+        return cls(indices.astype(np.int32, copy=False), distances.astype(np.float32, copy=False), metric, index)
+
+    @classmethod
+    def cached(cls, data: np.ndarray, n_neighbors: int = 15, metric: str = "euclidean",
+               cache_dir: Optional[str] = None, random_state: Optional[int] = None) -> "KnnGraph":
+        """
+        Returns the graph of a matrix, building it only if neither memory nor cache_dir has a graph of the same
+        matrix and metric with at least n_neighbors neighbours
+
+        :param data: Embedding matrix
+        :param n_neighbors: Number of neighbours per row, the row itself included
+        :param metric: Distance metric
+        :param cache_dir: Directory the graph is persisted in, memory only when None
+        :param random_state: Seed of the neighbour search
+        :return: The graph with exactly n_neighbors neighbours
+        """
+        key = (array_fingerprint(data), metric)
+        with cls._memory_lock:
+            graph = cls._memory.get(key)
+        if (graph is None or graph.n_neighbors < n_neighbors) and cache_dir is not None:
+            graph = cls._load_cached(cache_dir, key, n_neighbors) or graph
+        if graph is None or graph.n_neighbors < n_neighbors:
+            logging.debug(f"Building {n_neighbors}-NN graph of {len(data)} rows")
+            graph = cls.build(data, n_neighbors, metric, random_state=random_state)
+            if cache_dir is not None:
+                graph.save(os.path.join(cache_dir, f"{key[0]}-{metric}-{n_neighbors}"))
+        with cls._memory_lock:
+            cached = cls._memory.pop(key, None)
+            # Keep the larger graph when another thread cached one of the same matrix meanwhile
+            if cached is not None and cached.n_neighbors > graph.n_neighbors:
+                graph = cached
+            cls._memory[key] = graph
+            while len(cls._memory) > cls._MEMORY_GRAPHS:
+                cls._memory.pop(next(iter(cls._memory)))
+        return graph.subgraph(n_neighbors)
+
+    def subgraph(self, n_neighbors: int) -> "KnnGraph":
+        """
+        :param n_neighbors: Number of neighbours to keep, at most the neighbours of this graph
+        :return: Graph with the n_neighbors nearest neighbours of every row
+        """
+        if n_neighbors > self.n_neighbors:
+            raise ValueError(f"Graph has only {self.n_neighbors} neighbours per row")
+        if n_neighbors == self.n_neighbors:
+            return self
+        return KnnGraph(self.indices[:, :n_neighbors], self.distances[:, :n_neighbors], self.metric,
+                        self.search_index)
+
+    def umap_knn(self) -> tuple:
+        """
+        :return: The graph in the format of the precomputed_knn argument of umap.UMAP
+        """
+        return np.ascontiguousarray(self.indices), np.ascontiguousarray(self.distances), self.search_index
+
+    def neighbors(self, positions) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param positions: Row positions
+        :return: Neighbour positions and distances of the rows, without the rows themselves
+        """
+        return self.indices[positions, 1:], self.distances[positions, 1:]
+
+    def outlier_scores(self) -> np.ndarray:
+        """
+        :return: Mean distance of every row to its neighbours, larger means more isolated
+        """
+        return self.distances[:, 1:].mean(axis=1)
+
+    def save(self, path: str):
+        """
+        Saves the graph as .npy files in a directory, plus the pickled search index when there is one
+
+        :param path: Directory of the graph
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "indices.npy"), self.indices)
+        np.save(os.path.join(path, "distances.npy"), self.distances)
+        with open(os.path.join(path, "metric.txt"), "w") as metric_file:
+            metric_file.write(self.metric)
+        if self.search_index is not None:
+            with open(os.path.join(path, "search_index.pkl"), "wb") as index_file:
+                pickle.dump(self.search_index, index_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "KnnGraph":
+        """
+        Loads a saved graph, neighbour matrices are memory-mapped
+
+        :param path: Directory of the graph
+        :return: The graph
+        """
+        indices = np.load(os.path.join(path, "indices.npy"), mmap_mode="r")
+        distances = np.load(os.path.join(path, "distances.npy"), mmap_mode="r")
+        with open(os.path.join(path, "metric.txt")) as metric_file:
+            metric = metric_file.read().strip()
+        search_index = None
+        if os.path.exists(os.path.join(path, "search_index.pkl")):
+            with open(os.path.join(path, "search_index.pkl"), "rb") as index_file:
+                search_index = pickle.load(index_file)
+        return cls(indices, distances, metric, search_index)
+
+    @classmethod
+    def _load_cached(cls, cache_dir: str, key: Tuple[str, str], n_neighbors: int) -> Optional["KnnGraph"]:
+        """
+        Loads the smallest persisted graph of the matrix with at least n_neighbors neighbours
+        """
+        fingerprint, metric = key
+        candidates = []
+        for path in glob.glob(os.path.join(glob.escape(cache_dir), f"{fingerprint}-*")):
+            match = re.fullmatch(rf"{fingerprint}-(.+)-(\d+)", os.path.basename(path))
+            if match and match.group(1) == metric and int(match.group(2)) >= n_neighbors:
+                candidates.append((int(match.group(2)), path))
+        if not candidates:
+            return None
+        logging.debug(f"Loading cached kNN graph {min(candidates)[1]}")
+        return cls.load(min(candidates)[1])
@@ -0,0 +1,163 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+
+class TopKSearch:
+    """
+    Exact top-k similarity search over an embedding matrix. The matrix is scanned in row blocks sized by
+    memory_budget: every block is scored against the queries with one matrix multiplication, its best k rows
+    are picked with argpartition and merged into the running top k. Memory stays bounded by the budget
+    whatever the number of rows, so memory-mapped matrices can be searched without loading them.
+    For cosine similarity the inverse row norms are computed once when the engine is created, or skipped when
+    the rows are already normalized; queries are normalized once per search. After edits, appends or compaction
+    of the matrix, update and compact only touch the norms of the affected rows.
+    Example usage:
+        engine = TopKSearch(embeddings.get("input_embedding"))
+        positions, scores = engine.search(embedder.embed("query"), k=10)
+        For a batch of queries:
+            positions, scores = engine.search(embedder.embed_batch(queries), k=10)  # shapes (queries, k)
+
+    :param data: Float32 matrix with one row per item
+    :param metric: 'cosine' or 'dot'
+    :param normalized: Whether the rows already have unit length
+    :param memory_budget: Bytes of temporary memory used per block of scores
+    :param query_chunk_size: Number of queries scored together
+    """
+
+    METRICS = ("cosine", "dot")
+    # Rows reduced at once when computing the row norms
+    _NORM_CHUNK_ROWS = 65536
+
+    def __init__(self, data: np.ndarray, metric: str = "cosine", normalized: bool = False,
+                 memory_budget: int = 256 * 1024 ** 2, query_chunk_size: int = 256):
+        if metric not in self.METRICS:
+            raise ValueError(f"metric has to be one of {self.METRICS}")
+        data = np.asarray(data)
+        if data.ndim != 2:
+            raise ValueError(f"Expected a two-dimensional matrix, got shape {data.shape}")
+        self.data = data
+        self.metric = metric
+        self.memory_budget = memory_budget
+        self.query_chunk_size = query_chunk_size
+        self._inverse_norms: Optional[np.ndarray] = None
+        if metric == "cosine" and not normalized:
+            self._inverse_norms = self._compute_inverse_norms(data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def update(self, data: np.ndarray, positions: Iterable = ()):
+        """
+        Switches to the current matrix after rows were edited in place or appended at its end
+
+        :param data: Matrix with the same rows as before, apart from the edited and appended ones
+        :param positions: Positions of the edited rows, appended rows are detected by the number of rows
+        """
+        data = np.asarray(data)
+        if self._inverse_norms is not None:
+            positions = np.asarray(list(positions), dtype=np.int64)
+            old_rows = len(self._inverse_norms)
+            if len(data) != old_rows:
+                inverse_norms = np.empty(len(data), dtype=np.float32)
+                inverse_norms[:min(old_rows, len(data))] = self._inverse_norms[:len(data)]
+                self._inverse_norms = inverse_norms
+                positions = np.concatenate((positions, np.arange(old_rows, len(data), dtype=np.int64)))
+            if len(positions):
+                self._inverse_norms[positions] = self._compute_inverse_norms(data[positions])
+        self.data = data
+
+    def compact(self, data: np.ndarray, keep: np.ndarray):
+        """
+        Switches to the current matrix after rows were dropped from it
+
+        :param data: Matrix with the kept rows
+        :param keep: Boolean mask over the previous rows
+        """
+        if self._inverse_norms is not None:
+            self._inverse_norms = self._inverse_norms[keep]
+        self.data = np.asarray(data)
+
+    def search(self, queries: Iterable, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param queries: One query vector, or a matrix with one query per row
+        :param k: Number of results per query, at most the number of rows
+        :return: Row positions and scores ranked from the most similar, shapes (k,) for one query vector and
+                 (queries, k) for a query matrix
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        single = queries.ndim == 1
+        queries = np.atleast_2d(queries)
+        if queries.shape[1] != self.data.shape[1]:
+            raise ValueError(f"Expected queries with {self.data.shape[1]} dimensions, got {queries.shape[1]}")
+        k = min(k, len(self.data))
+        if self.metric == "cosine":
+            queries = queries * self._compute_inverse_norms(queries)[:, None]
+
+        positions = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        for start in range(0, len(queries), self.query_chunk_size):
+            stop = start + self.query_chunk_size
+            positions[start:stop], scores[start:stop] = self._search_chunk(queries[start:stop], k)
+        if single:
+            return positions[0], scores[0]
+        return positions, scores
+
+    def _search_chunk(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scans the matrix block by block for a chunk of queries
+        """
+        best_positions = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        if k == 0:
+            return best_positions, best_scores
+        # A block costs its float32 scores and int64 argpartition indices per query, plus a float32 copy of
+        # the block rows when the matrix has to be converted
+        block_rows = max(k, self.memory_budget // (12 * len(queries) + 4 * self.data.shape[1]))
+        for start in range(0, len(self.data), block_rows):
+            block = np.asarray(self.data[start:start + block_rows], dtype=np.float32)
+            block_scores = queries @ block.T
+            if self._inverse_norms is not None:
+                block_scores *= self._inverse_norms[start:start + block_rows]
+            block_positions, block_scores = self._top_k(block_scores, k)
+            best_positions, best_scores = self._top_k(
+                np.concatenate((best_scores, block_scores), axis=1), k,
+                np.concatenate((best_positions, block_positions + start), axis=1))
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_positions, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int, positions: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Unordered k best scores per row with argpartition, positions default to the column indices
+        """
+        if scores.shape[1] > k:
+            columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            columns = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        top_scores = np.take_along_axis(scores, columns, axis=1)
+        if positions is None:
+            return np.asarray(columns, dtype=np.int64), top_scores
+        return np.take_along_axis(positions, columns, axis=1), top_scores
+
+    @classmethod
+    def _compute_inverse_norms(cls, matrix: np.ndarray) -> np.ndarray:
+        """
+        Inverse euclidean norm of every row, 0 for rows that are all zeros
+        """
+        inverse_norms = np.zeros(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), cls._NORM_CHUNK_ROWS):
+            chunk = np.asarray(matrix[start:start + cls._NORM_CHUNK_ROWS], dtype=np.float32)
+            norms = np.sqrt(np.einsum("ij,ij->i", chunk, chunk))
+            np.divide(1, norms, out=inverse_norms[start:start + cls._NORM_CHUNK_ROWS], where=norms > 0)
+        return inverse_norms
@@ -0,0 +1,7 @@
+from spagbol._lazy import install_lazy_exports
+
+# Implementations are imported on first use, so importing the package doesn't load numpy or pynndescent
+install_lazy_exports(__name__, {
+    "KnnGraph": "KnnGraph",
+    "TopKSearch": "TopKSearch",
+})
@@ -9,115 +9,279 @@ You should have received a copy of the GNU Affero General Public License along w
 """
 
 import logging
-from spagbol.clustering import ClusteringModel
+from spagbol.clustering import ClusteringModel, ClusterSummaries
 from spagbol.embedding import Embedder
 from spagbol.loading import DataLoader
 from spagbol.reduction import DimensionalityReduction
 from spagbol.similarity import SimilarityMeasure
-from spagbol.errors import NoDatasetError, ClusteringError
+from spagbol.errors import NoDatasetError, ClusteringError, DataPointNotFoundError
 from spagbol.loading import AlpacaLoader
+from spagbol.storage import EmbeddingStore, Workspace, RowIndex
+from spagbol.search import KnnGraph, TopKSearch
 
 import pandas as pd
+import numpy as np
+import copy
+from concurrent.futures import ThreadPoolExecutor
 import json
-from typing import Dict, Any, List
+import os
+from typing import Dict, Any, List, Optional, Union
 from injector import inject
-from weaviate.client import WeaviateClient
-import weaviate.classes as wvc
 
 
 class Spagbol:
 
+    # Embedding fields and the dataset columns that hold their reduced coordinates
+    REDUCED_COLUMNS = {
+        "input_embedding": ("instruction_x", "instruction_y"),
+        "output_embedding": ("output_x", "output_y"),
+    }
+
     #@inject
     def __init__(self, data_loader: DataLoader, embedder: Embedder, clustering_model: ClusteringModel,
-                 reducer: DimensionalityReduction):
+                 reducer: DimensionalityReduction, embedding_dir: Optional[str] = None,
+                 embedding_chunk_size: int = 4096, compaction_ratio: float = 0.1, refit_ratio: float = 0.2,
+                 knn_cache_dir: Optional[str] = None, reduction_workers: int = 2, recluster_ratio: float = 0.2,
+                 cluster_examples: int = 5):
         self.data_loader = data_loader
         self.embedder = embedder
+        # Prototype of the clustering model, every clustered target column gets its own fitted copy in
+        # self.clusterers. Changed rows are labelled with the fitted copy until they make up more than
+        # recluster_ratio of the rows it was fit on
         self.clustering_model = clustering_model
+        self.clusterers: Dict[str, ClusteringModel] = {}
+        self.recluster_ratio = recluster_ratio
+        # Per target column: rows of the last fit, number of rows added, edited or deleted since that fit, and
+        # ids of the changed rows that still have to be labelled
+        self._clustering_state: Dict[str, Dict[str, Any]] = {}
+        # JSON serializable ClusterSummaries per target column, computed when clustering finishes, with
+        # cluster_examples members nearest to each centroid
+        self.cluster_summaries: Dict[str, Dict[str, Any]] = {}
+        self.cluster_examples = cluster_examples
+        # Prototype of the reduction model, every embedding field gets its own fitted copy in self.reducers
         self.reducer = reducer
+        self.reducers: Dict[str, DimensionalityReduction] = {}
+        # Added and edited rows are placed with the fitted reducers, until they make up more than refit_ratio
+        # of the rows the reducers were fit on
+        self.refit_ratio = refit_ratio
+        self._rows_at_fit = 0
+        self._rows_changed_since_fit = 0
+        # Number of embedding fields that are reduced concurrently, 1 reduces them one after the other
+        self.reduction_workers = reduction_workers
+        # Neighbour graphs of the embedding matrices are persisted here when it is set, see KnnGraph.cached
+        self.knn_cache_dir = knn_cache_dir
+        # Reducers that take their neighbour graph from KnnGraph.cached share the graphs of knn_graph
+        inner_reducer = getattr(reducer, "reducer", reducer)
+        if knn_cache_dir is not None and getattr(inner_reducer, "knn_cache_dir", False) is None:
+            inner_reducer.knn_cache_dir = knn_cache_dir
+            inner_reducer.share_knn = True
         self.dataset = None
+        # Embedding matrices, row-aligned with self.dataset
+        self.embeddings = None
+        # Exact similarity search engines per embedding field, updated for edited, added and dropped rows and
+        # dropped when the embeddings are replaced
+        self._search_engines: Dict[str, TopKSearch] = {}
+        # When set, embedding matrices are written to memory-mapped .npy files in this directory
+        self.embedding_dir = embedding_dir
+        self.embedding_chunk_size = embedding_chunk_size
+        # Hash index from data point id to row position. Deleted rows are tombstoned and only dropped from
+        # the dataset and embeddings by compact, once they make up more than compaction_ratio of the rows
+        self.row_index = None
+        self.compaction_ratio = compaction_ratio
+
+    def _data_loader_for(self, dataset_location: str) -> DataLoader:
+        # Reuse the injected loader (and its source cache) for its own source, otherwise create an AlpacaLoader
+        if getattr(self.data_loader, "source", None) == dataset_location:
+            return self.data_loader
+        return AlpacaLoader(dataset_location)
 
     def load_data(self, dataset_location: str) -> str:
-        # Create an instance of AlpacaLoader with the dataset location
-        data_loader = AlpacaLoader(dataset_location)
         # Load the data into memory
-        self.dataset = data_loader.load_data()
+        self.dataset = self._data_loader_for(dataset_location).load_data()
+        self._build_row_index()
 
         print(self.dataset)
 
+    def load_and_embed(self, dataset_location: str, chunk_size: int = 100_000):
+        """
+        Loads the dataset with DataLoader.iter_chunks and embeds every converted chunk as soon as it arrives,
+        appending its rows to the embedding store, so the source is parsed and embedded in one streaming pass
+        instead of being parsed as a whole first. Same result as load_data followed by create_embeddings,
+        which are used instead when embedding_dir is set, since memory-mapped matrices need their final size.
+
+        :param dataset_location: Source of the dataset
+        :param chunk_size: Maximal number of rows per chunk
+        """
+        if self.embedding_dir is not None:
+            self.load_data(dataset_location)
+            self.create_embeddings()
+            return
+        chunks = []
+        self.embeddings = None
+        self._search_engines.clear()
+        rows = 0
+        for chunk in self._data_loader_for(dataset_location).iter_chunks(chunk_size):
+            chunk = chunk.reset_index(drop=True)
+            if "id" not in chunk.columns:
+                chunk.insert(0, "id", np.arange(rows, rows + len(chunk), dtype=np.int64))
+            values = {field: self._embed_column([str(item) for item in chunk[column].tolist()], field)
+                      for field, column in (("input_embedding", "input"), ("output_embedding", "output"))}
+            if self.embeddings is None:
+                self.embeddings = EmbeddingStore(ids=chunk["id"].to_numpy())
+                for field, matrix in values.items():
+                    self.embeddings.set(field, matrix)
+            else:
+                self.embeddings.append(chunk["id"].to_numpy(), values)
+            rows += len(chunk)
+            chunks.append(chunk)
+            logging.debug(f"Loaded and embedded {rows} rows")
+        if not chunks:
+            self.load_data(dataset_location)
+            self.create_embeddings()
+            return
+        self.dataset = pd.concat(chunks, ignore_index=True)
+        self._build_row_index()
+
+    def _build_row_index(self):
+        if "id" not in self.dataset.columns:
+            self.dataset.insert(0, "id", np.arange(len(self.dataset), dtype=np.int64))
+        self.dataset = self.dataset.reset_index(drop=True)
+        self.row_index = RowIndex(self.dataset["id"])
+
+    def compact(self):
+        """
+        Drops tombstoned rows from the dataset, its coordinates and the embedding matrices in one vectorized pass
+        """
+        if self.row_index is None or self.row_index.tombstone_ratio == 0:
+            return
+        keep = self.row_index.compact()
+        self.dataset = self.dataset[keep].reset_index(drop=True)
+        if self.embeddings is not None:
+            self.embeddings.compact(keep)
+            for field, engine in self._search_engines.items():
+                engine.compact(self.embeddings.get(field), keep)
+
+    def _live_dataset(self) -> pd.DataFrame:
+        if self.row_index is None or self.row_index.tombstone_ratio == 0:
+            return self.dataset
+        return self.dataset[self.row_index.alive]
+
     def create_embeddings(self):
         if self.dataset is None:
             raise NoDatasetError("You need to load the dataset before creating embeddings")
-        
+        self.compact()
+
         # Convert 'input' and 'output' columns to lists of strings, precasting non-string items
         input_data = [str(item) for item in self.dataset['input'].tolist() if item is not None]
         output_data = [str(item) for item in self.dataset['output'].tolist() if item is not None]
 
 
+        self.embeddings = EmbeddingStore(ids=self.dataset["id"].to_numpy())
+        self._search_engines.clear()
+
         try:
             # Embed the input data
-            input_embeddings = self.embedder.embed_batch(input_data)
-            self.dataset['input_embedding'] = list(input_embeddings)
+            self.embeddings.set('input_embedding', self._embed_column(input_data, 'input_embedding'))
         except Exception as e:
             logging.debug(f"failed to create input embeddings: {e}")
             raise Exception(f"Failed to create input embeddings: {e}")
 
         try:
             # Embed the output data
-            output_embeddings = self.embedder.embed_batch(output_data)
-            self.dataset['output_embedding'] = list(output_embeddings)
+            self.embeddings.set('output_embedding', self._embed_column(output_data, 'output_embedding'))
         except Exception as e:
             logging.debug(f"failed to create output embeddings: {e}")
             raise Exception(f"Failed to create output embeddings: {e}")
 
         print(self.dataset)
 
-    def reduce_dimensions(self):
-        if self.dataset is None:
-            raise NoDatasetError("You need to load and prepare the dataset before reducing dimensions")
+    def _embed_column(self, texts: List[str], name: str) -> np.ndarray:
+        """
+        Streams embeddings of the texts from the embedder straight into one preallocated float32 matrix,
+        or into a memory-mapped .npy file when embedding_dir is set, so no intermediate copies are kept.
 
-        # Assuming 'input_embedding' and 'output_embedding' are the columns you want to reduce
-        input_embeddings = self.dataset['input_embedding']
-        output_embeddings = self.dataset['output_embedding']
+        :param texts: Texts to embed
+        :param name: Name of the embedding field, used as the file name in embedding_dir
+        :return: Matrix with one embedding per text
+        """
+        embeddings = None
+        for rows, block in self.embedder.embed_iter(texts, chunk_size=self.embedding_chunk_size):
+            if embeddings is None:
+                shape = (len(texts), block.shape[1])
+                if self.embedding_dir is not None:
+                    os.makedirs(self.embedding_dir, exist_ok=True)
+                    embeddings = np.lib.format.open_memmap(os.path.join(self.embedding_dir, f"{name}.npy"),
+                                                           mode="w+", dtype=np.float32, shape=shape)
+                else:
+                    embeddings = np.empty(shape, dtype=np.float32)
+            embeddings[rows] = block
+        if embeddings is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return embeddings
 
-        try:
-            # Reduce dimensions for input embeddings
-            reduced_input_embeddings = self.reducer.fit_transform(input_embeddings)
-            # Extracting x and y coordinates
-            self.dataset['instruction_x'] = reduced_input_embeddings[:, 0]  # Extract x coordinates
-            self.dataset['instruction_y'] = reduced_input_embeddings[:, 1]  # Extract y coordinates
-        except Exception as e:
-            logging.debug(f"Failed to reduce dimensions for input embeddings: {e}")
+    def reduce_dimensions(self):
+        if self.dataset is None or self.embeddings is None:
+            raise NoDatasetError("You need to load and prepare the dataset before reducing dimensions")
+        self.compact()
 
-        try:
-            # Reduce dimensions for output embeddings
-            reduced_output_embeddings = self.reducer.fit_transform(output_embeddings)
-            #self.dataset['reduced_output_embedding'] = reduced_output_embeddings.tolist()
-            self.dataset['output_x'] = reduced_output_embeddings[:, 0]  # Extract x coordinates
-            self.dataset['output_y'] = reduced_output_embeddings[:, 1]  # Extract y coordinates
+        # Each field is fit on its own copy of the prototype reducer. The fits run in a thread pool, sklearn,
+        # UMAP and BLAS release the GIL for the heavy lifting
+        reducers = {field: copy.deepcopy(self.reducer) for field in self.REDUCED_COLUMNS}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.reduction_workers, len(reducers)))) as executor:
+            # Zero-copy views of the embedding matrices
+            futures = {field: executor.submit(reducer.fit_transform, self.embeddings.get(field))
+                       for field, reducer in reducers.items()}
+            for field, future in futures.items():
+                x_column, y_column = self.REDUCED_COLUMNS[field]
+                try:
+                    reduced_embeddings = future.result()
+                    # Extracting x and y coordinates
+                    self.dataset[x_column] = reduced_embeddings[:, 0]
+                    self.dataset[y_column] = reduced_embeddings[:, 1]
+                    self.reducers[field] = reducers[field]
+                except Exception as e:
+                    logging.debug(f"Failed to reduce dimensions for {field}: {e}")
 
-        except Exception as e:
-            logging.debug(f"Failed to reduce dimensions for output embeddings: {e}")
+        self._rows_at_fit = len(self.dataset)
+        self._rows_changed_since_fit = 0
 
         print("Reduced Input Embeddings:", self.dataset[['instruction_x', 'instruction_y']])
         print("Reduced Output Embeddings:", self.dataset[['output_x', 'output_y']])
 
         logging.debug("Dimensionality reduction completed successfully.")
 
+    def _place_rows(self, positions):
+        """
+        Computes coordinates of added or edited rows with the already fitted reducers. Once the changed rows
+        cross refit_ratio of the rows the reducers were fit on, all rows are reduced again instead.
+
+        :param positions: Row positions of the added or edited rows
+        """
+        if not self.reducers:
+            return
+        self._rows_changed_since_fit += len(positions)
+        if self._rows_changed_since_fit > self.refit_ratio * self._rows_at_fit:
+            logging.debug("Changed rows crossed the refit ratio, reducing all rows again")
+            self.reduce_dimensions()
+            return
+        for field, reducer in self.reducers.items():
+            reduced_embeddings = reducer.transform(self.embeddings.rows(field, positions))
+            for axis, column in enumerate(self.REDUCED_COLUMNS[field]):
+                self.dataset.iloc[positions, self.dataset.columns.get_loc(column)] = reduced_embeddings[:, axis]
+
     def to_json(self):
         if self.dataset is None:
             raise NoDatasetError("Dataset is not loaded or prepared.")
         
         # Prepare data for JSON conversion
         data_for_json = []
-        for index, row in self.dataset.iterrows():
+        for index, row in self._live_dataset().iterrows():
             item = {
+                "id": int(row["id"]),
                # "instruction": row["instruction"],
                 "input": row["input"],
                 "output": row["output"],
-                "instruction_x": row["instruction_x"],
-                "instruction_y": row["instruction_y"],
-                "output_x": row["output_x"],
-                "output_y": row["output_y"]
+                **self._coordinates(row)
             }
             data_for_json.append(item)
         
@@ -126,44 +290,354 @@ class Spagbol:
         
         return json_data
 
-    def find_similarities(self):
-        pass
+    def _coordinates(self, row: pd.Series) -> Dict[str, Optional[float]]:
+        """
+        :param row: Dataset row
+        :return: Reduced coordinates of the row, None (JSON null) where it has none yet, e.g. for rows imported
+                 before the first reduce_dimensions
+        """
+        coordinates = {}
+        for columns in self.REDUCED_COLUMNS.values():
+            for column in columns:
+                value = row.get(column)
+                coordinates[column] = None if value is None or pd.isna(value) else float(value)
+        return coordinates
+
+    def save_workspace(self, path: str) -> Dict[str, Any]:
+        """
+        Saves the dataset, embeddings, reduced coordinates, cluster labels and fitted models as a workspace,
+        see spagbol.storage.Workspace for the format.
+
+        :param path: Workspace directory
+        :return: The written workspace manifest
+        """
+        if self.dataset is None:
+            raise NoDatasetError("You need to load the dataset before saving a workspace")
+        self.compact()
+        return Workspace(path).save(self.dataset, self.embeddings,
+                                    models={"reducer": self.reducer, "reducers": self.reducers,
+                                            "clustering_model": self.clustering_model,
+                                            "clusterers": self.clusterers,
+                                            "clustering_state": self._clustering_state,
+                                            "cluster_summaries": self.cluster_summaries})
+
+    def open_workspace(self, path: str) -> Dict[str, Any]:
+        """
+        Restores the state saved with save_workspace. Embedding matrices are memory-mapped and paged in lazily.
+
+        :param path: Workspace directory
+        :raises WorkspaceError: If the workspace is missing or has an unsupported version
+        :return: The workspace manifest
+        """
+        state = Workspace(path).load()
+        self.dataset = state["dataset"]
+        self.embeddings = state["embeddings"]
+        self._search_engines.clear()
+        self._build_row_index()
+        self.reducer = state["models"].get("reducer", self.reducer)
+        self.reducers = state["models"].get("reducers", {})
+        self._rows_at_fit = len(self.dataset)
+        self._rows_changed_since_fit = 0
+        self.clustering_model = state["models"].get("clustering_model", self.clustering_model)
+        self.clusterers = state["models"].get("clusterers", {})
+        self._clustering_state = state["models"].get("clustering_state", {})
+        self.cluster_summaries = state["models"].get("cluster_summaries", {})
+        return state["manifest"]
+
+    def knn_graph(self, field: str = "input_embedding", n_neighbors: int = 15, metric: str = "euclidean") -> KnnGraph:
+        """
+        Neighbour graph of an embedding matrix, built once and shared with UMAP and other neighbour-based analyses
+
+        :param field: Name of the embedding field
+        :param n_neighbors: Number of neighbours per row, the row itself included
+        :param metric: Distance metric, euclidean like the UMAP default so both share one graph
+        :return: Graph over the row positions of the dataset
+        """
+        if self.embeddings is None:
+            raise NoDatasetError("You need to create embeddings before building a neighbour graph")
+        self.compact()
+        return KnnGraph.cached(self.embeddings.get(field), n_neighbors=n_neighbors, metric=metric,
+                               cache_dir=self.knn_cache_dir)
+
+    def find_similarities(self, query: Union[str, List[str], None] = None, data_point_id=None, k: int = 10,
+                          field: str = "input_embedding") -> Union[Dict[str, List], List[Dict[str, List]]]:
+        """
+        Exact top-k search by cosine similarity over an embedding field, see spagbol.search.TopKSearch.
+
+        :param query: Text, or list of texts, to find similar data points for
+        :param data_point_id: Id of a data point to find similar data points for, the data point itself is left out
+        :param k: Number of results per query
+        :param field: Embedding field to search in
+        :raises NoDatasetError: If there are no embeddings yet
+        :raises DataPointNotFoundError: If data_point_id doesn't exist
+        :raises ValueError: If neither query nor data_point_id is given, or field isn't an embedding field
+        :return: Ranked ids and scores, {"ids": [...], "scores": [...]}, a list of them for a list of texts
+        """
+        if self.embeddings is None:
+            raise NoDatasetError("You need to create embeddings before finding similarities")
+        if field not in self.embeddings:
+            raise ValueError(f"Unknown embedding field {field}, expected one of {self.embeddings.fields}")
+        self.compact()
+        if data_point_id is not None:
+            position = self._position(data_point_id)
+            vectors = self.embeddings.rows(field, [position])
+            # One more result, the data point finds itself
+            k += 1
+        elif query is not None:
+            vectors = self.embedder.embed_batch([query] if isinstance(query, str) else list(query))
+        else:
+            raise ValueError("Either a query or a data point id is needed to find similarities")
+
+        if field not in self._search_engines:
+            self._search_engines[field] = TopKSearch(self.embeddings.get(field))
+        positions, scores = self._search_engines[field].search(vectors, k)
+
+        results = []
+        for row_positions, row_scores in zip(positions, scores):
+            if data_point_id is not None:
+                keep = row_positions != position
+                row_positions, row_scores = row_positions[keep][:k - 1], row_scores[keep][:k - 1]
+            results.append({"ids": self.embeddings.ids[row_positions].tolist(), "scores": row_scores.tolist()})
+        return results if data_point_id is None and not isinstance(query, str) else results[0]
 
     def get_data_points(self, criteria: Dict[str, Any]) -> List[Dict[str, Any]]:
         # Filter the dataset based on the criteria
-        filtered_data = self.dataset[self.dataset.columns.intersection(criteria.keys())].isin(criteria).dropna()
+        dataset = self._live_dataset()
+        filtered_data = dataset[dataset.columns.intersection(criteria.keys())].isin(criteria).dropna()
         
         # Transform the filtered data into the desired format
         transformed_data = []
-        for _, row in filtered_data.iterrows():
+        for _, row in dataset.loc[filtered_data.index].iterrows():
             transformed_data.append({
-                "instruction": row["instruction"],
+                "id": int(row["id"]),
+                "instruction": row.get("instruction", ""),
                 "input": row.get("input", ""),  # Assuming 'input' column might not exist for all rows
                 "output": row["output"],
-                "instruction_x": row["instruction_x"],
-                "instruction_y": row["instruction_y"],
-                "output_x": row["output_x"],
-                "output_y": row["output_y"]
+                **self._coordinates(row)
             })
     
         return transformed_data
 
+    def _update_search_engines(self, positions=()):
+        """
+        Updates the search engines for rows that were edited in place or appended
+        """
+        for field, engine in self._search_engines.items():
+            engine.update(self.embeddings.get(field), positions)
+
+    def _resolve_id(self, data_point_id):
+        """
+        :param data_point_id: Id of a data point, ids from query strings or path parameters arrive as text
+        :raises DataPointNotFoundError: If there is no live data point with this id
+        :return: The id in the type of the row index
+        """
+        try:
+            if isinstance(data_point_id, str) and np.issubdtype(self.dataset["id"].dtype, np.integer):
+                data_point_id = int(data_point_id)
+        except ValueError:
+            raise DataPointNotFoundError(f"Data point with id {data_point_id} doesn't exist")
+        if data_point_id not in self.row_index:
+            raise DataPointNotFoundError(f"Data point with id {data_point_id} doesn't exist")
+        return data_point_id
+
+    def _position(self, data_point_id) -> int:
+        return self.row_index.position(self._resolve_id(data_point_id))
+
     def edit_data_point(self, new_data_point: Dict[str, Any]):
         if self.dataset is None:
             raise NoDatasetError("You need to load the dataset before editing data points")
-        data_point_df = pd.DataFrame.from_dict(new_data_point)
-        data_point_df["input_embedding"] = self.embedder.embed(new_data_point["input"])
-        data_point_df["output_embedding"] = self.embedder.embed(new_data_point["output_embedding"])
-        self.dataset[self.dataset["id"] == new_data_point["id"]] = data_point_df
+        position = self._position(new_data_point["id"])
+        for column in ("input", "output"):
+            self.dataset.iat[position, self.dataset.columns.get_loc(column)] = new_data_point[column]
+        if self.embeddings is not None:
+            self.embeddings.update_rows("input_embedding", [position], self.embedder.embed(new_data_point["input"]))
+            self.embeddings.update_rows("output_embedding", [position], self.embedder.embed(new_data_point["output"]))
+            self._update_search_engines([position])
+            self._place_rows([position])
+        self._mark_changed([new_data_point["id"]])
+
+    def batch_update_data_points(self, data_points: List[Dict[str, Any]]):
+        if self.dataset is None:
+            raise NoDatasetError("You need to load the dataset before editing data points")
+        positions = np.array([self._position(data_point["id"]) for data_point in data_points], dtype=np.int64)
+        for column in ("input", "output"):
+            texts = [data_point[column] for data_point in data_points]
+            self.dataset.iloc[positions, self.dataset.columns.get_loc(column)] = texts
+            if self.embeddings is not None:
+                self.embeddings.update_rows(f"{column}_embedding", positions, self.embedder.embed_batch(texts))
+        if self.embeddings is not None:
+            self._update_search_engines(positions)
+            self._place_rows(positions)
+        self._mark_changed([data_point["id"] for data_point in data_points])
 
     def delete_data_point(self, data_point_id):
         if self.dataset is None:
             raise NoDatasetError("You need to load the dataset before editing data points")
-        self.dataset.drop(self.dataset[self.dataset["id"] == data_point_id].index)
+        data_point_id = self._resolve_id(data_point_id)
+        self.row_index.delete(data_point_id)
+        self._mark_changed([data_point_id])
+        if self.row_index.tombstone_ratio > self.compaction_ratio:
+            self.compact()
+
+    def batch_delete_data_points(self, data_point_ids: List[Any]):
+        if self.dataset is None:
+            raise NoDatasetError("You need to load the dataset before editing data points")
+        # Every id is resolved and deduplicated before the first delete, so a failing batch changes nothing
+        resolved, missing = {}, []
+        for data_point_id in data_point_ids:
+            try:
+                resolved[self._resolve_id(data_point_id)] = None
+            except DataPointNotFoundError:
+                missing.append(data_point_id)
+        if missing:
+            raise DataPointNotFoundError(f"Data points with ids {missing} don't exist")
+        data_point_ids = list(resolved)
+        for data_point_id in data_point_ids:
+            self.row_index.delete(data_point_id)
+        self._mark_changed(data_point_ids)
+        if self.row_index.tombstone_ratio > self.compaction_ratio:
+            self.compact()
 
-    def apply_clustering(self, target_column: str):
-        clustered_dataset = self.clustering_model.fit_predict(self.dataset[target_column])
-        if clustered_dataset is None:
+    def add_data_point(self, new_data_point: Dict[str, Any]) -> int:
+        """
+        :param new_data_point: Data point with 'input' and 'output' texts
+        :return: Id assigned to the new data point
+        """
+        return int(self.import_data([new_data_point])[0])
+
+    def import_data(self, data_points: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Appends new data points with fresh ids. Embeddings of the new rows are computed in one batch per field
+        and coordinates are placed with the fitted reducers; cluster labels stay empty until the next clustering.
+
+        :param data_points: Data points with 'input' and 'output' texts
+        :return: Ids assigned to the new data points
+        """
+        if self.dataset is None:
+            raise NoDatasetError("You need to load the dataset before adding data points")
+        ids = self.row_index.append(len(data_points))
+        rows = pd.DataFrame({"id": ids,
+                             "input": [str(data_point["input"]) for data_point in data_points],
+                             "output": [str(data_point["output"]) for data_point in data_points]})
+        self.dataset = pd.concat([self.dataset, rows], ignore_index=True)
+        if self.embeddings is not None:
+            self.embeddings.append(ids, {
+                field: self.embedder.embed_batch(rows[column].tolist())
+                for field, column in (("input_embedding", "input"), ("output_embedding", "output"))
+                if field in self.embeddings
+            })
+            # The appended rows are picked up by the search engines without listing them
+            self._update_search_engines()
+            self._place_rows(np.arange(len(self.dataset) - len(ids), len(self.dataset)))
+        self._mark_changed(ids)
+        return ids
+
+    @staticmethod
+    def cluster_column(target_column: str) -> str:
+        """
+        :param target_column: Embedding field or dataset column that was clustered
+        :return: Name of the dataset column with the cluster labels
+        """
+        return f"{target_column}_cluster"
+
+    def _mark_changed(self, data_point_ids):
+        """
+        Records added, edited or deleted rows for the next clustering of every target column and drops the cluster
+        summaries, which no longer match the rows
+        """
+        data_point_ids = [int(data_point_id) for data_point_id in data_point_ids]
+        self.cluster_summaries.clear()
+        for state in self._clustering_state.values():
+            state["changed_since_fit"] += len(data_point_ids)
+            state["changed_ids"].update(data_point_ids)
+
+    def apply_clustering(self, target_column: str = "input_embedding", refit: bool = False) -> np.ndarray:
+        """
+        Clusters the rows on an embedding field or a dataset column and stores the labels in the dataset, see
+        cluster_column. After edits only the added and edited rows are labelled with the fitted model, so the
+        labels of the other rows stay as they are. Once the rows changed since the last fit, over all calls,
+        make up more than recluster_ratio of the rows of that fit, the model is fit again, starting from its
+        previous fit where it supports that.
+
+        :param target_column: Embedding field or dataset column to cluster on
+        :param refit: Fit the model again even when only a few rows changed
+        :raises ClusteringError: If the clustering model fails
+        :return: Cluster label of every row
+        """
+        if self.dataset is None:
+            raise NoDatasetError("You need to load the dataset before clustering")
+        self.compact()
+        if self.embeddings is not None and target_column in self.embeddings:
+            data = self.embeddings.get(target_column)
+        else:
+            data = self.dataset[target_column]
+        column = self.cluster_column(target_column)
+        clusterer = self.clusterers.get(target_column)
+        state = self._clustering_state.get(target_column)
+
+        if clusterer is None or state is None or column not in self.dataset.columns:
+            clusterer = copy.deepcopy(self.clustering_model)
+            labels = clusterer.fit_predict(data)
+            refitted = True
+        elif (refit or not clusterer.can_predict
+              or state["changed_since_fit"] > self.recluster_ratio * state["rows_at_fit"]):
+            logging.debug(f"Clustering {target_column} again, starting from the previous fit")
+            labels = clusterer.refit_predict(data)
+            refitted = True
+        else:
+            labels = self.dataset[column].to_numpy(copy=True)
+            changed = [data_point_id for data_point_id in state["changed_ids"] if data_point_id in self.row_index]
+            if changed:
+                positions = self.row_index.positions(changed)
+                rows = data.iloc[positions] if isinstance(data, pd.Series) else data[positions]
+                changed_labels = clusterer.predict(rows)
+                if changed_labels is None:
+                    raise ClusteringError("An error occurred while labelling the changed rows for target column %s"
+                                          % target_column)
+                labels[positions] = changed_labels
+            refitted = False
+        if labels is None:
             raise ClusteringError("An error occurred while clustering the dataset for target column %s" % target_column)
 
-        return clustered_dataset
+        self.dataset[column] = np.asarray(labels, dtype=np.int64)
+        self.clusterers[target_column] = clusterer
+        if refitted:
+            self._clustering_state[target_column] = {"rows_at_fit": len(self.dataset), "changed_since_fit": 0,
+                                                     "changed_ids": set()}
+        else:
+            # The labelled rows still count towards recluster_ratio until the next fit
+            state["changed_ids"].clear()
+        self.cluster_summaries[target_column] = self._summarize_clusters(target_column, data)
+        return self.dataset[column].to_numpy()
+
+    def _summarize_clusters(self, target_column: str, data) -> Dict[str, Any]:
+        """
+        :param target_column: Clustered embedding field or dataset column
+        :param data: Matrix or column the rows were clustered on
+        :return: JSON serializable ClusterSummaries of the current labels
+        """
+        if isinstance(data, pd.Series):
+            data = np.asarray(data.tolist(), dtype=np.float32).reshape(len(data), -1)
+        coordinates = None
+        reduced_columns = list(self.REDUCED_COLUMNS.get(target_column, ()))
+        if reduced_columns and set(reduced_columns) <= set(self.dataset.columns):
+            coordinates = self.dataset[reduced_columns].to_numpy(dtype=np.float32)
+        summaries = ClusterSummaries.compute(self.dataset[self.cluster_column(target_column)].to_numpy(),
+                                             self.dataset["id"].to_numpy(), data, coordinates,
+                                             top_k=self.cluster_examples)
+        return summaries.to_dict(self.dataset.set_index("id")[["input", "output"]])
+
+    def get_cluster_summaries(self, target_column: str = "input_embedding") -> Dict[str, Any]:
+        """
+        Rows changed since the last clustering are labelled first, see apply_clustering, so the summaries always
+        match the current rows.
+
+        :param target_column: Clustered embedding field or dataset column
+        :raises ClusteringError: If the target column wasn't clustered yet
+        :return: Sizes, centroids, medoids and nearest members of the clusters, see ClusterSummaries
+        """
+        if target_column not in self.cluster_summaries and target_column in self._clustering_state:
+            self.apply_clustering(target_column)
+        if target_column not in self.cluster_summaries:
+            raise ClusteringError(f"Target column {target_column} hasn't been clustered yet")
+        return self.cluster_summaries[target_column]
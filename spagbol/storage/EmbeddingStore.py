@@ -0,0 +1,154 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    Holds the embeddings of a dataset, one C-contiguous float32 matrix per embedding field
+    (e.g. input_embedding and output_embedding). Row i of every matrix belongs to ids[i], so the store stays
+    aligned with the dataset rows it was created for.
+    get returns read-only zero-copy views, so reducers, clusterers and similarity code can consume the
+    matrices directly. Matrices may be memory-mapped files, they are only copied into memory when rows
+    are appended.
+    Example usage:
+        store = EmbeddingStore(ids=dataset["id"].to_numpy())
+        store.set("input_embedding", embeddings)
+        reduced = reducer.fit_transform(store.get("input_embedding"))
+
+    :param ids: Ids of the dataset rows in matrix row order
+    """
+
+    def __init__(self, ids: Iterable):
+        self._ids = np.asarray(ids)
+        self._size = len(self._ids)
+        # Field matrices can have spare capacity at the end to make appends cheap, rows past _size are unused
+        self._fields: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, field: str) -> bool:
+        return field in self._fields
+
+    @property
+    def ids(self) -> np.ndarray:
+        """
+        Ids of the rows, in matrix row order
+        """
+        return self._ids[:self._size]
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._fields)
+
+    def set(self, field: str, matrix: np.ndarray):
+        """
+        Stores a matrix for a field. Float32 C-contiguous arrays, including memory maps, are stored without
+        a copy.
+
+        :param field: Name of the embedding field
+        :param matrix: Matrix with one row per id
+        :raises ValueError: If the matrix isn't two-dimensional or doesn't have a row per id
+        """
+        if isinstance(matrix, np.ndarray) and matrix.dtype == object:
+            matrix = np.stack(matrix)
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != self._size:
+            raise ValueError(f"Expected a matrix with {self._size} rows for {field}, got shape {matrix.shape}")
+        self._fields[field] = matrix
+
+    def get(self, field: str) -> np.ndarray:
+        """
+        Returns a read-only zero-copy view of a field matrix
+
+        :param field: Name of the embedding field
+        :raises KeyError: If the field doesn't exist
+        :return: Matrix view with shape (len(store), dim)
+        """
+        view = self._fields[field][:self._size].view()
+        view.flags.writeable = False
+        return view
+
+    def rows(self, field: str, positions) -> np.ndarray:
+        """
+        Copies rows of a field matrix
+
+        :param field: Name of the embedding field
+        :param positions: Row positions
+        :return: Matrix with the selected rows
+        """
+        return self._fields[field][:self._size][positions]
+
+    def update_rows(self, field: str, positions, values: np.ndarray):
+        """
+        Overwrites rows of a field matrix in place
+
+        :param field: Name of the embedding field
+        :param positions: Row positions
+        :param values: New embeddings for the rows
+        """
+        matrix = self._fields[field]
+        if not matrix.flags.writeable:
+            # Read-only memory maps are copied once before the first edit
+            matrix = self._fields[field] = np.array(matrix)
+        matrix[:self._size][positions] = values
+
+    def append(self, ids: Iterable, values: Dict[str, np.ndarray]):
+        """
+        Appends rows for new ids. Matrices grow geometrically, so appending is amortized O(rows appended).
+
+        :param ids: Ids of the new rows
+        :param values: New embeddings for every field of the store
+        :raises ValueError: If values don't cover exactly the fields of the store
+        """
+        ids = np.asarray(ids)
+        if set(values) != set(self._fields):
+            raise ValueError(f"Appended rows need values for fields {sorted(self._fields)}")
+        new_size = self._size + len(ids)
+        capacity = len(self._ids)
+        if new_size > capacity:
+            capacity = max(new_size, 2 * capacity)
+            self._ids = self._grow(self._ids, capacity)
+            for field, matrix in self._fields.items():
+                self._fields[field] = self._grow(matrix, capacity)
+        self._ids[self._size:new_size] = ids
+        for field, matrix in self._fields.items():
+            matrix[self._size:new_size] = values[field]
+        self._size = new_size
+
+    def delete(self, positions):
+        """
+        Removes rows and compacts every matrix, keeping the remaining rows in order
+
+        :param positions: Row positions to remove
+        """
+        keep = np.ones(self._size, dtype=bool)
+        keep[positions] = False
+        self.compact(keep)
+
+    def compact(self, keep: np.ndarray):
+        """
+        Keeps only the rows selected by a boolean mask, in one vectorized pass per matrix
+
+        :param keep: Boolean mask with one value per row
+        """
+        self._ids = self._ids[:self._size][keep]
+        for field, matrix in self._fields.items():
+            self._fields[field] = np.ascontiguousarray(matrix[:self._size][keep])
+        self._size = len(self._ids)
+
+    def _grow(self, array: np.ndarray, capacity: int) -> np.ndarray:
+        grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+        grown[:self._size] = array[:self._size]
+        return grown
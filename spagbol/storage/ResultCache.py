@@ -0,0 +1,216 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from spagbol.storage.fingerprint import array_fingerprint
+
+
+class ResultCache:
+    """
+    On-disk LRU cache of analysis results, e.g. reduced coordinates or cluster labels together with the fitted
+    model that produced them. Entries are keyed by the fingerprint of the input matrix plus the class and
+    parameters of the model, see key. Used by CachedReduction and CachedClustering.
+    Example usage:
+        cache = ResultCache("/var/cache/spagbol/results")
+        reducer = CachedReduction(UmapReduction(min_dist=0.3), cache)
+        reduced_data = reducer.fit_transform(embeddings)  # instant when the same analysis ran before
+        cache.stats()
+
+    :param cache_dir: Directory for the entries and the index
+    :param max_bytes: Size bound for all entries together
+    """
+
+    _INDEX_VERSION = 1
+
+    def __init__(self, cache_dir: str, max_bytes: int = 4 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._clock = 0
+        # key -> {"bytes", "last_used"}
+        self._entries: Dict[str, Dict] = {}
+        self._hits = self._misses = self._evictions = 0
+        self._load_index()
+
+    def __getstate__(self):
+        # Fitted models that reference the cache are pickled into workspaces, only the location is kept
+        return {"cache_dir": self.cache_dir, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["cache_dir"], state["max_bytes"])
+
+    def __deepcopy__(self, memo):
+        # Copies of cached models share the cache
+        return self
+
+    def key(self, model: Any, data: np.ndarray) -> str:
+        """
+        :param model: Unfitted model, its class and public parameters (and those of the sklearn estimator in
+                      its _model attribute) are part of the key
+        :param data: Input matrix
+        :return: Cache key
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{type(model).__module__}.{type(model).__qualname__}".encode())
+        digest.update(_stable_repr(_model_params(model)).encode())
+        digest.update(array_fingerprint(data).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[Any, Any]]:
+        """
+        :param key: Cache key
+        :return: (output, fitted model), or None on a cache miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._clock += 1
+            entry["last_used"] = self._clock
+        try:
+            with open(self._entry_path(key), "rb") as entry_file:
+                result = pickle.load(entry_file)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logging.debug(f"Discarding result cache entry {key}: {e}")
+            with self._lock:
+                self._remove(key)
+                self._misses += 1
+                self._save_index()
+            return None
+        with self._lock:
+            self._hits += 1
+            self._save_index()
+        return result["output"], result["model"]
+
+    def put(self, key: str, output: Any, model: Any):
+        """
+        Stores the output of a fitted model. Entries larger than max_bytes are not cached.
+
+        :param key: Cache key
+        :param output: Output of the analysis, e.g. reduced data or labels
+        :param model: Fitted model
+        """
+        path = self._entry_path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as entry_file:
+            pickle.dump({"output": output, "model": model}, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            os.remove(tmp_path)
+            return
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._clock += 1
+            self._entries[key] = {"bytes": size, "last_used": self._clock}
+            self._evict()
+            self._save_index()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: Hits, misses and evictions since the cache was opened, plus the current entries and size
+        """
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "evictions": self._evictions,
+                    "entries": len(self._entries), "bytes": sum(entry["bytes"] for entry in self._entries.values())}
+
+    def clear(self):
+        """
+        Removes every entry
+        """
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+            self._save_index()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        if os.path.exists(self._entry_path(key)):
+            os.remove(self._entry_path(key))
+
+    def _evict(self):
+        """
+        Removes least recently used entries until all of them fit into max_bytes
+        """
+        total = sum(entry["bytes"] for entry in self._entries.values())
+        for key, entry in sorted(self._entries.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= entry["bytes"]
+            self._remove(key)
+            self._evictions += 1
+
+    def _load_index(self):
+        """
+        Loads the index from disk. A missing or mismatching index resets the cache.
+        """
+        if not os.path.exists(self._index_path):
+            return
+        try:
+            with open(self._index_path) as index_file:
+                state = json.load(index_file)
+            if state["version"] != self._INDEX_VERSION:
+                raise ValueError("Result cache index belongs to a different version")
+            self._clock = state["clock"]
+            self._entries = {key: entry for key, entry in state["entries"].items()
+                             if os.path.exists(self._entry_path(key))}
+        except (OSError, ValueError, KeyError) as e:
+            logging.debug(f"Discarding result cache index at {self.cache_dir}: {e}")
+            self._clock, self._entries = 0, {}
+
+    def _save_index(self):
+        """
+        Atomically writes the index
+        """
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as index_file:
+            json.dump({"version": self._INDEX_VERSION, "clock": self._clock, "entries": self._entries}, index_file)
+        os.replace(tmp_path, self._index_path)
+
+
+def _model_params(model: Any) -> Dict[str, Any]:
+    """
+    Public attributes of a model, plus the parameters of the estimator it wraps in _model
+    """
+    params = {name: value for name, value in vars(model).items() if not name.startswith("_")}
+    estimator = getattr(model, "_model", None)
+    if hasattr(estimator, "get_params"):
+        params["_model"] = estimator.get_params(deep=False)
+    return params
+
+
+def _stable_repr(value: Any) -> str:
+    """
+    Deterministic representation of parameters, arrays are represented by their fingerprint
+    """
+    if isinstance(value, np.ndarray):
+        return f"array:{array_fingerprint(value)}"
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{key!r}:{_stable_repr(value[key])}" for key in sorted(value, key=str)) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_stable_repr(item) for item in value) + "]"
+    if value is None or isinstance(value, (bool, int, float, str, np.generic)):
+        return repr(value)
+    # Other objects (callables, nested models) only contribute their type
+    return f"<{type(value).__module__}.{type(value).__qualname__}>"
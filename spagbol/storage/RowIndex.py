@@ -0,0 +1,151 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from typing import Any, Iterable
+
+import numpy as np
+
+
+class RowIndex:
+    """
+    Hash index from stable row id to row position, with tombstone deletes.
+    Lookups and deletes are O(1): a deleted row only gets its tombstone flag set and stays in place until
+    compact is called, which drops all tombstoned rows in one pass and renumbers the live rows. Every id maps to a
+    slot of a numpy array that holds its position, so compaction remaps the positions with one vectorized
+    gather instead of rebuilding the hash map. Callers have to compact every row-aligned structure (dataset,
+    embedding matrices) with the mask compact returns.
+    Example usage:
+        index = RowIndex(dataset["id"])
+        position = index.position(data_point_id)
+        index.delete(data_point_id)
+        if index.tombstone_ratio > 0.1:
+            keep = index.compact()
+            dataset = dataset[keep]
+
+    :param ids: Unique ids of the rows in position order
+    """
+
+    def __init__(self, ids: Iterable):
+        ids = np.asarray(ids)
+        self._slots = dict(zip(ids.tolist(), range(len(ids))))
+        if len(self._slots) != len(ids):
+            raise ValueError("Row ids have to be unique")
+        # Position per slot, -1 for the slots of deleted rows. Like the alive flags, the array can have spare
+        # capacity at the end to make appends cheap
+        self._slot_positions = np.arange(len(ids), dtype=np.int64)
+        self._slot_count = len(ids)
+        self._size = len(ids)
+        self._alive = np.ones(len(ids), dtype=bool)
+        self._tombstones = 0
+        self._next_id = int(ids.max()) + 1 if len(ids) and np.issubdtype(ids.dtype, np.integer) else 0
+
+    def __len__(self) -> int:
+        """
+        Number of live rows
+        """
+        return self._size - self._tombstones
+
+    def __contains__(self, row_id: Any) -> bool:
+        return row_id in self._slots
+
+    @property
+    def size(self) -> int:
+        """
+        Number of positions, including tombstoned rows
+        """
+        return self._size
+
+    @property
+    def alive(self) -> np.ndarray:
+        """
+        Boolean mask of the rows that are not deleted, one value per position
+        """
+        return self._alive[:self._size]
+
+    @property
+    def tombstone_ratio(self) -> float:
+        return self._tombstones / self._size if self._size else 0.0
+
+    def position(self, row_id: Any) -> int:
+        """
+        :raises KeyError: If there is no live row with this id
+        :return: Position of the row
+        """
+        return int(self._slot_positions[self._slots[row_id]])
+
+    def positions(self, row_ids: Iterable) -> np.ndarray:
+        """
+        :raises KeyError: If one of the ids has no live row
+        :return: Positions of the rows
+        """
+        return self._slot_positions[np.fromiter((self._slots[row_id] for row_id in row_ids), dtype=np.int64)]
+
+    def delete(self, row_id: Any) -> int:
+        """
+        Tombstones a row
+
+        :raises KeyError: If there is no live row with this id
+        :return: Position of the deleted row
+        """
+        slot = self._slots.pop(row_id)
+        position = int(self._slot_positions[slot])
+        self._slot_positions[slot] = -1
+        self._alive[position] = False
+        self._tombstones += 1
+        return position
+
+    def append(self, count: int) -> np.ndarray:
+        """
+        Assigns ids to new rows placed after the current last position
+
+        :param count: Number of new rows
+        :return: Ids of the new rows
+        """
+        new_ids = np.arange(self._next_id, self._next_id + count, dtype=np.int64)
+        new_size = self._size + count
+        if new_size > len(self._alive):
+            grown = np.ones(max(new_size, 2 * len(self._alive)), dtype=bool)
+            grown[:self._size] = self._alive[:self._size]
+            self._alive = grown
+        self._alive[self._size:new_size] = True
+
+        new_slot_count = self._slot_count + count
+        if new_slot_count > len(self._slot_positions):
+            grown = np.empty(max(new_slot_count, 2 * len(self._slot_positions)), dtype=np.int64)
+            grown[:self._slot_count] = self._slot_positions[:self._slot_count]
+            self._slot_positions = grown
+        self._slot_positions[self._slot_count:new_slot_count] = np.arange(self._size, new_size)
+        self._slots.update(zip(new_ids.tolist(), range(self._slot_count, new_slot_count)))
+        self._slot_count = new_slot_count
+        self._size = new_size
+        self._next_id += count
+        return new_ids
+
+    def compact(self) -> np.ndarray:
+        """
+        Drops tombstoned positions and renumbers the live rows
+
+        :return: Boolean keep mask over the old positions, to compact row-aligned structures with
+        """
+        keep = self.alive.copy()
+        new_positions = np.cumsum(keep) - 1
+        slot_positions = self._slot_positions[:self._slot_count]
+        live_slots = slot_positions >= 0
+        slot_positions[live_slots] = new_positions[slot_positions[live_slots]]
+        if self._slot_count > 2 * len(self._slots):
+            # Most slots belong to deleted rows, the hash map is rebuilt once to free them
+            slots = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+            self._slot_positions = slot_positions[slots]
+            self._slots = dict(zip(self._slots.keys(), range(len(slots))))
+            self._slot_count = len(slots)
+        self._size = int(keep.sum())
+        self._alive = np.ones(self._size, dtype=bool)
+        self._tombstones = 0
+        return keep
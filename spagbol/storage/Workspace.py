@@ -0,0 +1,199 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from spagbol.errors import WorkspaceError
+from spagbol.storage.EmbeddingStore import EmbeddingStore
+from spagbol.storage.fingerprint import array_fingerprint, dataset_fingerprint
+
+
+class Workspace:
+    """
+    On-disk snapshot of a prepared Spagbol state, so a restart doesn't have to load, embed and reduce again.
+    Layout of a workspace directory:
+        manifest.json       format version, fingerprint, row count and the files below
+        dataset.parquet     text columns, ids, reduced coordinates and cluster labels
+        <field>.npy         one float32 matrix per embedding field, opened with mmap_mode on load
+        <name>.pkl          fitted reducer and clustering models
+    Opening reads the manifest and the Parquet file, embedding matrices are memory-mapped copy-on-write and
+    paged in lazily, edits after opening never change the saved files.
+    Models are stored with pickle, only open workspaces from trusted sources. Paths that come from clients
+    have to be resolved with in_root, so only workspaces below a configured root directory are used.
+    Example usage:
+        Workspace("/data/alpaca-workspace").save(dataset, embeddings, models={"reducer": reducer})
+        state = Workspace("/data/alpaca-workspace").load()
+        For a path sent by a client:
+            workspace = Workspace.in_root("/data/workspaces", request.json["path"])
+
+    :param path: Directory of the workspace
+    """
+
+    VERSION = 1
+    MANIFEST = "manifest.json"
+    DATASET = "dataset.parquet"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def in_root(cls, root: Optional[str], path: str) -> "Workspace":
+        """
+        Resolves a workspace path relative to a root directory, symlinks included
+
+        :param root: Directory all workspaces have to be in, None disables workspaces
+        :param path: Workspace path relative to root
+        :raises WorkspaceError: If no root is configured or the path resolves to a location outside of it
+        :return: The workspace
+        """
+        if not root:
+            raise WorkspaceError("Workspaces are disabled, no workspace directory is configured")
+        if not isinstance(path, str) or not path:
+            raise WorkspaceError("Workspace path has to be a non-empty string")
+        root = os.path.realpath(root)
+        resolved = os.path.realpath(os.path.join(root, path))
+        if resolved == root or os.path.commonpath([root, resolved]) != root:
+            raise WorkspaceError(f"Workspace path {path} is outside of the workspace directory")
+        return cls(resolved)
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, self.MANIFEST))
+
+    def save(self, dataset: pd.DataFrame, embeddings: Optional[EmbeddingStore],
+             models: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Writes the state into the workspace directory. Every file is written under a temporary name and moved
+        into place, the manifest last, so an interrupted save leaves the previous workspace readable.
+
+        :param dataset: Dataset with text columns, coordinates and cluster labels
+        :param embeddings: Embedding matrices aligned with the dataset rows
+        :param models: Fitted models to store, by name
+        :return: The written manifest
+        """
+        os.makedirs(self.path, exist_ok=True)
+        started = time.perf_counter()
+
+        self._write(self.DATASET, lambda tmp_path: dataset.to_parquet(tmp_path, index=True))
+        manifest = {
+            "version": self.VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "rows": len(dataset),
+            "dataset": {"file": self.DATASET, "fingerprint": dataset_fingerprint(dataset)},
+            "embeddings": {},
+            "models": {},
+        }
+
+        if embeddings is not None:
+            manifest["ids"] = {"file": "ids.npy"}
+            self._write("ids.npy", lambda tmp_path: self._save_array(tmp_path, embeddings.ids))
+            for field in embeddings.fields:
+                matrix = embeddings.get(field)
+                file_name = f"{field}.npy"
+                self._write(file_name, lambda tmp_path: self._save_array(tmp_path, matrix))
+                manifest["embeddings"][field] = {"file": file_name, "shape": list(matrix.shape),
+                                                 "fingerprint": array_fingerprint(matrix)}
+
+        for name, model in (models or {}).items():
+            if model is None:
+                continue
+            file_name = f"{name}.pkl"
+            self._write(file_name, lambda tmp_path: self._pickle(tmp_path, model))
+            manifest["models"][name] = {"file": file_name, "class": type(model).__name__}
+
+        manifest["fingerprint"] = self._fingerprint(manifest)
+        self._write(self.MANIFEST, lambda tmp_path: self._dump_json(tmp_path, manifest))
+        logging.debug(f"Saved workspace {self.path} in {time.perf_counter() - started:.2f}s")
+        return manifest
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Opens the workspace.
+
+        :raises WorkspaceError: If there is no workspace at the path or it has an unsupported version
+        :return: Dictionary with manifest, dataset, embeddings (EmbeddingStore or None) and models
+        """
+        manifest = self.manifest()
+        dataset = pd.read_parquet(os.path.join(self.path, manifest["dataset"]["file"]))
+        if len(dataset) != manifest["rows"]:
+            raise WorkspaceError(f"Workspace dataset has {len(dataset)} rows, manifest expects {manifest['rows']}")
+
+        embeddings = None
+        if "ids" in manifest:
+            embeddings = EmbeddingStore(ids=np.load(os.path.join(self.path, manifest["ids"]["file"])))
+            for field, entry in manifest["embeddings"].items():
+                # Copy-on-write: pages are read on access and edits stay in memory
+                matrix = np.load(os.path.join(self.path, entry["file"]), mmap_mode="c")
+                if list(matrix.shape) != entry["shape"]:
+                    raise WorkspaceError(f"Embedding file for {field} has shape {matrix.shape}, "
+                                         f"manifest expects {entry['shape']}")
+                embeddings.set(field, matrix)
+
+        models = {}
+        for name, entry in manifest["models"].items():
+            with open(os.path.join(self.path, entry["file"]), "rb") as model_file:
+                models[name] = pickle.load(model_file)
+
+        return {"manifest": manifest, "dataset": dataset, "embeddings": embeddings, "models": models}
+
+    def manifest(self) -> Dict[str, Any]:
+        """
+        Reads and validates the manifest
+
+        :raises WorkspaceError: If there is no workspace at the path or it has an unsupported version
+        """
+        if not self.exists():
+            raise WorkspaceError(f"There is no workspace at {self.path}")
+        with open(os.path.join(self.path, self.MANIFEST)) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get("version") != self.VERSION:
+            raise WorkspaceError(f"Workspace version {manifest.get('version')} is not supported, "
+                                 f"expected {self.VERSION}")
+        return manifest
+
+    def _write(self, file_name: str, writer):
+        path = os.path.join(self.path, file_name)
+        tmp_path = f"{path}.tmp"
+        writer(tmp_path)
+        # Replacing keeps memory maps of the previous file valid, they still point to the old inode
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _save_array(path: str, array: np.ndarray):
+        with open(path, "wb") as array_file:
+            np.save(array_file, np.ascontiguousarray(array))
+
+    @staticmethod
+    def _pickle(path: str, model: Any):
+        with open(path, "wb") as model_file:
+            pickle.dump(model, model_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _dump_json(path: str, content: Dict[str, Any]):
+        with open(path, "w") as json_file:
+            json.dump(content, json_file, indent=2)
+
+    @staticmethod
+    def _fingerprint(manifest: Dict[str, Any]) -> str:
+        """
+        Workspace fingerprint that covers the dataset, every embedding matrix and the stored model classes
+        """
+        parts = [manifest["dataset"]["fingerprint"]]
+        parts += [f"{field}:{entry['fingerprint']}" for field, entry in sorted(manifest["embeddings"].items())]
+        parts += [f"{name}:{entry['class']}" for name, entry in sorted(manifest["models"].items())]
+        return hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest()
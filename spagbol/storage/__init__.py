@@ -0,0 +1,4 @@
+from .EmbeddingStore import EmbeddingStore
+from .Workspace import Workspace
+from .RowIndex import RowIndex
+from .ResultCache import ResultCache
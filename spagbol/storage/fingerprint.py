@@ -0,0 +1,59 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# Rows hashed in full by array_fingerprint, spread evenly over the array
+_SAMPLE_ROWS = 4096
+# Rows reduced at once when computing row checksums, bounds the temporary float64 memory
+_CHUNK_ROWS = 65536
+
+
+def array_fingerprint(array: np.ndarray) -> str:
+    """
+    Fast content fingerprint of a numerical array, e.g. an embedding matrix or a memory-mapped file.
+    Hashes shape, dtype, an evenly strided sample of rows and a weighted checksum of every row, so any edited
+    or reordered row changes the fingerprint without hashing every byte of a large matrix.
+
+    :param array: Numerical array
+    :return: Hex digest
+    """
+    array = np.asarray(array)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((array.shape, array.dtype.str)).encode())
+    if array.size == 0:
+        return digest.hexdigest()
+
+    rows = array.reshape(len(array), -1)
+    step = max(len(rows) // _SAMPLE_ROWS, 1)
+    digest.update(np.ascontiguousarray(rows[::step]).tobytes())
+
+    # Weights make the checksum sensitive to values swapping places within a row
+    weights = np.linspace(1.0, 2.0, rows.shape[1])
+    for start in range(0, len(rows), _CHUNK_ROWS):
+        checksums = rows[start:start + _CHUNK_ROWS].astype(np.float64) @ weights
+        digest.update(checksums.tobytes())
+    return digest.hexdigest()
+
+
+def dataset_fingerprint(dataset: pd.DataFrame) -> str:
+    """
+    Content fingerprint of a DataFrame, including its column names and index
+
+    :param dataset: Dataset to fingerprint
+    :return: Hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(list(dataset.columns)).encode())
+    digest.update(array_fingerprint(pd.util.hash_pandas_object(dataset, index=True).to_numpy()).encode())
+    return digest.hexdigest()
@@ -0,0 +1,29 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from typing import Iterable
+
+import numpy as np
+
+
+def as_matrix(data: Iterable) -> np.ndarray:
+    """
+    Returns numerical matrices as they are, so float32 embedding matrices reach the models without a copy and
+    memory-mapped matrices are only read where they are sliced. Sequences of per-row arrays (e.g. a DataFrame
+    column of embeddings) are stacked into one float32 matrix.
+
+    :param data: Matrix, DataFrame, Series or sequence of rows
+    :return: Two-dimensional numerical matrix
+    """
+    if hasattr(data, "to_numpy"):
+        data = data.to_numpy()
+    if isinstance(data, np.ndarray) and data.ndim == 2 and data.dtype != object:
+        return data
+    return np.stack([np.asarray(row, dtype=np.float32) for row in data])
@@ -0,0 +1,58 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import numpy as np
+import pandas as pd
+from spagbol.clustering import ClusterSummaries
+
+# you can run this test using the following command line call
+# python -m unittest tests.clustering.test_cluster_summaries
+
+
+class TestClusterSummaries(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.labels = rng.integers(-1, 4, size=1000)
+        self.ids = np.arange(1000, 2000)
+        self.data = rng.normal(size=(1000, 8)).astype(np.float32)
+        self.coordinates = rng.normal(size=(1000, 2)).astype(np.float32)
+
+    def test_matches_per_cluster_computation(self):
+        summaries = ClusterSummaries.compute(self.labels, self.ids, self.data, self.coordinates, top_k=3,
+                                             chunk_size=128)
+        self.assertEqual(list(summaries.clusters), [0, 1, 2, 3])
+        self.assertEqual(summaries.noise, int(np.sum(self.labels == -1)))
+        for position, cluster in enumerate(summaries.clusters):
+            members = self.labels == cluster
+            centroid = self.data[members].mean(axis=0)
+            distances = np.linalg.norm(self.data[members] - centroid, axis=1)
+            self.assertEqual(summaries.sizes[position], members.sum())
+            np.testing.assert_allclose(summaries.centroids[position], centroid, atol=1e-5)
+            np.testing.assert_allclose(summaries.centroids_2d[position], self.coordinates[members].mean(axis=0),
+                                       atol=1e-5)
+            np.testing.assert_array_equal(summaries.member_ids[position], self.ids[members][np.argsort(distances)[:3]])
+            np.testing.assert_allclose(summaries.member_distances[position], np.sort(distances)[:3], atol=1e-4)
+        np.testing.assert_array_equal(summaries.medoids, summaries.member_ids[:, 0])
+
+    def test_small_clusters_are_padded(self):
+        summaries = ClusterSummaries.compute(np.array([0, 0, 1]), np.array([7, 8, 9]), self.data[:3], top_k=3)
+        self.assertEqual(list(summaries.member_ids[1]), [9, -1, -1])
+        payload = summaries.to_dict(pd.DataFrame({"input": ["a", "b", "c"]}, index=[7, 8, 9]))
+        self.assertEqual([member["input"] for member in payload["clusters"][1]["members"]], ["c"])
+        self.assertIsNone(payload["clusters"][0]["centroid_2d"])
+
+    def test_only_noise(self):
+        summaries = ClusterSummaries.compute(np.full(5, -1), np.arange(5), self.data[:5])
+        self.assertEqual(len(summaries), 0)
+        self.assertEqual(summaries.to_dict(), {"clusters": [], "noise": 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import importlib.util
+import unittest
+import numpy as np
+from scipy.sparse.csgraph import connected_components
+from spagbol.clustering.HdbscanClustering import HdbscanClustering
+from spagbol.errors import UnfitModelError
+
+# you can run this test using the following command line call
+# python -m unittest tests.clustering.test_hdbscan_clustering
+
+
+def _blobs(rows_per_center=300, seed=0):
+    rng = np.random.default_rng(seed)
+    means = np.array([[0, 0], [20, 0], [0, 20]], dtype=np.float32)
+    data = np.concatenate([mean + rng.normal(size=(rows_per_center, 2)) for mean in means])
+    return data.astype(np.float32), np.repeat(np.arange(len(means)), rows_per_center)
+
+
+class TestHdbscanClustering(unittest.TestCase):
+    def setUp(self):
+        self.data, self.truth = _blobs()
+
+    def _assert_recovers_blobs(self, clusters):
+        self.assertEqual(clusters.shape[0], self.data.shape[0])
+        for blob in np.unique(self.truth):
+            members = clusters[self.truth == blob]
+            # Blob cores may lose a few fringe points to noise, but never mix with other blobs
+            self.assertGreater(np.mean(members >= 0), 0.9)
+            self.assertEqual(len(np.unique(members[members >= 0])), 1)
+        self.assertEqual(len(np.unique(clusters[clusters >= 0])), 3)
+
+    def test_fit_predict_with_kd_tree(self):
+        self._assert_recovers_blobs(HdbscanClustering(min_cluster_size=30, n_jobs=2).fit_predict(self.data))
+
+    def test_fit_predict_with_ball_tree(self):
+        hc = HdbscanClustering(min_cluster_size=30, algorithm="ball_tree")
+        self._assert_recovers_blobs(hc.fit_predict(self.data))
+
+    def test_predict_labels_new_points_without_refit(self):
+        hc = HdbscanClustering(min_cluster_size=30)
+        clusters = hc.fit_predict(self.data)
+        centers = [clusters[(self.truth == blob) & (clusters >= 0)][0] for blob in range(3)]
+
+        new_points = np.array([[0.5, 0.5], [19.5, 0.2], [0.1, 20.3], [10, 10]], dtype=np.float32)
+        self.assertEqual(list(hc.predict(new_points)), centers + [-1])
+        np.testing.assert_array_equal(hc.labels, clusters)
+
+    @unittest.skipUnless(importlib.util.find_spec("pynndescent"), "needs pynndescent")
+    def test_fit_predict_on_disconnected_knn_graph(self):
+        # min_samples defaults to min_cluster_size == n_neighbors, the graph gets one more neighbour per row
+        hc = HdbscanClustering(min_cluster_size=30, algorithm="knn_graph", n_neighbors=30)
+        self._assert_recovers_blobs(hc.fit_predict(self.data))
+        # The blobs are far apart, so their neighbour graph falls apart into at least one component per blob
+        n_components = connected_components(hc._sparse_distances(hc._graph), directed=False)[0]
+        self.assertGreaterEqual(n_components, 3)
+        self.assertGreaterEqual(hc._graph.n_neighbors, 31)
+
+        new_points = np.array([[0.5, 0.5], [19.5, 0.2], [10, 10]], dtype=np.float32)
+        clusters = hc.labels
+        expected = [clusters[(self.truth == blob) & (clusters >= 0)][0] for blob in range(2)] + [-1]
+        self.assertEqual(list(hc.predict(new_points)), expected)
+
+    @unittest.skipUnless(importlib.util.find_spec("pynndescent"), "needs pynndescent")
+    def test_fit_predict_on_touching_blobs_knn_graph(self):
+        rng = np.random.default_rng(1)
+        # Two touching blobs are split by density, not by the components of their graph
+        data = np.concatenate([rng.normal(size=(300, 2)), rng.normal(size=(300, 2)) + [5, 0]]).astype(np.float32)
+        truth = np.repeat([0, 1], 300)
+        hc = HdbscanClustering(min_cluster_size=30, min_samples=10, algorithm="knn_graph")
+        clusters = hc.fit_predict(data)
+        self.assertEqual(len(np.unique(clusters[clusters >= 0])), 2)
+        for blob in range(2):
+            members = clusters[truth == blob]
+            self.assertGreater(np.mean(members >= 0), 0.8)
+            self.assertEqual(len(np.unique(members[members >= 0])), 1)
+
+    def test_predict_before_fit(self):
+        with self.assertRaises(UnfitModelError):
+            HdbscanClustering().predict(self.data)
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            HdbscanClustering(algorithm="brute")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import numpy as np
+from spagbol.clustering.MiniBatchKMeansClustering import MiniBatchKMeansClustering
+from spagbol.errors import UnfitModelError
+
+# you can run this test using the following command line call
+# python -m unittest tests.clustering.test_mini_batch_kmeans_clustering
+
+
+def _blobs(centers=4, rows_per_center=500, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    means = rng.normal(size=(centers, dim)) * 10
+    data = np.concatenate([mean + rng.normal(size=(rows_per_center, dim)) for mean in means])
+    return data.astype(np.float32), np.repeat(np.arange(centers), rows_per_center)
+
+
+class TestMiniBatchKMeansClustering(unittest.TestCase):
+    def setUp(self):
+        self.data, self.truth = _blobs()
+
+    def _assert_recovers_blobs(self, clusters):
+        # Every true blob maps to exactly one cluster
+        for blob in np.unique(self.truth):
+            self.assertEqual(len(np.unique(clusters[self.truth == blob])), 1)
+        self.assertEqual(len(np.unique(clusters)), len(np.unique(self.truth)))
+
+    def test_fit_predict(self):
+        mbk = MiniBatchKMeansClustering(n_clusters=4, batch_size=256, chunk_size=512, random_state=0)
+        clusters = mbk.fit_predict(self.data)
+        self.assertEqual(clusters.shape[0], self.data.shape[0])
+        self._assert_recovers_blobs(clusters)
+
+    def test_selects_cluster_count_on_sample(self):
+        mbk = MiniBatchKMeansClustering(candidate_clusters=range(2, 8), sample_size=800, random_state=0)
+        self._assert_recovers_blobs(mbk.fit_predict(self.data))
+        self.assertEqual(mbk.cluster_centers.shape, (4, 16))
+
+    def test_partial_fit_on_streamed_chunks(self):
+        mbk = MiniBatchKMeansClustering(n_clusters=4, batch_size=128, random_state=0)
+        order = np.random.default_rng(1).permutation(len(self.data))
+        for start in range(0, len(order), 400):
+            mbk.partial_fit(self.data[order[start:start + 400]])
+        self._assert_recovers_blobs(mbk.predict(self.data))
+
+    def test_predict_before_fit(self):
+        with self.assertRaises(UnfitModelError):
+            MiniBatchKMeansClustering(n_clusters=4).predict(self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
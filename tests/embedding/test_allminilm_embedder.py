@@ -41,6 +41,30 @@ class TestAllMiniLMEmbedder(unittest.TestCase):
         # Check if the output is a numpy array
         self.assertIsInstance(embeddings, np.ndarray)
 
+    def test_embed_batch_matches_single_sentences(self):
+        # Sentences of different lengths end up in different buckets and padded batches
+        input_data = ["Short one.", "A considerably longer sentence that needs a lot more tokens than the others.",
+                      "Medium length sentence here.", "Short two."]
+        embedder = AllMiniLMEmbedder(max_batch_tokens=32)
+
+        embeddings = embedder.embed_batch(input_data)
+
+        self.assertEqual(embeddings.shape, (len(input_data), 384))
+        self.assertEqual(embeddings.dtype, np.float32)
+        for row, sentence in zip(embeddings, input_data):
+            self.assertTrue(np.allclose(row, embedder.embed(sentence)[0], atol=1e-5))
+
+    def test_length_buckets(self):
+        embedder = AllMiniLMEmbedder(max_batch_tokens=10)
+        lengths = np.array([5, 2, 3, 12, 2])
+
+        buckets = embedder._length_buckets(lengths)
+
+        # Every position is used exactly once and no bucket exceeds the budget unless it holds a single sentence
+        self.assertEqual(sorted(np.concatenate(buckets).tolist()), list(range(len(lengths))))
+        for bucket in buckets:
+            self.assertTrue(len(bucket) == 1 or len(bucket) * lengths[bucket].max() <= 10)
+
     def test_mean_pooling(self):
         # Create a dummy model output and attention mask
         model_output = (torch.randn(2, 3, 4),)
@@ -0,0 +1,124 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+
+from spagbol.embedding import Embedder, CachedEmbedder
+
+# you can run this test using the following command line call
+# python -m unittest tests.embedding.test_cached_embedder
+
+
+class CountingEmbedder(Embedder):
+    """
+    Deterministic embedder that records which texts reached the model
+    """
+    model_name = "counting-embedder"
+
+    def __init__(self):
+        self.calls = []
+
+    def _init_model(self):
+        return None
+
+    def _init_tokenizer(self):
+        return None
+
+    def embed(self, data: str) -> np.array:
+        return self.embed_batch([data])
+
+    def embed_batch(self, data: list[str]) -> np.array:
+        self.calls.append(list(data))
+        return np.stack([np.random.default_rng(zlib.crc32(" ".join(text.split()).encode())).random(8)
+                         for text in data]).astype(np.float32)
+
+
+class TestCachedEmbedder(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.inner = CountingEmbedder()
+        self.embedder = CachedEmbedder(self.inner, cache_dir=self.cache_dir.name)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_only_misses_reach_the_model(self):
+        first = self.embedder.embed_batch(["a b", "c", "d"])
+        second = self.embedder.embed_batch(["c", "e", " a  b ", "e"])
+
+        self.assertEqual(self.inner.calls, [["a b", "c", "d"], ["e"]])
+        self.assertTrue(np.array_equal(second[0], first[1]))
+        self.assertTrue(np.array_equal(second[2], first[0]))
+        self.assertTrue(np.array_equal(second[1], second[3]))
+
+    def test_cache_survives_reopening(self):
+        expected = self.embedder.embed_batch(["x", "y"])
+
+        reopened_inner = CountingEmbedder()
+        reopened = CachedEmbedder(reopened_inner, cache_dir=self.cache_dir.name)
+
+        self.assertTrue(np.array_equal(reopened.embed_batch(["y", "x"]), expected[::-1]))
+        self.assertEqual(reopened_inner.calls, [])
+
+    def test_misses_are_logged_instead_of_rewriting_the_index(self):
+        for text in ["p", "q", "r"]:
+            self.embedder.embed(text)
+        cache_dir = self.embedder._cache_dir
+        self.assertFalse(os.path.exists(os.path.join(cache_dir, "index.json")))
+
+        # A line torn by an interrupted write is skipped
+        with open(os.path.join(cache_dir, "index.log"), "a") as log_file:
+            log_file.write('{"dim": 8, "entr')
+        reopened_inner = CountingEmbedder()
+        reopened = CachedEmbedder(reopened_inner, cache_dir=self.cache_dir.name)
+        reopened.embed_batch(["p", "q", "r"])
+        self.assertEqual(reopened_inner.calls, [])
+        self.assertEqual(reopened._rows, 3)
+
+    def test_concurrent_misses_are_appended_once(self):
+        vectors = self.inner.embed_batch(["s"])
+        key = self.embedder._key("s")
+        self.embedder._append([key], vectors)
+        self.embedder._append([key], vectors)
+        self.assertEqual(self.embedder._rows, 1)
+
+    def test_backends_of_one_model_have_separate_caches(self):
+        class QuantizedCountingEmbedder(CountingEmbedder):
+            cache_key = "counting-embedder-int8"
+
+        quantized_inner = QuantizedCountingEmbedder()
+        quantized = CachedEmbedder(quantized_inner, cache_dir=self.cache_dir.name)
+        self.embedder.embed_batch(["shared text"])
+        quantized.embed_batch(["shared text"])
+
+        self.assertEqual(quantized.model_name, self.embedder.model_name)
+        self.assertEqual(quantized_inner.calls, [["shared text"]])
+        self.assertNotEqual(quantized._cache_dir, self.embedder._cache_dir)
+
+    def test_eviction_bounds_file_size(self):
+        # 8 float32 values per vector, so the cache holds at most 10 vectors
+        embedder = CachedEmbedder(self.inner, cache_dir=self.cache_dir.name, max_bytes=10 * 8 * 4)
+        for start in range(0, 40, 4):
+            embedder.embed_batch([str(i) for i in range(start, start + 4)])
+
+        self.assertLessEqual(embedder._rows, 10)
+        # The most recently added texts are still cached
+        self.inner.calls = []
+        embedder.embed_batch(["39", "38"])
+        self.assertEqual(self.inner.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from spagbol.embedding import Embedder, CoalescingEmbedder
+
+# you can run this test using the following command line call
+# python -m unittest tests.embedding.test_coalescing_embedder
+
+
+class RecordingEmbedder(Embedder):
+    """
+    Embedder that encodes the text length and records the size of every batch it receives
+    """
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+
+    def _init_model(self):
+        return None
+
+    def _init_tokenizer(self):
+        return None
+
+    def embed(self, data: str) -> np.array:
+        return self.embed_batch([data])
+
+    def embed_batch(self, data: list[str]) -> np.array:
+        with self.lock:
+            self.batches.append(len(data))
+        if self.fail_on in data:
+            raise ValueError("failing text")
+        return np.array([[len(text)] for text in data], dtype=np.float32)
+
+
+class TestCoalescingEmbedder(unittest.TestCase):
+
+    def test_concurrent_calls_are_batched(self):
+        inner = RecordingEmbedder()
+        embedder = CoalescingEmbedder(inner, max_batch_size=8, max_wait_ms=50)
+        texts = ["x" * length for length in range(1, 17)]
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(embedder.embed, texts))
+
+        for text, embedding in zip(texts, results):
+            self.assertEqual(embedding.shape, (1, 1))
+            self.assertEqual(embedding[0, 0], len(text))
+        self.assertLess(len(inner.batches), len(texts))
+        self.assertTrue(all(size <= 8 for size in inner.batches))
+
+        metrics = embedder.metrics()
+        self.assertEqual(metrics["requests"], 16)
+        self.assertEqual(sum(size * count for size, count in metrics["batch_sizes"].items()), 16)
+        self.assertEqual(metrics["queue_depth"], 0)
+
+    def test_errors_reach_the_caller(self):
+        embedder = CoalescingEmbedder(RecordingEmbedder(fail_on="bad"), max_wait_ms=1)
+
+        with self.assertRaises(ValueError):
+            embedder.embed("bad")
+        # The worker keeps serving after a failed batch
+        self.assertEqual(embedder.embed("good")[0, 0], 4)
+
+    def test_failing_text_only_fails_its_caller(self):
+        inner = RecordingEmbedder(fail_on="bad")
+        embedder = CoalescingEmbedder(inner, max_batch_size=8, max_wait_ms=50)
+        texts = ["bad", "good", "fine", "ok"]
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(embedder.embed, text) for text in texts]
+
+        with self.assertRaises(ValueError):
+            futures[0].result()
+        for text, future in zip(texts[1:], futures[1:]):
+            self.assertEqual(future.result()[0, 0], len(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
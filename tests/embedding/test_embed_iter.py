@@ -0,0 +1,45 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import unittest
+
+import numpy as np
+
+from spagbol.embedding import AllMiniLMEmbedder
+
+# you can run this test using the following command line call
+# python -m unittest tests.embedding.test_embed_iter
+
+
+class TestEmbedIter(unittest.TestCase):
+
+    def setUp(self):
+        self.embedder = AllMiniLMEmbedder()
+        self.data = [f"Sentence number {i} " + "padding words " * (i % 7) for i in range(25)]
+
+    def test_chunks_cover_all_rows(self):
+        chunks = list(self.embedder.embed_iter(self.data, chunk_size=10))
+
+        self.assertEqual([len(rows) for rows, _ in chunks], [10, 10, 5])
+        self.assertTrue(np.array_equal(np.concatenate([rows for rows, _ in chunks]), np.arange(25)))
+        for rows, block in chunks:
+            self.assertEqual(block.dtype, np.float32)
+            self.assertEqual(block.shape, (len(rows), 384))
+
+    def test_matches_embed_batch(self):
+        expected = self.embedder.embed_batch(self.data)
+        streamed = np.empty_like(expected)
+        for rows, block in self.embedder.embed_iter(self.data, chunk_size=7):
+            streamed[rows] = block
+
+        self.assertTrue(np.allclose(streamed, expected, atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
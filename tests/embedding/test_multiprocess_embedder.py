@@ -0,0 +1,68 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import unittest
+
+import numpy as np
+
+from spagbol.embedding import Embedder, MultiprocessEmbedder
+
+# you can run this test using the following command line call
+# python -m unittest tests.embedding.test_multiprocess_embedder
+
+
+class LengthEmbedder(Embedder):
+    """
+    Cheap embedder that encodes the text length and the worker pid, so tests don't have to load a model
+    """
+
+    def __init__(self):
+        pass
+
+    def _init_model(self):
+        return None
+
+    def _init_tokenizer(self):
+        return None
+
+    def embed(self, data: str) -> np.array:
+        return self.embed_batch([data])
+
+    def embed_batch(self, data: list[str]) -> np.array:
+        return np.array([[len(text), os.getpid()] for text in data], dtype=np.float32)
+
+
+class TestMultiprocessEmbedder(unittest.TestCase):
+
+    def setUp(self):
+        self.embedder = MultiprocessEmbedder(LengthEmbedder, workers=2, threads_per_worker=1, shard_size=3)
+
+    def tearDown(self):
+        self.embedder.close()
+
+    def test_embed_batch_keeps_order(self):
+        data = ["x" * length for length in range(20)]
+
+        embeddings = self.embedder.embed_batch(data)
+
+        self.assertEqual(embeddings.shape, (20, 2))
+        self.assertTrue(np.array_equal(embeddings[:, 0], np.arange(20)))
+        # Embeddings were computed outside of the test process
+        self.assertNotIn(os.getpid(), embeddings[:, 1])
+
+    def test_embed(self):
+        embeddings = self.embedder.embed("abcd")
+
+        self.assertEqual(embeddings.shape, (1, 2))
+        self.assertEqual(embeddings[0, 0], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
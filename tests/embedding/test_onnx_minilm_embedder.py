@@ -0,0 +1,63 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import importlib.util
+import tempfile
+import unittest
+
+import numpy as np
+
+from spagbol.embedding import AllMiniLMEmbedder, OnnxMiniLMEmbedder
+
+# you can run this test using the following command line call
+# python -m unittest tests.embedding.test_onnx_minilm_embedder
+
+
+@unittest.skipUnless(importlib.util.find_spec("onnxruntime"), "onnxruntime is not installed")
+class TestOnnxMiniLMEmbedder(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.onnx_dir = tempfile.TemporaryDirectory()
+        cls.sentences = ["This is a test string.", "Write a poem about the ocean and the moon.", "Hi"]
+        cls.reference = AllMiniLMEmbedder().embed_batch(cls.sentences)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.onnx_dir.cleanup()
+
+    def _agreement(self, embeddings):
+        return np.sum(self.reference * embeddings, axis=1)
+
+    def test_backends_have_distinct_cache_keys(self):
+        keys = {AllMiniLMEmbedder().cache_key, OnnxMiniLMEmbedder(onnx_dir=self.onnx_dir.name).cache_key,
+                OnnxMiniLMEmbedder(onnx_dir=self.onnx_dir.name, quantize=True).cache_key}
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(OnnxMiniLMEmbedder().model_name, AllMiniLMEmbedder.model_name)
+
+    def test_fp32_matches_torch(self):
+        embedder = OnnxMiniLMEmbedder(onnx_dir=self.onnx_dir.name)
+
+        embeddings = embedder.embed_batch(self.sentences)
+
+        self.assertEqual(embeddings.shape, self.reference.shape)
+        self.assertGreater(self._agreement(embeddings).min(), 0.9999)
+        self.assertTrue(np.allclose(embedder.embed(self.sentences[0]), self.reference[:1], atol=1e-4))
+
+    def test_int8_stays_close_to_torch(self):
+        embedder = OnnxMiniLMEmbedder(onnx_dir=self.onnx_dir.name, quantize=True)
+
+        embeddings = embedder.embed_batch(self.sentences)
+
+        self.assertGreater(self._agreement(embeddings).min(), 0.95)
+        self.assertTrue(np.allclose(np.linalg.norm(embeddings, axis=1), 1, atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,12 +7,15 @@ This program is distributed in the hope that it will be useful, but WITHOUT ANY
 
 You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
+import json
 import pandas as pd
 from datasets import load_dataset
 import os
 import numpy as np
+import pytest
 
 from spagbol.loading.AlpacaLoader import AlpacaLoader
+from spagbol.errors import InvalidSourceError
 
 
 def _load_temp_alpaca():
@@ -38,6 +41,7 @@ def test_local_loader():
     _load_temp_alpaca()
     loader = AlpacaLoader("tmp/tmp_alpaca.csv")
     dataset = loader.load_data()
+    assert dataset["id"].is_unique
     assert "input" in dataset.columns
     assert "text" not in dataset.columns
     assert "output" in dataset.columns
@@ -51,3 +55,76 @@ def test_huggingface_loader():
     assert "text" not in dataset.columns
     assert "output" in dataset.columns
     assert len(dataset) == 52002
+
+
+def _records(count):
+    return [{"instruction": f"instruction {i}", "input": "" if i % 2 else f"input {i}", "output": f"output {i}",
+             "text": "unused"} for i in range(count)]
+
+
+def test_jsonl_chunks(tmp_path):
+    path = tmp_path / "alpaca.jsonl"
+    path.write_text("\n".join(json.dumps(record) for record in _records(10)))
+    chunks = list(AlpacaLoader(str(path)).iter_chunks(chunk_size=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    dataset = pd.concat(chunks, ignore_index=True)
+    assert list(dataset.columns) == ["id", "input", "output"]
+    assert list(dataset["id"]) == list(range(10))
+    assert dataset["input"][1] == "instruction 1"
+    assert dataset["input"][2] == "instruction 2 input 2"
+
+
+def test_json_array_chunks_are_parsed_incrementally(tmp_path):
+    path = tmp_path / "alpaca.json"
+    path.write_text(json.dumps(_records(7), indent=2))
+    loader = AlpacaLoader(str(path))
+    with open(path) as stream:
+        # A tiny read size splits records across blocks
+        batches = list(loader._iter_json_array(stream, chunk_size=3, read_size=16))
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert set(batches[0][0]) == {"instruction", "input", "output"}
+    assert list(loader.load_data()["output"]) == [f"output {i}" for i in range(7)]
+
+
+def test_truncated_json_array_is_rejected(tmp_path):
+    path = tmp_path / "alpaca.json"
+    path.write_text(json.dumps(_records(3))[:-20])
+    with pytest.raises(InvalidSourceError):
+        AlpacaLoader(str(path)).load_data()
+
+
+def test_csv_chunks(tmp_path):
+    path = tmp_path / "alpaca.csv"
+    pd.DataFrame(_records(5)).to_csv(path, index=False)
+    chunks = list(AlpacaLoader(str(path)).iter_chunks(chunk_size=2))
+    assert [list(chunk["id"]) for chunk in chunks] == [[0, 1], [2, 3], [4]]
+    assert "text" not in chunks[0].columns
+
+
+def _write_shards(directory, sizes):
+    offset = 0
+    for shard, size in enumerate(sizes):
+        records = _records(offset + size)[offset:]
+        path = directory / f"train-{shard:05d}-of-{len(sizes):05d}.jsonl"
+        path.write_text("\n".join(json.dumps(record) for record in records))
+        offset += size
+    (directory / "_SUCCESS").write_text("")
+
+
+def test_sharded_directory_is_loaded_in_order(tmp_path):
+    _write_shards(tmp_path, [3, 1, 4, 2])
+    dataset = AlpacaLoader(str(tmp_path), workers=2).load_data()
+    assert list(dataset["id"]) == list(range(10))
+    assert list(dataset["output"]) == [f"output {i}" for i in range(10)]
+
+
+def test_sharded_glob(tmp_path):
+    _write_shards(tmp_path, [2, 2, 2])
+    chunks = list(AlpacaLoader(str(tmp_path / "train-0000[02]-*.jsonl"), workers=1).iter_chunks(chunk_size=5))
+    assert [list(chunk["id"]) for chunk in chunks] == [[0, 1], [2, 3]]
+    assert list(chunks[1]["output"]) == ["output 4", "output 5"]
+
+
+def test_empty_glob_is_rejected(tmp_path):
+    with pytest.raises(InvalidSourceError):
+        AlpacaLoader(str(tmp_path / "*.parquet")).load_data()
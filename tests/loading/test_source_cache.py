@@ -0,0 +1,86 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from spagbol.loading import AlpacaLoader, SourceCache
+
+pytest.importorskip("pyarrow")
+
+
+def _write_source(path, count):
+    records = [{"instruction": f"instruction {i}", "input": "", "output": f"output {i}"} for i in range(count)]
+    path.write_text(json.dumps(records))
+
+
+def test_repeat_load_is_served_from_cache(tmp_path, monkeypatch):
+    source = tmp_path / "alpaca.json"
+    _write_source(source, 4)
+    cache = SourceCache(str(tmp_path / "cache"))
+    first = AlpacaLoader(str(source), cache=cache).load_data()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("source was parsed again")
+
+    monkeypatch.setattr(AlpacaLoader, "_iter_source_chunks", fail)
+    second = AlpacaLoader(str(source), cache=SourceCache(str(tmp_path / "cache"))).load_data()
+    pd.testing.assert_frame_equal(first, second)
+    # Numeric columns are views of the memory-mapped artifact
+    assert not second["id"].to_numpy().flags.writeable
+
+
+def test_streamed_load_fills_cache(tmp_path, monkeypatch):
+    source = tmp_path / "alpaca.json"
+    _write_source(source, 5)
+    streamed = pd.concat(AlpacaLoader(str(source), cache=SourceCache(str(tmp_path / "cache"))).iter_chunks(2),
+                         ignore_index=True)
+
+    monkeypatch.setattr(AlpacaLoader, "_iter_source_chunks", lambda *args: pytest.fail("source was parsed again"))
+    cached = AlpacaLoader(str(source), cache=SourceCache(str(tmp_path / "cache"))).load_data()
+    pd.testing.assert_frame_equal(streamed, cached)
+
+
+def test_changed_source_is_reparsed(tmp_path):
+    source = tmp_path / "alpaca.json"
+    _write_source(source, 4)
+    cache = SourceCache(str(tmp_path / "cache"))
+    AlpacaLoader(str(source), cache=cache).load_data()
+
+    _write_source(source, 6)
+    os.utime(source, ns=(0, 0))
+    assert len(AlpacaLoader(str(source), cache=cache).load_data()) == 6
+
+
+def test_invalidate_removes_artifacts(tmp_path):
+    source = tmp_path / "alpaca.json"
+    _write_source(source, 4)
+    cache = SourceCache(str(tmp_path / "cache"))
+    loader = AlpacaLoader(str(source), cache=cache)
+    loader.load_data()
+    key = loader._cache_key(None)
+    assert cache.get(key) is not None
+
+    cache.invalidate(os.path.relpath(source))
+    assert cache.get(key) is None
+    assert not [name for name in os.listdir(tmp_path / "cache") if name.endswith(".arrow")]
+
+
+def test_size_cap_evicts_least_recently_used(tmp_path):
+    cache = SourceCache(str(tmp_path / "cache"))
+    dataset = pd.DataFrame({"id": range(1000), "input": ["x" * 100] * 1000, "output": ["y"] * 1000})
+    cache.put("first", "first", dataset)
+    cache.max_bytes = os.path.getsize(tmp_path / "cache" / "first.arrow") * 3 // 2
+    cache.put("second", "second", dataset)
+
+    assert cache.get("first") is None
+    assert len(cache.get("second")) == 1000
@@ -0,0 +1,64 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import bz2
+import gzip
+import json
+
+import pandas as pd
+import pytest
+
+from spagbol.loading import AlpacaLoader, SourceFormat
+
+RECORDS = [{"instruction": f"instruction {i}", "input": "", "output": f"output {i}", "text": "unused"}
+           for i in range(5)]
+
+
+def test_detects_json_flavour_from_content(tmp_path):
+    array_path = tmp_path / "array.json"
+    array_path.write_text(json.dumps(RECORDS))
+    lines_path = tmp_path / "lines.json"
+    lines_path.write_text("\n".join(json.dumps(record) for record in RECORDS))
+
+    assert SourceFormat.detect(str(array_path)).data_format == "json"
+    assert SourceFormat.detect(str(lines_path)).data_format == "jsonl"
+
+
+def test_detects_compression_from_magic_bytes(tmp_path):
+    path = tmp_path / "dataset"
+    with gzip.open(path, "wt") as stream:
+        stream.write(json.dumps(RECORDS))
+
+    source_format = SourceFormat.detect(str(path))
+    assert (source_format.data_format, source_format.compression) == ("json", "gzip")
+    with source_format.open_text() as stream:
+        assert json.load(stream) == RECORDS
+
+
+def test_loads_compressed_jsonl(tmp_path):
+    path = tmp_path / "alpaca.jsonl.bz2"
+    with bz2.open(path, "wt") as stream:
+        stream.write("\n".join(json.dumps(record) for record in RECORDS))
+
+    dataset = AlpacaLoader(str(path)).load_data()
+    assert list(dataset["output"]) == [record["output"] for record in RECORDS]
+
+
+def test_parquet_reads_only_text_columns(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    pa = pytest.importorskip("pyarrow")
+    path = tmp_path / "train-00000-of-00001.parquet"
+    pq.write_table(pa.Table.from_pylist(RECORDS), path, row_group_size=2)
+
+    assert SourceFormat.detect(str(path)).data_format == "parquet"
+    chunks = list(AlpacaLoader(str(path)).iter_chunks(chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    dataset = pd.concat(chunks, ignore_index=True)
+    assert list(dataset.columns) == ["id", "input", "output"]
+    assert dataset["input"][3] == "instruction 3"
@@ -0,0 +1,66 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+import pytest
+
+from spagbol.reduction import IncrementalPcaReduction, PcaReduction
+from spagbol.errors import UnfitModelError
+
+
+def _data(rows=1000, dim=64):
+    rng = np.random.default_rng(0)
+    # Two dominant directions, so every PCA variant finds the same plane
+    basis = rng.normal(size=(2, dim))
+    return (rng.normal(size=(rows, 2)) * [10, 5] @ basis + rng.normal(size=(rows, dim)) * 0.1).astype(np.float32)
+
+
+def _same_plane(a, b):
+    # Components can flip sign, compare absolute correlations per axis
+    return all(abs(np.corrcoef(a[:, axis], b[:, axis])[0, 1]) > 0.99 for axis in range(2))
+
+
+def test_incremental_matches_full_pca():
+    x = _data()
+    reduced_data = IncrementalPcaReduction(chunk_size=128).fit_transform(x)
+    assert reduced_data.shape == (1000, 2)
+    assert reduced_data.dtype == np.float32
+    assert _same_plane(reduced_data, PcaReduction().fit_transform(x))
+
+
+def test_short_last_chunk_is_merged():
+    reducer = IncrementalPcaReduction(n_components=3, chunk_size=100)
+    assert list(reducer._chunk_bounds(201)) == [(0, 100), (100, 201)]
+    assert list(reducer._chunk_bounds(205)) == [(0, 100), (100, 200), (200, 205)]
+
+
+def test_fits_memory_mapped_matrix(tmp_path):
+    x = _data()
+    np.save(tmp_path / "embeddings.npy", x)
+    embeddings = np.load(tmp_path / "embeddings.npy", mmap_mode="r")
+    reduced_data = IncrementalPcaReduction(chunk_size=100).fit_transform(embeddings)
+    assert _same_plane(reduced_data, PcaReduction().fit_transform(x))
+
+
+def test_fit_chunks_streams():
+    x = _data()
+    reducer = IncrementalPcaReduction()
+    with pytest.raises(UnfitModelError):
+        reducer.transform(x)
+    reducer.fit_chunks(x[start:start + 250] for start in range(0, len(x), 250))
+    assert reducer.transform(x[:10]).shape == (10, 2)
+
+
+def test_randomized_solver():
+    x = _data()
+    reduced_data = IncrementalPcaReduction(svd_solver="randomized", random_state=0).fit_transform(x)
+    assert _same_plane(reduced_data, PcaReduction().fit_transform(x))
+    with pytest.raises(ValueError):
+        IncrementalPcaReduction(svd_solver="arpack")
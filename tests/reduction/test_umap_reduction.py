@@ -36,3 +36,21 @@ def test_transform():
 
     # If it didn't throw the exception, fail the test.
     assert False
+
+
+def test_landmark_fit_transform():
+    x = np.random.rand(600, 32)
+    reducer = UmapReduction(sample_size=200, transform_chunk_size=150, n_jobs=2, random_state=0)
+    reduced_data = reducer.fit_transform(x)
+    assert reduced_data.shape == (600, 2)
+    assert not np.isnan(reduced_data).any()
+    assert reducer._model.embedding_.shape == (200, 2)
+
+
+def test_stratified_sample_covers_every_stratum():
+    x = np.random.rand(1000, 8)
+    labels = np.repeat([0, 1, 2], [990, 5, 5])
+    sample = UmapReduction(sample_size=100, sampling="stratified", random_state=0)._sample(x, labels)
+    assert len(np.unique(sample)) == len(sample)
+    assert set(labels[sample]) == {0, 1, 2}
+    assert UmapReduction(sample_size=2000)._sample(x, None) is None
@@ -0,0 +1,84 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+import pytest
+
+from spagbol.search import KnnGraph
+
+pytest.importorskip("pynndescent")
+
+
+@pytest.fixture(autouse=True)
+def _empty_memory_cache():
+    KnnGraph._memory.clear()
+
+
+@pytest.fixture
+def count_builds(monkeypatch):
+    builds = []
+    build = KnnGraph.build.__func__
+
+    def counting_build(cls, data, *args, **kwargs):
+        builds.append(len(data))
+        return build(cls, data, *args, **kwargs)
+
+    monkeypatch.setattr(KnnGraph, "build", classmethod(counting_build))
+    return builds
+
+
+def _data(rows=500, dim=16, seed=0):
+    return np.random.default_rng(seed).random((rows, dim), dtype=np.float32)
+
+
+def test_build_lists_rows_first():
+    graph = KnnGraph.build(_data(), n_neighbors=10, random_state=0)
+    assert graph.indices.shape == graph.distances.shape == (500, 10)
+    assert (graph.indices[:, 0] == np.arange(500)).all()
+    assert (np.diff(graph.distances, axis=1) >= 0).all()
+    assert graph.neighbors([3])[0].shape == (1, 9)
+    assert graph.outlier_scores().shape == (500,)
+
+
+def test_cached_graph_serves_fewer_neighbours(count_builds):
+    data = _data()
+    graph = KnnGraph.cached(data, n_neighbors=15)
+    smaller = KnnGraph.cached(data.copy(), n_neighbors=5)
+
+    assert count_builds == [500]
+    assert (smaller.indices == graph.indices[:, :5]).all()
+    KnnGraph.cached(data, n_neighbors=20)
+    KnnGraph.cached(data, n_neighbors=15, metric="cosine")
+    assert count_builds == [500, 500, 500]
+
+
+def test_persisted_graph_is_reused(tmp_path, count_builds):
+    data = _data()
+    graph = KnnGraph.cached(data, n_neighbors=10, cache_dir=str(tmp_path))
+    KnnGraph._memory.clear()
+    loaded = KnnGraph.cached(data, n_neighbors=8, cache_dir=str(tmp_path))
+
+    assert count_builds == [500]
+    assert (loaded.indices == graph.indices[:, :8]).all()
+    assert loaded.search_index is not None
+
+
+def test_umap_refits_share_the_graph(tmp_path, count_builds):
+    from spagbol.reduction import UmapReduction
+
+    data = _data(rows=5000)
+    first = UmapReduction(min_dist=0.1, knn_cache_dir=str(tmp_path), random_state=0).fit_transform(data)
+    reducer = UmapReduction(min_dist=0.8, n_components=3, knn_cache_dir=str(tmp_path), random_state=0)
+    second = reducer.fit_transform(data)
+
+    assert count_builds == [5000]
+    assert first.shape == (5000, 2)
+    assert second.shape == (5000, 3)
+    assert reducer.transform(data[:10]).shape == (10, 3)
@@ -0,0 +1,82 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+import pytest
+
+from spagbol.search import TopKSearch
+
+
+def _data(rows=1000, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(rows, dim)).astype(np.float32)
+
+
+def _brute_force(data, queries, k):
+    scores = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ \
+        (data / np.linalg.norm(data, axis=1, keepdims=True)).T
+    positions = np.argsort(-scores, axis=1)[:, :k]
+    return positions, np.take_along_axis(scores, positions, axis=1)
+
+
+def test_blocked_search_matches_brute_force():
+    data, queries = _data(), _data(rows=7, seed=1)
+    # A tiny budget forces many blocks and query chunks
+    engine = TopKSearch(data, memory_budget=4096, query_chunk_size=3)
+    positions, scores = engine.search(queries, k=5)
+    expected_positions, expected_scores = _brute_force(data, queries, 5)
+
+    assert positions.shape == scores.shape == (7, 5)
+    np.testing.assert_array_equal(positions, expected_positions)
+    np.testing.assert_allclose(scores, expected_scores, atol=1e-5)
+
+
+def test_single_query_and_normalized_rows():
+    data = _data()
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    positions, scores = TopKSearch(data, normalized=True).search(data[42], k=3)
+
+    assert positions.shape == (3,)
+    assert positions[0] == 42
+    assert scores[0] == pytest.approx(1.0, abs=1e-5)
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_dot_metric_and_k_larger_than_rows():
+    data = np.array([[1, 0], [3, 0], [0, 2]], dtype=np.float32)
+    positions, scores = TopKSearch(data, metric="dot").search(np.array([1, 1], dtype=np.float32), k=10)
+    assert list(positions) == [1, 2, 0]
+    assert list(scores) == [3, 2, 1]
+
+
+def test_zero_rows_score_zero():
+    data = np.array([[0, 0], [1, 1]], dtype=np.float32)
+    positions, scores = TopKSearch(data).search(np.array([1, 0], dtype=np.float32), k=2)
+    assert list(positions) == [1, 0]
+    assert scores[1] == 0
+
+
+def test_rejects_mismatching_queries():
+    with pytest.raises(ValueError):
+        TopKSearch(_data()).search(np.ones(3, dtype=np.float32))
+
+
+def test_update_and_compact_match_a_fresh_engine():
+    data, queries = _data(rows=100), _data(rows=4, seed=1)
+    engine = TopKSearch(data)
+    data[[3, 50]] = _data(rows=2, seed=2) * 5
+    data = np.concatenate((data, _data(rows=10, seed=3)))
+    engine.update(data, [3, 50])
+    keep = np.arange(len(data)) % 7 != 0
+    engine.compact(data[keep], keep)
+
+    positions, scores = engine.search(queries, k=5)
+    expected_positions, expected_scores = _brute_force(data[keep], queries, 5)
+    np.testing.assert_array_equal(positions, expected_positions)
+    np.testing.assert_allclose(scores, expected_scores, atol=1e-5)
@@ -0,0 +1,64 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+import pytest
+
+from spagbol.storage import EmbeddingStore
+
+
+def _store(rows=6, dim=4):
+    store = EmbeddingStore(ids=np.arange(rows) * 10)
+    store.set("input_embedding", np.arange(rows * dim, dtype=np.float32).reshape(rows, dim))
+    return store
+
+
+def test_get_is_zero_copy_and_read_only():
+    matrix = np.random.rand(5, 3).astype(np.float32)
+    store = EmbeddingStore(ids=range(5))
+    store.set("input_embedding", matrix)
+
+    view = store.get("input_embedding")
+    assert np.shares_memory(view, matrix)
+    assert view.flags.c_contiguous
+    assert not view.flags.writeable
+
+
+def test_set_converts_rows_to_float32_matrix():
+    store = EmbeddingStore(ids=range(3))
+    store.set("output_embedding", np.array([np.ones(4), np.zeros(4), np.ones(4)], dtype=object))
+
+    assert store.get("output_embedding").dtype == np.float32
+    assert store.get("output_embedding").shape == (3, 4)
+    with pytest.raises(ValueError):
+        store.set("output_embedding", np.ones((2, 4)))
+
+
+def test_update_rows():
+    store = _store()
+    store.update_rows("input_embedding", [1, 4], np.full((2, 4), -1, dtype=np.float32))
+
+    assert np.all(store.rows("input_embedding", [1, 4]) == -1)
+    assert np.all(store.rows("input_embedding", [0]) == np.arange(4))
+
+
+def test_append_and_delete_keep_alignment():
+    store = _store()
+    for step in range(5):
+        store.append([100 + step], {"input_embedding": np.full((1, 4), step, dtype=np.float32)})
+    assert len(store) == 11
+    assert store.ids[-1] == 104
+    assert np.all(store.get("input_embedding")[-1] == 4)
+
+    store.delete([0, 7])
+    assert len(store) == 9
+    assert store.ids.tolist() == [10, 20, 30, 40, 50, 100, 102, 103, 104]
+    assert np.all(store.get("input_embedding")[0] == np.arange(4, 8))
+    assert np.all(store.get("input_embedding")[6] == 2)
@@ -0,0 +1,77 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import copy
+import os
+import pickle
+
+import numpy as np
+
+from spagbol.clustering import CachedClustering, GaussianMixtureClustering
+from spagbol.reduction import CachedReduction, IncrementalPcaReduction
+from spagbol.storage import ResultCache
+
+
+def _data(rows=300, dim=16, seed=0):
+    return np.random.default_rng(seed).random((rows, dim), dtype=np.float32)
+
+
+def test_repeat_reduction_is_a_hit(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    data = _data()
+    first = CachedReduction(IncrementalPcaReduction(), cache).fit_transform(data)
+    reducer = CachedReduction(IncrementalPcaReduction(), ResultCache(str(tmp_path)))
+    second = reducer.fit_transform(data.copy())
+
+    assert np.array_equal(first, second)
+    assert reducer.cache.stats()["hits"] == 1
+    assert reducer.transform(data[:5]).shape == (5, 2)
+    assert cache.stats()["misses"] == 1
+
+
+def test_parameters_and_data_are_part_of_the_key(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    data = _data()
+    keys = {cache.key(IncrementalPcaReduction(), data),
+            cache.key(IncrementalPcaReduction(n_components=3), data),
+            cache.key(IncrementalPcaReduction(), _data(seed=1)),
+            cache.key(GaussianMixtureClustering(), data)}
+    assert len(keys) == 4
+    assert cache.key(IncrementalPcaReduction(), data) == cache.key(IncrementalPcaReduction(), data.copy())
+
+
+def test_clustering_labels_are_cached(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    data = _data()
+    clustering = CachedClustering(GaussianMixtureClustering(), cache)
+    labels = clustering.fit_predict(data)
+    assert np.array_equal(CachedClustering(GaussianMixtureClustering(), cache).fit_predict(data), labels)
+    assert np.array_equal(clustering.predict(data), labels)
+    assert cache.stats()["hits"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put("first", np.zeros(1000), None)
+    cache.put("second", np.zeros(1000), None)
+    cache.get("first")
+    cache.max_bytes = os.path.getsize(tmp_path / "first.pkl") * 5 // 2
+    cache.put("third", np.zeros(1000), None)
+
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_copies_share_the_cache(tmp_path):
+    reducer = CachedReduction(IncrementalPcaReduction(), ResultCache(str(tmp_path)))
+    assert copy.deepcopy(reducer).cache is reducer.cache
+    restored = pickle.loads(pickle.dumps(reducer))
+    assert restored.cache.cache_dir == str(tmp_path)
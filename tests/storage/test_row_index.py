@@ -0,0 +1,84 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+import pytest
+
+from spagbol.storage import RowIndex, EmbeddingStore
+
+
+def test_positions_follow_ids():
+    index = RowIndex(np.array([7, 3, 11]))
+
+    assert index.position(3) == 1
+    assert list(index.positions([11, 7])) == [2, 0]
+    with pytest.raises(KeyError):
+        index.position(5)
+
+
+def test_duplicate_ids_are_rejected():
+    with pytest.raises(ValueError):
+        RowIndex([1, 2, 2])
+
+
+def test_delete_tombstones_without_moving_rows():
+    index = RowIndex(np.arange(5))
+    index.delete(1)
+
+    assert len(index) == 4
+    assert index.size == 5
+    assert 1 not in index
+    assert index.position(4) == 4
+    assert list(index.alive) == [True, False, True, True, True]
+    assert index.tombstone_ratio == pytest.approx(0.2)
+    with pytest.raises(KeyError):
+        index.delete(1)
+
+
+def test_append_assigns_fresh_ids():
+    index = RowIndex(np.arange(3))
+    index.delete(2)
+    new_ids = index.append(2)
+
+    assert list(new_ids) == [3, 4]
+    assert index.position(4) == 4
+    assert list(index.alive) == [True, True, False, True, True]
+
+
+def test_compact_keeps_store_aligned():
+    ids = np.arange(6) * 10
+    index = RowIndex(ids)
+    store = EmbeddingStore(ids=ids)
+    store.set("input_embedding", np.arange(12, dtype=np.float32).reshape(6, 2))
+    index.delete(10)
+    index.delete(40)
+
+    keep = index.compact()
+    store.compact(keep)
+
+    assert index.tombstone_ratio == 0
+    assert list(store.ids) == [0, 20, 30, 50]
+    for row_id in store.ids:
+        assert store.ids[index.position(row_id)] == row_id
+    assert store.rows("input_embedding", [index.position(50)]).tolist() == [[10.0, 11.0]]
+
+
+def test_positions_survive_repeated_compaction():
+    index = RowIndex(np.arange(8))
+    for row_id in [0, 2, 3, 5, 6]:
+        index.delete(row_id)
+    index.compact()
+    new_ids = index.append(2)
+    index.delete(1)
+    index.compact()
+
+    assert list(index.positions([4, 7, *new_ids])) == [0, 1, 2, 3]
+    assert index.position(new_ids[1]) == 3
+    assert 1 not in index and len(index) == 4
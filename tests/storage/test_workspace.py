@@ -0,0 +1,98 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spagbol.errors import WorkspaceError
+from spagbol.reduction import PcaReduction
+from spagbol.storage import EmbeddingStore, Workspace
+
+
+def _state(rows=50):
+    dataset = pd.DataFrame({
+        "input": [f"instruction {i}" for i in range(rows)],
+        "output": [f"answer {i}" for i in range(rows)],
+    })
+    embeddings = EmbeddingStore(ids=dataset.index.to_numpy())
+    embeddings.set("input_embedding", np.random.rand(rows, 16).astype(np.float32))
+    embeddings.set("output_embedding", np.random.rand(rows, 16).astype(np.float32))
+    reducer = PcaReduction()
+    reduced = reducer.fit_transform(embeddings.get("input_embedding"))
+    dataset["instruction_x"], dataset["instruction_y"] = reduced[:, 0], reduced[:, 1]
+    return dataset, embeddings, reducer
+
+
+def test_save_and_load_round_trip(tmp_path):
+    dataset, embeddings, reducer = _state()
+    manifest = Workspace(str(tmp_path)).save(dataset, embeddings, models={"reducer": reducer})
+
+    state = Workspace(str(tmp_path)).load()
+
+    assert state["manifest"]["fingerprint"] == manifest["fingerprint"]
+    pd.testing.assert_frame_equal(state["dataset"], dataset)
+    assert state["embeddings"].fields == ["input_embedding", "output_embedding"]
+    loaded = state["embeddings"].get("input_embedding")
+    assert np.array_equal(loaded, embeddings.get("input_embedding"))
+    assert np.allclose(state["models"]["reducer"].transform(loaded), reducer.transform(loaded))
+
+
+def test_edits_after_load_do_not_touch_files(tmp_path):
+    dataset, embeddings, _ = _state()
+    Workspace(str(tmp_path)).save(dataset, embeddings)
+    saved = np.load(os.path.join(tmp_path, "input_embedding.npy"))
+
+    state = Workspace(str(tmp_path)).load()
+    state["embeddings"].update_rows("input_embedding", [0], np.zeros((1, 16), dtype=np.float32))
+
+    assert np.array_equal(np.load(os.path.join(tmp_path, "input_embedding.npy")), saved)
+
+
+def test_fingerprint_changes_with_content(tmp_path):
+    dataset, embeddings, _ = _state()
+    first = Workspace(str(tmp_path / "first")).save(dataset, embeddings)
+    dataset.loc[3, "output"] = "edited answer"
+    second = Workspace(str(tmp_path / "second")).save(dataset, embeddings)
+
+    assert first["fingerprint"] != second["fingerprint"]
+
+
+def test_rejects_missing_and_unknown_versions(tmp_path):
+    with pytest.raises(WorkspaceError):
+        Workspace(str(tmp_path)).load()
+
+    dataset, embeddings, _ = _state()
+    Workspace(str(tmp_path)).save(dataset, embeddings)
+    manifest_path = os.path.join(tmp_path, Workspace.MANIFEST)
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    manifest["version"] = 99
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    with pytest.raises(WorkspaceError):
+        Workspace(str(tmp_path)).load()
+
+
+def test_client_paths_stay_in_root(tmp_path):
+    root = tmp_path / "workspaces"
+    root.mkdir()
+    (root / "escape").symlink_to(tmp_path)
+
+    assert Workspace.in_root(str(root), "alpaca").path == str(root.resolve() / "alpaca")
+    for path in ("../outside", "/etc", "escape/outside", "", "."):
+        with pytest.raises(WorkspaceError):
+            Workspace.in_root(str(root), path)
+    with pytest.raises(WorkspaceError):
+        Workspace.in_root(None, "alpaca")
@@ -0,0 +1,38 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import subprocess
+import sys
+
+
+def _loaded_modules(statement: str) -> set:
+    probe = f"import sys\n{statement}\nprint(' '.join(sys.modules))"
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    return set(output.split())
+
+
+def test_package_import_is_light():
+    modules = _loaded_modules("import spagbol, spagbol.embedding, spagbol.reduction, spagbol.clustering")
+    for heavy in ["torch", "transformers", "umap", "sklearn", "datasets", "weaviate"]:
+        assert heavy not in modules
+
+
+def test_lazy_export_resolves_to_class():
+    modules = _loaded_modules(
+        "from spagbol.clustering.GaussianMixtureClustering import GaussianMixtureClustering as direct\n"
+        "from spagbol.clustering import GaussianMixtureClustering\n"
+        "assert GaussianMixtureClustering is direct"
+    )
+    assert "sklearn" in modules
+
+
+def test_embedder_defers_model_loading():
+    modules = _loaded_modules("from spagbol.embedding import AllMiniLMEmbedder\nAllMiniLMEmbedder()")
+    assert "transformers.models.bert.modeling_bert" not in modules
@@ -0,0 +1,354 @@
+"""
+Copyright 2024 Spaghetti team
+
+This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import hashlib
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spagbol import Spagbol
+from spagbol.clustering import ClusteringModel
+from spagbol.embedding import Embedder
+from spagbol.reduction import DimensionalityReduction
+from spagbol.errors import DataPointNotFoundError
+
+
+class HashEmbedder(Embedder):
+    """
+    Embedder with deterministic pseudo-random vectors derived from the text hash
+    """
+
+    def __init__(self, dim=8):
+        self.dim = dim
+
+    def _init_model(self):
+        return None
+
+    def _init_tokenizer(self):
+        return None
+
+    def embed(self, data: str) -> np.array:
+        return self.embed_batch([data])
+
+    def embed_batch(self, data: list[str]) -> np.array:
+        seeds = [int.from_bytes(hashlib.blake2b(text.encode(), digest_size=4).digest(), "little") for text in data]
+        return np.array([np.random.default_rng(seed).random(self.dim) for seed in seeds], dtype=np.float32)
+
+
+class CountingReduction(DimensionalityReduction):
+    """
+    Keeps the first two dimensions and counts fits
+    """
+
+    def __init__(self):
+        self.fits = 0
+
+    def fit(self, data):
+        self.fits += 1
+
+    def fit_transform(self, data):
+        self.fit(data)
+        return self.transform(data)
+
+    def transform(self, data):
+        return np.asarray(data)[:, :2] * 10
+
+
+class ThresholdClustering(ClusteringModel):
+    """
+    Labels rows by their first dimension and counts fits, warm refits and predicted rows
+    """
+
+    def __init__(self):
+        self.fits = self.refits = self.predicted_rows = 0
+
+    def _init_model(self):
+        return None
+
+    def fit(self, data):
+        self.fits += 1
+
+    def fit_predict(self, data):
+        self.fit(data)
+        return (np.asarray(data)[:, 0] > 0.5).astype(np.int64)
+
+    def refit_predict(self, data):
+        self.refits += 1
+        return (np.asarray(data)[:, 0] > 0.5).astype(np.int64)
+
+    def predict(self, data):
+        self.predicted_rows += len(data)
+        return (np.asarray(data)[:, 0] > 0.5).astype(np.int64)
+
+
+def _spagbol(rows=20, clustering_model=None, **kwargs):
+    spagbol = Spagbol(None, HashEmbedder(), clustering_model, CountingReduction(), **kwargs)
+    spagbol.dataset = pd.DataFrame({"input": [f"input {i}" for i in range(rows)],
+                                    "output": [f"output {i}" for i in range(rows)]})
+    spagbol._build_row_index()
+    spagbol.create_embeddings()
+    spagbol.reduce_dimensions()
+    return spagbol
+
+
+def _fits(spagbol):
+    return sum(reducer.fits for reducer in spagbol.reducers.values())
+
+
+def test_reducers_are_fit_per_field():
+    spagbol = _spagbol()
+    assert set(spagbol.reducers) == {"input_embedding", "output_embedding"}
+    assert spagbol.reducers["input_embedding"] is not spagbol.reducers["output_embedding"]
+    assert _fits(spagbol) == 2
+
+
+def test_concurrent_reduction_matches_sequential():
+    columns = ["instruction_x", "instruction_y", "output_x", "output_y"]
+    sequential = _spagbol(reduction_workers=1).dataset[columns]
+    concurrent = _spagbol(reduction_workers=2).dataset[columns]
+    assert np.allclose(sequential.to_numpy(dtype=float), concurrent.to_numpy(dtype=float))
+
+
+def test_reducers_are_fit_concurrently():
+    # Each fit waits for the other one, so the fits only finish when they overlap
+    barrier = threading.Barrier(2, timeout=10)
+
+    class BarrierReduction(CountingReduction):
+        def fit(self, data):
+            barrier.wait()
+            super().fit(data)
+
+    spagbol = Spagbol(None, HashEmbedder(), None, BarrierReduction(), reduction_workers=2)
+    spagbol.dataset = pd.DataFrame({"input": ["a", "b", "c"], "output": ["d", "e", "f"]})
+    spagbol._build_row_index()
+    spagbol.create_embeddings()
+    spagbol.reduce_dimensions()
+    assert set(spagbol.reducers) == {"input_embedding", "output_embedding"}
+    assert not barrier.broken
+
+
+def test_edit_places_row_without_refit():
+    spagbol = _spagbol()
+    spagbol.edit_data_point({"id": 3, "input": "changed input", "output": "changed output"})
+
+    expected = HashEmbedder().embed("changed input")[0, :2] * 10
+    assert _fits(spagbol) == 2
+    assert np.allclose(spagbol.dataset.loc[3, ["instruction_x", "instruction_y"]].to_numpy(dtype=float), expected)
+
+
+def test_import_places_new_rows():
+    spagbol = _spagbol()
+    ids = spagbol.import_data([{"input": "new input", "output": "new output"}])
+
+    position = spagbol.row_index.position(int(ids[0]))
+    assert _fits(spagbol) == 2
+    assert not spagbol.dataset.loc[position, ["instruction_x", "output_y"]].isna().any()
+
+
+def test_refit_after_drift_threshold():
+    spagbol = _spagbol(rows=20, refit_ratio=0.1)
+    fitted = dict(spagbol.reducers)
+    spagbol.batch_update_data_points([{"id": i, "input": f"new {i}", "output": f"new {i}"} for i in range(2)])
+    assert spagbol.reducers == fitted
+    spagbol.edit_data_point({"id": 5, "input": "new 5", "output": "new 5"})
+    assert all(spagbol.reducers[field] is not fitted[field] for field in fitted)
+
+
+def test_deleted_rows_are_compacted_with_coordinates():
+    spagbol = _spagbol(rows=10, compaction_ratio=0.1)
+    coordinates = spagbol.dataset.set_index("id")["output_x"]
+    spagbol.delete_data_point(2)
+    spagbol.delete_data_point(7)
+
+    assert len(spagbol.dataset) == 8
+    assert len(spagbol.embeddings) == 8
+    assert list(spagbol.embeddings.ids) == list(spagbol.dataset["id"])
+    assert spagbol.dataset.set_index("id")["output_x"].equals(coordinates.drop([2, 7]))
+    with pytest.raises(DataPointNotFoundError):
+        spagbol.edit_data_point({"id": 2, "input": "", "output": ""})
+
+
+def test_clustering_labels_only_changed_rows():
+    spagbol = _spagbol(rows=20, clustering_model=ThresholdClustering())
+    labels = spagbol.apply_clustering()
+    clusterer = spagbol.clusterers["input_embedding"]
+    assert clusterer is not spagbol.clustering_model
+    assert list(spagbol.dataset["input_embedding_cluster"]) == list(labels)
+
+    spagbol.edit_data_point({"id": 3, "input": "changed input", "output": "changed output"})
+    ids = spagbol.import_data([{"input": "new input", "output": "new output"}])
+    labels = spagbol.apply_clustering()
+
+    assert (clusterer.fits, clusterer.refits, clusterer.predicted_rows) == (1, 0, 2)
+    assert len(labels) == 21
+    new_label = int(HashEmbedder().embed("new input")[0, 0] > 0.5)
+    assert labels[spagbol.row_index.position(int(ids[0]))] == new_label
+
+
+def test_clustering_is_warm_refit_after_recluster_ratio():
+    spagbol = _spagbol(rows=20, clustering_model=ThresholdClustering(), recluster_ratio=0.1)
+    spagbol.apply_clustering()
+    clusterer = spagbol.clusterers["input_embedding"]
+    spagbol.batch_update_data_points([{"id": i, "input": f"new {i}", "output": f"new {i}"} for i in range(3)])
+    spagbol.apply_clustering()
+
+    assert (clusterer.fits, clusterer.refits, clusterer.predicted_rows) == (1, 1, 0)
+    spagbol.apply_clustering(refit=True)
+    assert clusterer.refits == 2
+
+
+def test_clustering_state_is_saved_in_workspace(tmp_path):
+    spagbol = _spagbol(rows=20, clustering_model=ThresholdClustering())
+    labels = spagbol.apply_clustering()
+    spagbol.edit_data_point({"id": 3, "input": "changed input", "output": "changed output"})
+    spagbol.save_workspace(str(tmp_path))
+
+    restored = Spagbol(None, HashEmbedder(), ThresholdClustering(), CountingReduction())
+    restored.open_workspace(str(tmp_path))
+    assert list(restored.dataset["input_embedding_cluster"]) == list(labels)
+    restored.apply_clustering()
+    assert restored.clusterers["input_embedding"].predicted_rows == 1
+
+
+def test_cluster_summaries_are_computed_with_clustering():
+    spagbol = _spagbol(rows=20, clustering_model=ThresholdClustering())
+    labels = spagbol.apply_clustering()
+    summaries = spagbol.get_cluster_summaries()
+
+    assert [cluster["size"] for cluster in summaries["clusters"]] == list(np.bincount(labels))
+    member = summaries["clusters"][0]["members"][0]
+    assert member["id"] == summaries["clusters"][0]["medoid"]
+    assert member["input"] == spagbol.dataset.set_index("id").loc[member["id"], "input"]
+    assert len(summaries["clusters"][0]["centroid_2d"]) == 2
+
+
+def test_cluster_summaries_follow_edits():
+    spagbol = _spagbol(rows=20, clustering_model=ThresholdClustering())
+    spagbol.apply_clustering()
+    deleted = spagbol.get_cluster_summaries()["clusters"][0]["medoid"]
+    spagbol.delete_data_point(deleted)
+
+    summaries = spagbol.get_cluster_summaries()
+    assert sum(cluster["size"] for cluster in summaries["clusters"]) == 19
+    member_ids = [member["id"] for cluster in summaries["clusters"] for member in cluster["members"]]
+    assert deleted not in member_ids
+    assert deleted not in [cluster["medoid"] for cluster in summaries["clusters"]]
+
+
+def test_knn_cache_dir_is_shared_with_the_reducer(tmp_path):
+    reducer = CountingReduction()
+    reducer.knn_cache_dir = None
+    reducer.share_knn = False
+    Spagbol(None, HashEmbedder(), ThresholdClustering(), reducer, knn_cache_dir=str(tmp_path))
+    assert reducer.knn_cache_dir == str(tmp_path) and reducer.share_knn
+
+
+def test_payloads_carry_ids():
+    spagbol = _spagbol(rows=5)
+    spagbol.delete_data_point(2)
+    assert [item["id"] for item in json.loads(spagbol.to_json())] == [0, 1, 3, 4]
+    assert {item["id"] for item in spagbol.get_data_points({})} == {0, 1, 3, 4}
+
+
+def test_deletes_resolve_text_ids_and_apply_whole_batches():
+    spagbol = _spagbol(rows=20)
+    spagbol.delete_data_point("3")
+    assert 3 not in spagbol.row_index
+
+    spagbol.batch_delete_data_points([5, "5", 6])
+    assert 5 not in spagbol.row_index and 6 not in spagbol.row_index
+    with pytest.raises(DataPointNotFoundError):
+        spagbol.batch_delete_data_points([7, 99])
+    assert 7 in spagbol.row_index
+
+
+def test_rows_imported_before_reduction_have_null_coordinates():
+    spagbol = Spagbol(None, HashEmbedder(), None, CountingReduction())
+    spagbol.dataset = pd.DataFrame({"input": ["a", "b"], "output": ["c", "d"]})
+    spagbol._build_row_index()
+    spagbol.create_embeddings()
+    spagbol.import_data([{"input": "e", "output": "f"}])
+
+    def reject(constant):
+        raise ValueError(f"{constant} is not valid JSON")
+
+    items = json.loads(spagbol.to_json(), parse_constant=reject)
+    assert [item["instruction_x"] for item in items] == [None, None, None]
+
+    spagbol.reduce_dimensions()
+    spagbol.import_data([{"input": "g", "output": "h"}])
+    items = json.loads(spagbol.to_json(), parse_constant=reject)
+    assert all(isinstance(item["output_y"], float) for item in items)
+
+
+def test_find_similarities_ranks_ids():
+    spagbol = _spagbol(rows=20)
+    result = spagbol.find_similarities("input 4", k=3)
+    assert result["ids"][0] == 4
+    assert result["scores"] == sorted(result["scores"], reverse=True)
+
+    neighbours = spagbol.find_similarities(data_point_id=4, k=3)
+    assert len(neighbours["ids"]) == 3 and 4 not in neighbours["ids"]
+    assert len(spagbol.find_similarities(["input 1", "input 2"], k=2)) == 2
+
+    engine = spagbol._search_engines["input_embedding"]
+    spagbol.edit_data_point({"id": 4, "input": "changed input", "output": "changed output"})
+    assert spagbol.find_similarities("changed input", k=1)["ids"] == [4]
+    new_id = spagbol.add_data_point({"input": "added input", "output": "added output"})
+    assert spagbol.find_similarities("added input", k=1)["ids"] == [new_id]
+    # The engine is updated in place instead of being rebuilt
+    assert spagbol._search_engines["input_embedding"] is engine
+
+
+def test_find_similarities_validates_ids_and_fields():
+    spagbol = _spagbol(rows=20)
+    neighbours = spagbol.find_similarities(data_point_id="4", k=3)
+    assert len(neighbours["ids"]) == 3 and 4 not in neighbours["ids"]
+    with pytest.raises(ValueError):
+        spagbol.find_similarities("input 4", field="instruction_embedding")
+    with pytest.raises(DataPointNotFoundError):
+        spagbol.find_similarities(data_point_id="not an id")
+
+
+def test_small_edits_accumulate_towards_recluster_ratio():
+    spagbol = _spagbol(rows=20, clustering_model=ThresholdClustering(), recluster_ratio=0.2)
+    spagbol.apply_clustering()
+    clusterer = spagbol.clusterers["input_embedding"]
+    # Every round stays below the ratio on its own, the fifth edit since the fit crosses 0.2 * 20 rows
+    for round_ in range(4):
+        spagbol.edit_data_point({"id": round_, "input": f"edit {round_}", "output": f"edit {round_}"})
+        spagbol.apply_clustering()
+    assert (clusterer.refits, clusterer.predicted_rows) == (0, 4)
+
+    spagbol.edit_data_point({"id": 4, "input": "edit 4", "output": "edit 4"})
+    spagbol.apply_clustering()
+    assert (clusterer.refits, clusterer.predicted_rows) == (1, 4)
+
+    spagbol.edit_data_point({"id": 5, "input": "edit 5", "output": "edit 5"})
+    spagbol.apply_clustering()
+    assert (clusterer.refits, clusterer.predicted_rows) == (1, 5)
+
+
+def test_load_and_embed_streams_chunks(tmp_path):
+    source = tmp_path / "alpaca.jsonl"
+    source.write_text("".join(json.dumps({"instruction": f"instruction {i}", "input": f"input {i}",
+                                          "output": f"output {i}"}) + "\n" for i in range(7)))
+    streamed = Spagbol(None, HashEmbedder(), None, CountingReduction())
+    streamed.load_and_embed(str(source), chunk_size=3)
+    loaded = Spagbol(None, HashEmbedder(), None, CountingReduction())
+    loaded.load_data(str(source))
+    loaded.create_embeddings()
+
+    pd.testing.assert_frame_equal(streamed.dataset, loaded.dataset)
+    assert list(streamed.embeddings.ids) == list(range(7))
+    for field in ("input_embedding", "output_embedding"):
+        assert np.array_equal(streamed.embeddings.get(field), loaded.embeddings.get(field))